@@ -0,0 +1,387 @@
+import argparse
+import importlib.util
+import json
+import math
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+repo_dir_path = os.path.dirname(__file__)
+sys.path.append(repo_dir_path)
+
+try:
+    import bpy
+except ImportError:
+    # Plain Python, where only the blend mode kernels are measured.
+    bpy = None
+import numpy as np
+import OpenImageIO as oiio
+
+if bpy:
+    import image_editor_3d
+    from image_editor_3d import export, properties
+
+
+# Usage:
+#   blender -b --factory-startup --python benchmark.py -- --output result.json
+#   blender -b --factory-startup --python benchmark.py -- --output result.json --baseline baseline.json
+#   python benchmark.py --output result.json
+
+def load_numpy_module(name):
+    # Loads a module of the add-on which depends only on NumPy without the
+    # package, whose __init__ needs Blender.
+    spec = importlib.util.spec_from_file_location(f"ie3_{name}", os.path.join(repo_dir_path, "image_editor_3d", f"{name}.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+blending = load_numpy_module("blending")
+
+def parse_int_list(s):
+    return [int(i) for i in s.split(",") if i]
+
+def create_arg_parser():
+    parser = argparse.ArgumentParser(prog="benchmark.py", description="Benchmark Image Editor 3D with synthetic scenes.")
+    parser.add_argument("--output", default="", help="JSON result file path")
+    parser.add_argument("--baseline", default="", help="JSON result file path to compare with")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Relative slowdown reported as a regression")
+    parser.add_argument("--repeat", type=int, default=3, help="Number of repetitions of each measurement")
+    parser.add_argument("--faces", type=parse_int_list, default=[1000, 100000], help="Comma separated UV layout face counts")
+    parser.add_argument("--tiles", type=int, default=4, help="UDIM tile count")
+    parser.add_argument("--layers", type=int, default=100, help="Image layer count")
+    parser.add_argument("--maps", type=int, default=4, help="Maps per layer")
+    parser.add_argument("--resolution", type=int, default=1024, choices=properties.RESOLUTIONS if bpy else None, help="Export resolution")
+    parser.add_argument("--source-resolution", type=int, default=256, help="Resolution of the generated source maps")
+    parser.add_argument("--selections", type=parse_int_list, default=[10, 100, 1000], help="Comma separated selected vertex counts for the snap operators")
+    parser.add_argument("--blend-resolutions", type=parse_int_list, default=[4096, 8192], help="Comma separated tile resolutions for the blend mode kernels")
+    parser.add_argument("--skip-export", action="store_true", help="Skip the full export benchmark")
+    return parser
+
+def get_script_argv():
+    if "--" in sys.argv:
+        return sys.argv[sys.argv.index("--") + 1:]
+    if not bpy:
+        return sys.argv[1:]
+    return []
+
+def measure(func, repeat, setup=None):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start_time = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start_time)
+
+    result = {
+        "min_time": min(times),
+        "median_time": statistics.median(times),
+        "max_time": max(times),
+    }
+    return result
+
+STARTUP_SCRIPT = """
+import json
+import sys
+import time
+
+sys.path.append({repo_dir_path!r})
+module_names = set(sys.modules)
+
+start_time = time.perf_counter()
+import image_editor_3d
+import_time = time.perf_counter() - start_time
+
+start_time = time.perf_counter()
+image_editor_3d.register()
+register_time = time.perf_counter() - start_time
+
+heavy_module_names = [n for n in ["numpy", "OpenImageIO"] if (n in sys.modules) and (not n in module_names)]
+print("IE3_STARTUP " + json.dumps({{"import_time": import_time, "register_time": register_time, "heavy_module_names": heavy_module_names}}))
+"""
+
+def measure_startup(repeat):
+    # Every repetition runs in a new Blender process so that nothing is
+    # imported beforehand.
+    startup_results = []
+    script = STARTUP_SCRIPT.format(repo_dir_path=repo_dir_path)
+    for _ in range(repeat):
+        command = [bpy.app.binary_path, "-b", "--factory-startup", "--python-expr", script]
+        output = subprocess.run(command, stdout=subprocess.PIPE, text=True).stdout
+        for line in output.splitlines():
+            if line.startswith("IE3_STARTUP "):
+                startup_results.append(json.loads(line[len("IE3_STARTUP "):]))
+    if not startup_results:
+        return {}
+
+    results = {}
+    for name in ["import_time", "register_time"]:
+        times = [r[name] for r in startup_results]
+        results[f"startup/{name[:-len('_time')]}"] = {
+            "min_time": min(times),
+            "median_time": statistics.median(times),
+            "max_time": max(times),
+        }
+    heavy_module_names = sorted(set(sum([r["heavy_module_names"] for r in startup_results], [])))
+    if heavy_module_names:
+        print(f"Modules loaded at startup: {', '.join(heavy_module_names)}")
+    return results
+
+BLEND_STRIP_HEIGHT = 256
+
+def measure_blend_kernels(resolutions, repeat):
+    # A full tile is blended strip by strip like the compositor does, so 8K
+    # tiles do not need gigabytes of buffers.
+    results = {}
+    rng = np.random.default_rng(0)
+    for resolution in resolutions:
+        pixel_count = resolution * min(resolution, BLEND_STRIP_HEIGHT)
+        strip_count = max(1, resolution // BLEND_STRIP_HEIGHT)
+        src_dst = rng.random((pixel_count, 4), np.float32)
+        colors = rng.random((pixel_count, 3), np.float32)
+        alphas = rng.random((pixel_count, 1), np.float32)
+        dst = np.empty_like(src_dst)
+        for blend_mode in blending.KERNELS:
+            def blend_tile():
+                for _ in range(strip_count):
+                    blending.blend(dst, colors, alphas, blend_mode)
+
+            results[f"blend/{blend_mode}/resolution={resolution}"] = measure(blend_tile, repeat, setup=lambda: np.copyto(dst, src_dst))
+    return results
+
+def get_context_override():
+    window = bpy.context.window_manager.windows[0]
+    return bpy.context.temp_override(window=window, scene=window.scene, view_layer=window.scene.view_layers[0])
+
+def reset_file():
+    window = bpy.context.window_manager.windows[0]
+    old_scenes = list(bpy.data.scenes)
+    window.scene = bpy.data.scenes.new("Benchmark")
+    for old_scene in old_scenes:
+        bpy.data.scenes.remove(old_scene)
+    bpy.data.orphans_purge(do_recursive=True)
+
+def create_uv_mesh_obj(face_count, uv_tile_count):
+    n = max(1, math.ceil(math.sqrt(face_count / uv_tile_count)))
+    grid = np.linspace(0.01, 0.99, n + 1)
+    gx, gy = np.meshgrid(grid, grid)
+    tile_coords = np.stack([gx.ravel(), gy.ravel()], axis=1)
+
+    i, j = np.meshgrid(np.arange(n), np.arange(n), indexing="ij")
+    v = (i * (n + 1) + j).ravel()
+    tile_faces = np.stack([v, v + 1, v + n + 2, v + n + 1], axis=1)
+
+    coords = []
+    faces = []
+    for t in range(uv_tile_count):
+        offset = np.array([t % 10, t // 10], np.float64)
+        coords.append(tile_coords + offset)
+        faces.append(tile_faces + t * len(tile_coords))
+    coords = np.concatenate(coords)
+    faces = np.concatenate(faces)
+
+    verts = np.zeros((len(coords), 3), np.float64)
+    verts[:, :2] = coords
+
+    mesh = bpy.data.meshes.new("Synthetic")
+    mesh.from_pydata(verts.tolist(), [], faces.tolist())
+    uv_layer = mesh.uv_layers.new()
+    loop_vert_indices = np.zeros(len(mesh.loops), np.int32)
+    mesh.loops.foreach_get("vertex_index", loop_vert_indices)
+    uv_layer.data.foreach_set("uv", coords[loop_vert_indices].astype(np.float32).ravel())
+
+    obj = bpy.data.objects.new("Synthetic", mesh)
+    bpy.context.scene.collection.objects.link(obj)
+    bpy.context.view_layer.objects.active = obj
+    return obj
+
+def start_editing(face_count, uv_tile_count):
+    reset_file()
+    with get_context_override():
+        create_uv_mesh_obj(face_count, uv_tile_count)
+        bpy.ops.scene.start_editing()
+
+def create_source_maps(directory, layer_count, map_count, resolution):
+    pixels = np.random.default_rng(0).random((resolution, resolution, 4), np.float32)
+    pixels[:, :, 3] = 1.0
+    spec = oiio.ImageSpec(resolution, resolution, 4, "uint8")
+    for layer_index in range(layer_count):
+        for map_index in range(map_count):
+            file_path = os.path.join(directory, f"layer{layer_index}_map{map_index}.png")
+            output = oiio.ImageOutput.create(file_path)
+            output.open(file_path, spec)
+            output.write_image(pixels)
+            output.close()
+
+def set_up_maps(ie3, map_count):
+    ie3.map_file_name = "Benchmark"
+    ie3.basic_map_count = map_count
+    for i, basic_map_data in enumerate(ie3.get_current_basic_map_data_list()):
+        basic_map_data.file_name_keywords = f"_map{i}"
+        basic_map_data.color_depth = "8"
+
+def set_up_selection(obj, selection_size):
+    import bmesh
+
+    k = max(1, math.ceil(math.sqrt(selection_size)) - 1)
+    bm = bmesh.new()
+    bmesh.ops.create_grid(bm, x_segments=k, y_segments=k, size=0.45)
+    for i, vert in enumerate(bm.verts):
+        vert.select = i < selection_size
+    bm.to_mesh(obj.data)
+    bm.free()
+
+def run_benchmarks(args, temp_dir_path):
+    results = measure_startup(args.repeat)
+    results.update(measure_blend_kernels(args.blend_resolutions, args.repeat))
+
+    for face_count in args.faces:
+        results[f"start_editing/faces={face_count}"] = measure(
+            lambda: start_editing(face_count, args.tiles),
+            args.repeat
+        )
+
+    source_dir_path = os.path.join(temp_dir_path, "sources")
+    os.makedirs(source_dir_path, exist_ok=True)
+    create_source_maps(source_dir_path, args.layers, args.maps, args.source_resolution)
+
+    start_editing(args.faces[0], args.tiles)
+
+    with get_context_override():
+        scene = bpy.context.scene
+        ie3 = scene.ie3
+        set_up_maps(ie3, args.maps)
+
+        def import_layers():
+            bpy.ops.object.import_image_objs(directory=source_dir_path)
+
+        def remove_layers():
+            for obj in properties.find_objs_with_type(properties.ObjType.Layer):
+                if properties.get_layer_obj_type(obj) != properties.LayerObjType.Overlay:
+                    bpy.data.objects.remove(obj)
+
+        results[f"import_layers/layers={args.layers}"] = measure(import_layers, args.repeat, setup=remove_layers)
+
+        results["create_image_layer"] = measure(lambda: bpy.ops.object.create_image_obj(), args.repeat)
+        results["create_basic_layer"] = measure(lambda: bpy.ops.object.create_basic_layer_obj(), args.repeat)
+        results["move_layer_top"] = measure(lambda: bpy.ops.object.move_layer_obj(target="Top"), args.repeat)
+        results["move_layer_bottom"] = measure(lambda: bpy.ops.object.move_layer_obj(target="Bottom"), args.repeat)
+
+        image_objs = properties.find_layer_objs_with_type(properties.LayerObjType.Image)
+
+        def activate_image_layer():
+            bpy.context.view_layer.objects.active = image_objs[0]
+
+        results["duplicate_layer"] = measure(lambda: bpy.ops.object.duplicate_layer_obj(), args.repeat, setup=activate_image_layer)
+        results["duplicate_layer_as_instance"] = measure(lambda: bpy.ops.object.duplicate_layer_obj(b_as_instance=True), args.repeat, setup=activate_image_layer)
+
+        activate_image_layer()
+        ie3.b_is_initializing_image_obj_properties = False
+
+        def update_opacity():
+            for i in range(100):
+                ie3.opacity = (i % 10) / 10.0
+
+        result = measure(update_opacity, args.repeat)
+        results["property_update_latency"] = {k: v / 100.0 for k, v in result.items()}
+
+        snap_obj = properties.BasicLayerObjWrapper.create_obj()
+        scene.collection.objects.link(snap_obj)
+        snap_obj.location = properties.uv_tile_coord_to_location([0, 0])
+        bpy.context.view_layer.objects.active = snap_obj
+
+        snap_operators = [
+            ("snap_vert_to_closest_uv_vert", lambda: bpy.ops.mesh.snap_vert_to_closest_uv_vert()),
+            ("snap_vert_to_uv_edge", lambda: bpy.ops.mesh.snap_vert_to_uv_edge(direction="XPlus")),
+            ("snap_vert_to_closest_uv_edge", lambda: bpy.ops.mesh.snap_vert_to_closest_uv_edge()),
+        ]
+        for selection_size in args.selections:
+            for name, func in snap_operators:
+                def setup():
+                    bpy.ops.object.mode_set(mode="OBJECT")
+                    set_up_selection(snap_obj, selection_size)
+                    bpy.ops.object.mode_set(mode="EDIT")
+                results[f"{name}/selection={selection_size}"] = measure(func, args.repeat, setup=setup)
+        bpy.ops.object.mode_set(mode="OBJECT")
+
+        if not args.skip_export:
+            export_dir_path = os.path.join(temp_dir_path, "export")
+            os.makedirs(export_dir_path, exist_ok=True)
+            scene.render.engine = "CYCLES"
+            scene.cycles.device = "CPU"
+            scene.cycles.samples = 1
+
+            def export_maps():
+                map_exporter = export.MapExporter(scene, export_dir_path, resolution=args.resolution)
+                map_exporter.export()
+
+            results[f"export/tiles={args.tiles},maps={args.maps},resolution={args.resolution}"] = measure(export_maps, args.repeat)
+
+    return results
+
+def compare_results(results, baseline_results, threshold):
+    regressions = []
+    for name, result in results.items():
+        if not name in baseline_results:
+            print(f"{name}: {result['median_time'] * 1000.0:.2f} ms (new)")
+            continue
+
+        baseline_time = baseline_results[name]["median_time"]
+        ratio = result["median_time"] / baseline_time if baseline_time > 0.0 else 1.0
+        b_is_regression = ratio > 1.0 + threshold
+        mark = " REGRESSION" if b_is_regression else ""
+        print(f"{name}: {result['median_time'] * 1000.0:.2f} ms ({ratio:.2f}x baseline){mark}")
+        if b_is_regression:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = create_arg_parser()
+    args = parser.parse_args(get_script_argv())
+
+    if bpy:
+        image_editor_3d.register()
+
+        with tempfile.TemporaryDirectory() as temp_dir_path:
+            results = run_benchmarks(args, temp_dir_path)
+    else:
+        results = measure_blend_kernels(args.blend_resolutions, args.repeat)
+
+    d = {
+        "blender_version": bpy.app.version_string if bpy else "",
+        "params": {
+            "faces": args.faces,
+            "tiles": args.tiles,
+            "layers": args.layers,
+            "maps": args.maps,
+            "resolution": args.resolution,
+            "source_resolution": args.source_resolution,
+            "selections": args.selections,
+            "blend_resolutions": args.blend_resolutions,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as file:
+            json.dump(d, file, indent=4)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as file:
+            baseline = json.load(file)
+        regressions = compare_results(results, baseline["results"], args.threshold)
+        if regressions:
+            exit_code = 1
+    else:
+        for name, result in results.items():
+            print(f"{name}: {result['median_time'] * 1000.0:.2f} ms")
+
+    sys.stdout.flush()
+    sys.exit(exit_code)
+
+main()
@@ -7,10 +7,46 @@ sys.path.append(repo_dir_path)
 import importlib
 import image_editor_3d.error as error
 importlib.reload(error)
+import image_editor_3d.profiling as profiling
+importlib.reload(profiling)
 import image_editor_3d.dobj as dobj
 importlib.reload(dobj)
+import image_editor_3d.layertypes as layertypes
+importlib.reload(layertypes)
+import image_editor_3d.geometry as geometry
+importlib.reload(geometry)
+import image_editor_3d.imaging as imaging
+importlib.reload(imaging)
+import image_editor_3d.snapping as snapping
+importlib.reload(snapping)
+import image_editor_3d.blending as blending
+importlib.reload(blending)
+import image_editor_3d.procedural as procedural
+importlib.reload(procedural)
+import image_editor_3d.compositor as compositor
+importlib.reload(compositor)
 import image_editor_3d.properties as properties
 importlib.reload(properties)
+import image_editor_3d.txcache as txcache
+importlib.reload(txcache)
+import image_editor_3d.imagestore as imagestore
+importlib.reload(imagestore)
+import image_editor_3d.snapshot as snapshot
+importlib.reload(snapshot)
+import image_editor_3d.preview as preview
+importlib.reload(preview)
+import image_editor_3d.packing as packing
+importlib.reload(packing)
+import image_editor_3d.atlas as atlas
+importlib.reload(atlas)
+import image_editor_3d.watcher as watcher
+importlib.reload(watcher)
+import image_editor_3d.export as export
+importlib.reload(export)
+import image_editor_3d.cli as cli
+importlib.reload(cli)
+import image_editor_3d.jobs as jobs
+importlib.reload(jobs)
 import image_editor_3d.operators as operators
 importlib.reload(operators)
 import image_editor_3d.panels as panels
@@ -1,18 +1,40 @@
 import bpy
 
-from . import operators, panels, properties
+from . import imagestore, operators, panels, profiling, properties, watcher
 
 
 clss = properties.clss + operators.clss + panels.clss
 
 def register():
     global clss
+    profiling.instrument_operator_classes(operators.clss)
     for cls in clss:
         bpy.utils.register_class(cls)
     bpy.types.Scene.ie3 = bpy.props.PointerProperty(type=properties.SceneData, name="Image Editor 3D")
+    for handlers in [bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post]:
+        handlers.append(properties.invalidate_map_list_models_handler)
+    bpy.app.handlers.save_post.append(imagestore.record_references_handler)
+    bpy.app.handlers.load_post.append(properties.migrate_legacy_data_handler)
+    bpy.app.handlers.load_post.append(properties.resolve_generated_images_handler)
+    bpy.app.handlers.load_post.append(watcher.watch_source_maps_handler)
+    bpy.app.timers.register(properties.migrate_legacy_data_timer, first_interval=0.0)
     print("The addon \"Image Editor 3D\" registered.")
 
 def unregister():
+    watcher.stop_watching()
+    if watcher.watch_source_maps_handler in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(watcher.watch_source_maps_handler)
+    if imagestore.record_references_handler in bpy.app.handlers.save_post:
+        bpy.app.handlers.save_post.remove(imagestore.record_references_handler)
+    if bpy.app.timers.is_registered(properties.migrate_legacy_data_timer):
+        bpy.app.timers.unregister(properties.migrate_legacy_data_timer)
+    if properties.migrate_legacy_data_handler in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(properties.migrate_legacy_data_handler)
+    if properties.resolve_generated_images_handler in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(properties.resolve_generated_images_handler)
+    for handlers in [bpy.app.handlers.load_post, bpy.app.handlers.undo_post, bpy.app.handlers.redo_post]:
+        if properties.invalidate_map_list_models_handler in handlers:
+            handlers.remove(properties.invalidate_map_list_models_handler)
     del bpy.types.Scene.ie3
     global clss
     for cls in clss:
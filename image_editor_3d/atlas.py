@@ -0,0 +1,303 @@
+import hashlib
+import json
+import os
+
+import bpy
+import numpy as np
+import OpenImageIO as oiio
+
+from . import dobj, imagestore, packing, profiling, properties
+
+
+# Atlases of small image layer maps for the viewport and the Render backend.
+#
+# Layers whose maps are small 8 bit images share atlas pages instead of an
+# image per map, so the viewport binds a few textures and the Render backend
+# opens a few files. A layer occupies the same rectangle in every image of a
+# page, which has an image per map and colorspace, so the single mapping of
+# the layer addresses all of its maps. Rectangles are placed by a skyline
+# packer and padded with the wrapped source, as the maps repeat.
+#
+# The packing is kept on the scene. Building again only packs new layers and
+# writes the rectangles whose sources changed. Exports by the compositor read
+# the maps themselves, so atlases never change exported pixels.
+
+ATLAS_PADDING = 4
+
+class AtlasEntry(dobj.Dobj):
+    def __init__(self):
+        # Name of the layer material, shared by instances.
+        self.name = ""
+        # Padded rectangle in pixels from the top left.
+        self.rect = [0, 0, 0, 0]
+        self.signature = ""
+
+    def to_dict(self):
+        d = {
+            "name": self.name,
+            "rect": self.rect,
+            "signature": self.signature,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.name = d["name"]
+        instance.rect = d["rect"]
+        instance.signature = d["signature"]
+        return instance
+
+class AtlasPage(dobj.Dobj):
+    def __init__(self):
+        self.skyline = []
+        self.entries = []
+        # "map internal name|colorspace" -> image store file path.
+        self.files = {}
+
+    def to_dict(self):
+        d = {
+            "skyline": self.skyline,
+            "entries": dobj.dobjs_to_dicts(self.entries),
+            "files": self.files,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.skyline = d["skyline"]
+        instance.entries = dobj.dicts_to_dobjs(d["entries"], AtlasEntry)
+        instance.files = d["files"]
+        return instance
+
+class AtlasState(dobj.Dobj):
+    def __init__(self):
+        self.size = 0
+        self.pages = []
+
+    def to_dict(self):
+        d = {
+            "size": self.size,
+            "pages": dobj.dobjs_to_dicts(self.pages),
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.size = d["size"]
+        instance.pages = dobj.dicts_to_dobjs(d["pages"], AtlasPage)
+        return instance
+
+class AtlasSource(object):
+    def __init__(self):
+        super(AtlasSource, self).__init__()
+        self.width = 0
+        self.height = 0
+        # (map internal name, colorspace, file path) per map.
+        self.maps = []
+        self.signature = ""
+
+def create_file_key(map_internal_name, colorspace):
+    return f"{map_internal_name}|{colorspace}"
+
+def read_atlas_state(scene):
+    s = scene.get(properties.ATLAS_STATE_KEY)
+    if not s:
+        return None
+    return AtlasState.from_dict(json.loads(s))
+
+def write_atlas_state(scene, state):
+    scene[properties.ATLAS_STATE_KEY] = json.dumps(state.to_dict())
+
+def find_atlas_source(image_obj_wrapper, max_source_size):
+    # Returns the source of a layer whose maps can be packed, i.e. 8 bit
+    # files of the same size within max_source_size, or None.
+    source = AtlasSource()
+    hasher = hashlib.sha1()
+    for map_internal_name, image in sorted(image_obj_wrapper.get_maps().items()):
+        if image.packed_file:
+            return None
+        file_path = bpy.path.abspath(properties.get_image_source_file_path(image), library=image.library)
+        if not os.path.isfile(file_path):
+            return None
+        image_input = oiio.ImageInput.open(file_path)
+        if not image_input:
+            return None
+        spec = image_input.spec()
+        image_input.close()
+        if spec.format.basetype != oiio.UINT8:
+            return None
+        if not source.maps:
+            source.width = spec.width
+            source.height = spec.height
+        elif (spec.width, spec.height) != (source.width, source.height):
+            return None
+        if max(spec.width, spec.height) > max_source_size:
+            return None
+
+        colorspace = image.colorspace_settings.name
+        source.maps.append((map_internal_name, colorspace, file_path))
+        st = os.stat(file_path)
+        hasher.update(f"{map_internal_name}|{colorspace}|{file_path}|{st.st_size}|{st.st_mtime_ns}\n".encode("utf-8"))
+    if not source.maps:
+        return None
+    source.signature = hasher.hexdigest()
+    return source
+
+def read_rgba8(file_path):
+    from . import compositor
+
+    config = oiio.ImageSpec()
+    config.attribute("oiio:UnassociatedAlpha", 1)
+    image_buf = oiio.ImageBuf(file_path, 0, 0, config)
+    pixels = image_buf.get_pixels(oiio.FLOAT)
+    if (pixels is None) or (pixels.size == 0):
+        raise RuntimeError(f"Failed to read \"{file_path}\": {image_buf.geterror()}")
+    pixels = compositor.to_rgba(pixels.reshape(image_buf.spec().height, image_buf.spec().width, -1))
+    return np.rint(np.clip(pixels, 0.0, 1.0) * 255.0).astype(np.uint8)
+
+def write_rgba8(file_path, pixels):
+    spec = oiio.ImageSpec(pixels.shape[1], pixels.shape[0], 4, "uint8")
+    spec.attribute("oiio:UnassociatedAlpha", 1)
+    output = oiio.ImageOutput.create(file_path)
+    if not output:
+        raise RuntimeError(f"Failed to create \"{file_path}\": {oiio.geterror()}")
+    if not output.open(file_path, spec):
+        raise RuntimeError(f"Failed to open \"{file_path}\": {output.geterror()}")
+    try:
+        if not output.write_image(pixels):
+            raise RuntimeError(f"Failed to write \"{file_path}\": {output.geterror()}")
+    finally:
+        output.close()
+
+def write_page(state, page, entries, sources):
+    # Writes the rectangles of entries into the images of the page.
+    file_keys = set()
+    for entry in entries:
+        for map_internal_name, colorspace, _ in sources[entry.name].maps:
+            file_keys.add(create_file_key(map_internal_name, colorspace))
+
+    for file_key in sorted(file_keys):
+        file_path = page.files.get(file_key)
+        if file_path and os.path.isfile(file_path):
+            pixels = read_rgba8(file_path)
+        else:
+            pixels = np.zeros((state.size, state.size, 4), np.uint8)
+
+        for entry in entries:
+            for map_internal_name, colorspace, source_file_path in sources[entry.name].maps:
+                if create_file_key(map_internal_name, colorspace) != file_key:
+                    continue
+                x, y, width, height = entry.rect
+                source_pixels = read_rgba8(source_file_path)
+                pixels[y:y + height, x:x + width] = np.pad(source_pixels, ((ATLAS_PADDING, ATLAS_PADDING), (ATLAS_PADDING, ATLAS_PADDING), (0, 0)), mode="wrap")
+
+        temp_file_path = os.path.join(properties.get_user_dir_path(), "atlas.png")
+        write_rgba8(temp_file_path, pixels)
+        page.files[file_key] = imagestore.add_file(temp_file_path, b_move=True)
+
+def build_atlas(scene, b_repack=False):
+    # Packs the layers of the scene into atlases and binds them. Returns the
+    # packed layer count and the atlas image count.
+    ie3 = scene.ie3
+    size = int(ie3.atlas_size)
+
+    state = None
+    if not b_repack:
+        state = read_atlas_state(scene)
+    if (state is None) or (state.size != size):
+        state = AtlasState()
+        state.size = size
+
+    image_objs = [o for o in properties.find_objs_with_type(properties.ObjType.Layer, scene) if properties.get_layer_obj_type(o) == properties.LayerObjType.Image]
+    image_obj_wrappers = {}
+    for image_obj_wrapper in properties.create_image_obj_wrappers(image_objs):
+        image_obj_wrappers[image_obj_wrapper.obj.data.materials[0].name] = image_obj_wrapper
+
+    sources = {}
+    with profiling.span("atlas.find_sources"):
+        for name, image_obj_wrapper in image_obj_wrappers.items():
+            source = find_atlas_source(image_obj_wrapper, ie3.atlas_max_source_size)
+            if (source is None) or (max(source.width, source.height) + ATLAS_PADDING * 2 > size):
+                image_obj_wrapper.clear_atlas()
+                continue
+            sources[name] = source
+
+    # Entries of removed or resized layers are dropped, and their area is
+    # reclaimed only by packing again. Entries whose sources changed, or
+    # whose images are missing from the image store, are written again.
+    dirty_entries = {}
+    for page_index, page in enumerate(state.pages):
+        kept_entries = []
+        for entry in page.entries:
+            source = sources.get(entry.name)
+            if (source is None) or (entry.rect[2:] != [source.width + ATLAS_PADDING * 2, source.height + ATLAS_PADDING * 2]):
+                continue
+            file_paths = [page.files.get(create_file_key(m, c)) for m, c, _ in source.maps]
+            if (entry.signature != source.signature) or (not all(p and os.path.isfile(p) for p in file_paths)):
+                entry.signature = source.signature
+                dirty_entries.setdefault(page_index, []).append(entry)
+            kept_entries.append(entry)
+        page.entries = kept_entries
+    packed_names = {e.name for page in state.pages for e in page.entries}
+
+    # New layers are packed from the tallest.
+    new_names = sorted([n for n in sources if not n in packed_names], key=lambda n: (-sources[n].height, -sources[n].width, n))
+    for name in new_names:
+        source = sources[name]
+        width = source.width + ATLAS_PADDING * 2
+        height = source.height + ATLAS_PADDING * 2
+        position = None
+        for page_index, page in enumerate(state.pages):
+            position = packing.SkylinePacker(size, page.skyline).pack(width, height)
+            if position is not None:
+                break
+        if position is None:
+            page = AtlasPage()
+            page.skyline = [[0, 0, size]]
+            state.pages.append(page)
+            page_index = len(state.pages) - 1
+            position = packing.SkylinePacker(size, page.skyline).pack(width, height)
+
+        entry = AtlasEntry()
+        entry.name = name
+        entry.rect = [position[0], position[1], width, height]
+        entry.signature = source.signature
+        page.entries.append(entry)
+        dirty_entries.setdefault(page_index, []).append(entry)
+
+    with profiling.span("atlas.write_pages"):
+        for page_index, entries in dirty_entries.items():
+            write_page(state, state.pages[page_index], entries, sources)
+
+    atlas_images = set()
+    for page in state.pages:
+        for entry in page.entries:
+            atlas_maps = {}
+            for map_internal_name, colorspace, _ in sources[entry.name].maps:
+                image = imagestore.load_image(page.files[create_file_key(map_internal_name, colorspace)])
+                if image.colorspace_settings.name != colorspace:
+                    image.colorspace_settings.name = colorspace
+                atlas_maps[map_internal_name] = image
+                atlas_images.add(image.name)
+
+            x, y, width, height = entry.rect
+            location = ((x + ATLAS_PADDING) / size, (size - y - height + ATLAS_PADDING) / size)
+            scale = ((width - ATLAS_PADDING * 2) / size, (height - ATLAS_PADDING * 2) / size)
+            image_obj_wrapper = image_obj_wrappers[entry.name]
+            image_obj_wrapper.set_atlas(location, scale, atlas_maps)
+            image_obj_wrapper.switch_map(ie3.display_map_name)
+
+    write_atlas_state(scene, state)
+
+    return len(sources), len(atlas_images)
+
+def clear_atlas(scene):
+    image_objs = [o for o in properties.find_objs_with_type(properties.ObjType.Layer, scene) if properties.get_layer_obj_type(o) == properties.LayerObjType.Image]
+    for image_obj_wrapper in properties.create_image_obj_wrappers(image_objs):
+        image_obj_wrapper.clear_atlas()
+        image_obj_wrapper.switch_map(scene.ie3.display_map_name)
+    if properties.ATLAS_STATE_KEY in scene:
+        del scene[properties.ATLAS_STATE_KEY]
@@ -0,0 +1,137 @@
+import numpy as np
+
+
+# Blend mode kernels of the compositor. This module depends only on NumPy.
+#
+# Layers are blended in linear float RGBA with premultiplied destinations,
+# following the separable blend modes of the W3C compositing spec: the
+# source color is mixed with the blend result by the destination alpha and
+# then composited with source-over. Pixels are processed in chunks and the
+# kernels write into preallocated chunk buffers, so temporaries are bounded
+# by the chunk size, not by the buffer size.
+
+MAX_CHUNK_PIXEL_COUNT = 2 ** 16
+EPSILON = 1.0e-8
+
+# Each kernel computes B(cb, cs) into out. cb is the straight destination
+# color, cs the source color, tmp a buffer of the same shape and mask a bool
+# buffer of the same shape.
+
+def multiply(cb, cs, out, tmp, mask):
+    np.multiply(cb, cs, out=out)
+
+def screen(cb, cs, out, tmp, mask):
+    # cb + cs - cb * cs
+    np.multiply(cb, cs, out=out)
+    np.subtract(cs, out, out=out)
+    np.add(out, cb, out=out)
+
+def hard_light(cb, cs, out, tmp, mask):
+    # 2 * cb * cs if cs <= 0.5, screen(cb, 2 * cs - 1) otherwise
+    np.multiply(cs, 2.0, out=tmp)
+    np.subtract(tmp, 1.0, out=tmp)
+    # screen(cb, tmp) = tmp * (1 - cb) + cb
+    np.subtract(1.0, cb, out=out)
+    np.multiply(out, tmp, out=out)
+    np.add(out, cb, out=out)
+    np.add(tmp, 1.0, out=tmp)
+    np.multiply(tmp, cb, out=tmp)
+    np.less_equal(cs, 0.5, out=mask)
+    np.copyto(out, tmp, where=mask)
+
+def overlay(cb, cs, out, tmp, mask):
+    hard_light(cs, cb, out, tmp, mask)
+
+def soft_light(cb, cs, out, tmp, mask):
+    # cb - (1 - 2 * cs) * cb * (1 - cb) if cs <= 0.5,
+    # cb + (2 * cs - 1) * (D(cb) - cb) otherwise
+    np.clip(cb, 0.0, None, out=tmp)
+    # D(cb) = ((16 * cb - 12) * cb + 4) * cb if cb <= 0.25, sqrt(cb) otherwise
+    np.multiply(tmp, 16.0, out=out)
+    np.subtract(out, 12.0, out=out)
+    np.multiply(out, tmp, out=out)
+    np.add(out, 4.0, out=out)
+    np.multiply(out, tmp, out=out)
+    np.greater(tmp, 0.25, out=mask)
+    np.sqrt(tmp, out=out, where=mask)
+    np.subtract(out, cb, out=out)
+    np.subtract(1.0, cb, out=tmp)
+    np.multiply(tmp, cb, out=tmp)
+    np.greater(cs, 0.5, out=mask)
+    np.copyto(tmp, out, where=mask)
+    np.multiply(cs, 2.0, out=out)
+    np.subtract(out, 1.0, out=out)
+    np.multiply(out, tmp, out=out)
+    np.add(out, cb, out=out)
+
+def add(cb, cs, out, tmp, mask):
+    np.add(cb, cs, out=out)
+
+def subtract(cb, cs, out, tmp, mask):
+    np.subtract(cb, cs, out=out)
+    np.maximum(out, 0.0, out=out)
+
+def darken(cb, cs, out, tmp, mask):
+    np.minimum(cb, cs, out=out)
+
+def lighten(cb, cs, out, tmp, mask):
+    np.maximum(cb, cs, out=out)
+
+def difference(cb, cs, out, tmp, mask):
+    np.subtract(cb, cs, out=out)
+    np.absolute(out, out=out)
+
+# Blend mode name -> kernel. Normal is plain source-over.
+KERNELS = {
+    "Normal": None,
+    "Multiply": multiply,
+    "Screen": screen,
+    "Overlay": overlay,
+    "SoftLight": soft_light,
+    "HardLight": hard_light,
+    "Add": add,
+    "Subtract": subtract,
+    "Darken": darken,
+    "Lighten": lighten,
+    "Difference": difference,
+}
+
+def blend_chunk(dst, colors, alphas, kernel, cb, out, tmp, mask):
+    dst_colors = dst[:, :3]
+    dst_alphas = dst[:, 3:]
+
+    if kernel is not None:
+        # Mixes the source with the blend result where the destination is
+        # opaque: cs' = cs + ab * (B(cb, cs) - cs).
+        np.maximum(dst_alphas, EPSILON, out=out[:, :1])
+        np.divide(dst_colors, out[:, :1], out=cb)
+        kernel(cb, colors, out, tmp, mask)
+        np.subtract(out, colors, out=out)
+        np.multiply(out, dst_alphas, out=out)
+        np.add(out, colors, out=out)
+    else:
+        np.copyto(out, colors)
+
+    # Source-over onto the premultiplied destination.
+    np.subtract(1.0, alphas, out=tmp[:, :1])
+    np.multiply(dst_colors, tmp[:, :1], out=dst_colors)
+    np.multiply(out, alphas, out=out)
+    np.add(dst_colors, out, out=dst_colors)
+    np.multiply(dst_alphas, tmp[:, :1], out=dst_alphas)
+    np.add(dst_alphas, alphas, out=dst_alphas)
+
+def blend(dst, colors, alphas, blend_mode):
+    # dst is (N, 4) linear premultiplied RGBA and updated in place. colors is
+    # (N, 3) linear straight RGB and alphas is (N, 1).
+    if len(dst) == 0:
+        return
+    kernel = KERNELS[blend_mode]
+    chunk_pixel_count = min(len(dst), MAX_CHUNK_PIXEL_COUNT)
+    cb = np.empty((chunk_pixel_count, 3), dst.dtype)
+    out = np.empty((chunk_pixel_count, 3), dst.dtype)
+    tmp = np.empty((chunk_pixel_count, 3), dst.dtype)
+    mask = np.empty((chunk_pixel_count, 3), bool)
+    for start in range(0, len(dst), chunk_pixel_count):
+        end = min(len(dst), start + chunk_pixel_count)
+        n = end - start
+        blend_chunk(dst[start:end], colors[start:end], alphas[start:end], kernel, cb[:n], out[:n], tmp[:n], mask[:n])
@@ -0,0 +1,216 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import bpy
+
+from . import dobj, error, export, properties
+
+
+# Usage:
+#   blender -b asset.blend --python-expr "import importlib; importlib.import_module('bl_ext.user_default.image_editor_3d.cli').main()" -- --output out
+#
+# Exit codes:
+#   0: every map was exported
+#   1: the export failed for at least one map
+#   2: invalid arguments or scene
+
+EXIT_SUCCESS = 0
+EXIT_FAILURE = 1
+EXIT_USAGE = 2
+
+def create_arg_parser():
+    parser = argparse.ArgumentParser(prog="image_editor_3d.cli", description="Export maps of an Image Editor 3D scene.")
+    parser.add_argument("--scene", default="", help="Name of the editor scene (default: the first editor scene)")
+    parser.add_argument("--settings", default="", help="Scene setting group JSON to apply before exporting")
+    parser.add_argument("--output", required=True, help="Output directory")
+    parser.add_argument("--tiles", default="", help="Comma separated UDIM tile numbers (default: all tiles)")
+    parser.add_argument("--maps", default="", help="Comma separated map internal or display names (default: all current maps)")
+    parser.add_argument("--resolution", type=int, default=0, choices=[0] + properties.RESOLUTIONS, help="Output resolution (default: scene resolution)")
+    parser.add_argument("--backend", default="", choices=[""] + [b.name for b in properties.ExportBackend], help="Export backend (default: scene export backend)")
+    parser.add_argument("--memory-budget", type=int, default=0, help="Working memory of the compositor in MB (default: scene memory budget)")
+    parser.add_argument("--workers", type=int, default=1, help="Number of Blender processes exporting in parallel")
+    parser.add_argument("--report", default="", help="JSON report file path")
+    parser.add_argument("--resume", action="store_true", help="Skip maps recorded in the manifests of the output directory")
+    parser.add_argument("--manifest-tag", default="main", help=argparse.SUPPRESS)
+    return parser
+
+def get_script_argv():
+    if "--" in sys.argv:
+        return sys.argv[sys.argv.index("--") + 1:]
+    return []
+
+def find_editor_scene(scene_name):
+    for scene in bpy.data.scenes:
+        if not scene.ie3.b_is_editor_scene:
+            continue
+        if (not scene_name) or (scene.name == scene_name):
+            return scene
+    return None
+
+def find_map_internal_names(ie3, map_names):
+    map_internal_names = []
+    for map_name in map_names:
+        for basic_map_data in ie3.get_basic_map_data_list():
+            if map_name in [basic_map_data.internal_name, basic_map_data.get_display_name()]:
+                map_internal_names.append(basic_map_data.internal_name)
+                break
+        else:
+            return None, error.Error(f"The map \"{map_name}\" does not exist.")
+    return map_internal_names, None
+
+def find_uv_tile_nums(ie3, tiles):
+    scene_uv_tile_nums = [d.num for d in ie3.uv_tile_data_list]
+    uv_tile_nums = []
+    for tile in tiles:
+        try:
+            uv_tile_num = int(tile)
+        except ValueError:
+            return None, error.Error(f"Invalid tile number \"{tile}\".")
+        if not uv_tile_num in scene_uv_tile_nums:
+            return None, error.Error(f"The tile {uv_tile_num} does not exist.")
+        uv_tile_nums.append(uv_tile_num)
+    return uv_tile_nums, None
+
+def split_list(l, count):
+    chunks = [l[i::count] for i in range(count)]
+    return [c for c in chunks if c]
+
+def export_with_workers(args, uv_tile_nums, report):
+    if not bpy.data.filepath:
+        report.errors.append("The blend file must be saved to export with multiple workers.")
+        report.b_is_succeeded = False
+        return
+
+    module_name = __name__
+    python_expr = f"import importlib; importlib.import_module('{module_name}').main()"
+
+    processes = []
+    with tempfile.TemporaryDirectory() as temp_dir_path:
+        for i, chunk in enumerate(split_list(uv_tile_nums, args.workers)):
+            worker_report_file_path = os.path.join(temp_dir_path, f"report_{i}.json")
+            worker_argv = [
+                "--scene", report.scene_name,
+                "--output", args.output,
+                "--tiles", ",".join([str(n) for n in chunk]),
+                "--workers", "1",
+                "--report", worker_report_file_path,
+                "--manifest-tag", f"{args.manifest_tag}_{i}",
+            ]
+            if args.resume:
+                worker_argv += ["--resume"]
+            if args.settings:
+                worker_argv += ["--settings", args.settings]
+            if args.maps:
+                worker_argv += ["--maps", args.maps]
+            if args.resolution:
+                worker_argv += ["--resolution", str(args.resolution)]
+            if args.backend:
+                worker_argv += ["--backend", args.backend]
+            if args.memory_budget:
+                worker_argv += ["--memory-budget", str(args.memory_budget)]
+
+            command = [bpy.app.binary_path, "-b", bpy.data.filepath, "--python-expr", python_expr, "--"] + worker_argv
+            process = subprocess.Popen(command, stdout=subprocess.DEVNULL)
+            processes.append((process, worker_report_file_path))
+
+        for process, worker_report_file_path in processes:
+            return_code = process.wait()
+
+            worker_report, e = dobj.read_dobj(worker_report_file_path, export.ExportReport)
+            if e:
+                report.errors.append(f"A worker exited with code {return_code} without writing a report.")
+                report.b_is_succeeded = False
+                continue
+
+            report.exported_files += worker_report.exported_files
+            report.skipped_file_paths += worker_report.skipped_file_paths
+            report.unchanged_file_paths += worker_report.unchanged_file_paths
+            report.errors += worker_report.errors
+            report.b_is_succeeded = report.b_is_succeeded and worker_report.b_is_succeeded and (return_code == EXIT_SUCCESS)
+
+def run(args):
+    start_time = time.perf_counter()
+
+    report = export.ExportReport()
+    report.blend_file_path = bpy.data.filepath
+    report.directory = os.path.abspath(args.output)
+
+    scene = find_editor_scene(args.scene)
+    if not scene:
+        report.errors.append("No editor scene was found.")
+        report.b_is_succeeded = False
+        return report, EXIT_USAGE
+    report.scene_name = scene.name
+    ie3 = scene.ie3
+
+    with bpy.context.temp_override(scene=scene):
+        if args.settings:
+            scene_setting_group, e = dobj.read_dobj(args.settings, properties.SceneSettingGroup)
+            if e:
+                report.errors.append(str(e))
+                report.b_is_succeeded = False
+                return report, EXIT_USAGE
+            ie3.apply_scene_setting_group(scene_setting_group)
+
+        if args.backend:
+            ie3.export_backend = args.backend
+        if args.memory_budget:
+            ie3.compositor_memory_budget = args.memory_budget
+
+        uv_tile_nums = [d.num for d in ie3.uv_tile_data_list]
+        if args.tiles:
+            uv_tile_nums, e = find_uv_tile_nums(ie3, args.tiles.split(","))
+            if e:
+                report.errors.append(str(e))
+                report.b_is_succeeded = False
+                return report, EXIT_USAGE
+
+        map_internal_names = None
+        if args.maps:
+            map_internal_names, e = find_map_internal_names(ie3, args.maps.split(","))
+            if e:
+                report.errors.append(str(e))
+                report.b_is_succeeded = False
+                return report, EXIT_USAGE
+
+        if not ie3.map_file_name:
+            report.errors.append("The scene has no map file name.")
+            report.b_is_succeeded = False
+            return report, EXIT_USAGE
+
+        os.makedirs(report.directory, exist_ok=True)
+
+        if (args.workers > 1) and (len(uv_tile_nums) > 1):
+            export_with_workers(args, uv_tile_nums, report)
+        else:
+            map_exporter = export.MapExporter(scene, report.directory, uv_tile_nums, map_internal_names, args.resolution, b_resume=args.resume, manifest_tag=args.manifest_tag)
+            map_exporter.export(report)
+
+    report.elapsed_time = time.perf_counter() - start_time
+    exit_code = EXIT_SUCCESS if report.b_is_succeeded else EXIT_FAILURE
+    return report, exit_code
+
+def main(argv=None):
+    if argv is None:
+        argv = get_script_argv()
+
+    parser = create_arg_parser()
+    args = parser.parse_args(argv)
+
+    report, exit_code = run(args)
+
+    if args.report:
+        e = dobj.write_dobj(report, args.report)
+        if e:
+            print(str(e), file=sys.stderr)
+            exit_code = EXIT_FAILURE
+    else:
+        print(json.dumps(report.to_dict(), indent=4))
+
+    sys.stdout.flush()
+    sys.exit(exit_code)
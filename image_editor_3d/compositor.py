@@ -0,0 +1,605 @@
+import collections
+import hashlib
+import os
+
+import numpy as np
+import OpenImageIO as oiio
+
+from . import blending, procedural
+
+
+# CPU compositor exporting a UDIM tile without rendering. Output rows are
+# processed in strips sized by a memory budget and written scanline by
+# scanline, and sources are read through an ImageCache with a size limit,
+# so peak memory does not grow with the resolution. Quantized tiles are
+# hashed before they are encoded, so that unchanged tiles are not written.
+# Tiles can also be composited in memory without writing files.
+#
+# Layers are composited the same way as the image layer material: the basic
+# map is emitted, the opacity map alpha (or its grayscale) times the opacity
+# and the instance opacity is the alpha, and the UVs pass through the
+# mapping node. Layers are blended with their blend mode by the blending
+# kernels. Pixels are sampled at their centers without antialiasing.
+# Mip-mapped sources (e.g. the texture cache) are sampled at the level whose
+# texels best match the pixel footprint of each triangle.
+#
+# Basic layers fill their mesh polygons with a constant color per map. The
+# outline edges of the polygons are rasterized per strip with an even-odd
+# scanline fill, without triangulation or sampling.
+#
+# Layer groups are flattened onto a transparent strip, so blend modes inside
+# a group only see the layers of the group, and the result is composited
+# with the group opacity. Procedural sources are evaluated at the output
+# pixels instead of being sampled. Flattened strips and procedural samples
+# are kept in a pixel cache keyed by their content, so unchanged groups and
+# procedural layers are not computed again by later exports.
+#
+# This module does not depend on Blender. Layers are described with plain
+# arrays by the exporter.
+
+# Working memory per output pixel: the RGBA accumulation buffer plus the
+# temporaries of a triangle covering the whole strip.
+BYTES_PER_PIXEL = 256
+MAX_SOURCE_REGION_PIXEL_COUNT = 2 ** 22
+LUMINANCE_COEFFICIENTS = np.array([0.2126, 0.7152, 0.0722], np.float32)
+
+COLOR_DEPTH_FORMATS = {
+    "8": "uint8",
+    "16": "uint16",
+}
+
+def srgb_to_linear(c):
+    return np.where(c <= 0.04045, c / 12.92, ((np.maximum(c, 0.0) + 0.055) / 1.055) ** 2.4)
+
+def linear_to_srgb(c):
+    return np.where(c <= 0.0031308, c * 12.92, 1.055 * np.maximum(c, 0.0) ** (1.0 / 2.4) - 0.055)
+
+def create_pixel_hasher(width, height, channel_count, dtype):
+    # Hash of quantized pixels, rows from the top. The shape and format are
+    # part of the hash.
+    pixel_hasher = hashlib.sha1(f"{width}x{height}x{channel_count}:{np.dtype(dtype).name}".encode("utf-8"))
+    return pixel_hasher
+
+def to_rgba(pixels):
+    channel_count = pixels.shape[-1]
+    if channel_count == 1:
+        return np.concatenate([pixels, pixels, pixels, np.ones_like(pixels)], axis=-1)
+    if channel_count == 2:
+        return np.concatenate([pixels[..., :1], pixels[..., :1], pixels[..., :1], pixels[..., 1:2]], axis=-1)
+    if channel_count == 3:
+        return np.concatenate([pixels, np.ones_like(pixels[..., :1])], axis=-1)
+    return pixels[..., :4]
+
+class ImageSource(object):
+    # Either a file read through the image cache or pixels held in memory,
+    # e.g. packed images. Pixels are (height, width, 4) with the first row
+    # at the top, the same as files.
+    def __init__(self, file_path="", pixels=None, b_is_srgb=True):
+        super(ImageSource, self).__init__()
+        self.file_path = file_path
+        self.pixels = pixels
+        self.b_is_srgb = b_is_srgb
+        # Identifies the content, computed on use.
+        self.key = ""
+
+class ProceduralSource(object):
+    # Pixels evaluated from the parameters of a procedural layer.
+    def __init__(self, params=None):
+        super(ProceduralSource, self).__init__()
+        self.params = params or {}
+        # Identifies the content, computed on use.
+        self.key = ""
+
+class Layer(object):
+    def __init__(self):
+        super(Layer, self).__init__()
+        # (T, 3, 2) world XY coords and (T, 3, 2) UVs of the triangles.
+        self.triangle_coords = np.zeros((0, 3, 2), np.float64)
+        self.triangle_uvs = np.zeros((0, 3, 2), np.float64)
+        # (2, 3) affine transform of the mapping node in UV space.
+        self.mapping_matrix = np.array([[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]], np.float64)
+        self.basic_map_source = None
+        self.opacity_map_source = None
+        self.b_use_grayscale_as_opacity = False
+        self.opacity = 1.0
+        self.blend_mode = "Normal"
+
+class BasicLayer(object):
+    def __init__(self):
+        super(BasicLayer, self).__init__()
+        # (E, 2, 2) world XY coords of the outline edges of the polygons.
+        self.edge_coords = np.zeros((0, 2, 2), np.float64)
+        # Linear RGB.
+        self.color = np.zeros(3, np.float32)
+        self.opacity = 1.0
+
+class LayerGroup(object):
+    def __init__(self):
+        super(LayerGroup, self).__init__()
+        # Layers and groups from the bottom.
+        self.layers = []
+        self.opacity = 1.0
+        # Identifies the content, computed on use.
+        self.key = ""
+
+# Flattened strip of a group without any pixel, cached without its size.
+EMPTY_STRIP = np.zeros((0, 0, 4), np.float32)
+
+class PixelCache(object):
+    # Arrays of flattened group strips and procedural samples within
+    # max_size bytes. The least recently used arrays are removed first.
+    def __init__(self, max_size):
+        super(PixelCache, self).__init__()
+        self.max_size = max_size
+        self.size = 0
+        self.__arrays = collections.OrderedDict()
+
+    def get(self, key):
+        a = self.__arrays.get(key)
+        if a is not None:
+            self.__arrays.move_to_end(key)
+        return a
+
+    def put(self, key, a):
+        if a.nbytes > self.max_size:
+            return
+        old_a = self.__arrays.pop(key, None)
+        if old_a is not None:
+            self.size -= old_a.nbytes
+        self.__arrays[key] = a
+        self.size += a.nbytes
+        while self.size > self.max_size:
+            _, removed_a = self.__arrays.popitem(last=False)
+            self.size -= removed_a.nbytes
+
+    def clear(self):
+        self.__arrays.clear()
+        self.size = 0
+
+def get_source_key(source):
+    if not source.key:
+        if isinstance(source, ProceduralSource):
+            source.key = f"procedural:{procedural.create_params_hash(source.params)}"
+            return source.key
+        if source.pixels is not None:
+            hasher = hashlib.sha1(np.ascontiguousarray(source.pixels))
+            hasher.update(str(source.pixels.shape).encode("utf-8"))
+            source.key = hasher.hexdigest()
+        else:
+            st = os.stat(source.file_path)
+            source.key = f"{os.path.abspath(source.file_path)}:{st.st_size}:{st.st_mtime_ns}"
+        source.key += f":{source.b_is_srgb}"
+    return source.key
+
+def get_layer_geometry_key(layer):
+    hasher = hashlib.sha1()
+    for a in [layer.triangle_coords, layer.triangle_uvs, layer.mapping_matrix]:
+        hasher.update(np.ascontiguousarray(a, np.float64))
+    return hasher.hexdigest()
+
+def get_layer_key(layer):
+    if isinstance(layer, LayerGroup):
+        return get_group_key(layer)
+    if isinstance(layer, BasicLayer):
+        hasher = hashlib.sha1(np.ascontiguousarray(layer.edge_coords, np.float64))
+        hasher.update(np.ascontiguousarray(layer.color, np.float32))
+        hasher.update(repr(layer.opacity).encode("utf-8"))
+        return hasher.hexdigest()
+
+    hasher = hashlib.sha1(get_layer_geometry_key(layer).encode("utf-8"))
+    s = f"{get_source_key(layer.basic_map_source)}|{get_source_key(layer.opacity_map_source)}|{layer.b_use_grayscale_as_opacity}|{layer.opacity!r}|{layer.blend_mode}"
+    hasher.update(s.encode("utf-8"))
+    return hasher.hexdigest()
+
+def get_group_key(group):
+    if not group.key:
+        hasher = hashlib.sha1(b"group")
+        for layer in group.layers:
+            hasher.update(get_layer_key(layer).encode("utf-8"))
+            if isinstance(layer, LayerGroup):
+                hasher.update(repr(layer.opacity).encode("utf-8"))
+        group.key = hasher.hexdigest()
+    return group.key
+
+def create_outline_edges(coords, loop_vert_indices, loop_totals):
+    # Returns the (E, 2, 2) edges of the polygons given by their vert indices
+    # per loop and loop counts, coords being (V, 2). Edges shared by two
+    # polygons are removed, as they would cancel out in the even-odd fill
+    # anyway.
+    loop_vert_indices = np.asarray(loop_vert_indices, np.int64)
+    loop_totals = np.asarray(loop_totals, np.int64)
+    if len(loop_vert_indices) == 0:
+        return np.zeros((0, 2, 2), np.float64)
+    loop_starts = np.cumsum(loop_totals) - loop_totals
+    next_loop_indices = np.arange(1, len(loop_vert_indices) + 1)
+    next_loop_indices[loop_starts + loop_totals - 1] = loop_starts
+    edge_vert_indices = np.stack([loop_vert_indices, loop_vert_indices[next_loop_indices]], axis=1)
+
+    edge_vert_indices, counts = np.unique(np.sort(edge_vert_indices, axis=1), axis=0, return_counts=True)
+    edge_vert_indices = edge_vert_indices[counts % 2 == 1]
+    return np.asarray(coords, np.float64)[edge_vert_indices]
+
+def fill_even_odd(edges, width, height):
+    # Returns the (height, width) mask of the pixels whose centers are inside
+    # the edges by the even-odd rule. edges is (E, 2, 2) in pixel coords with
+    # the pixel centers at integer coords. Every edge toggles the pixels from
+    # its crossing of a row to the end of the row, which is a parity of a
+    # cumulative sum over the crossings.
+    mask = np.zeros((height, width), bool)
+    if len(edges) == 0:
+        return mask
+    x0 = edges[:, 0, 0]
+    y0 = edges[:, 0, 1]
+    x1 = edges[:, 1, 0]
+    y1 = edges[:, 1, 1]
+    # Rows crossed by an edge, half open so that verts are not counted twice.
+    row_begins = np.clip(np.ceil(np.minimum(y0, y1)), 0, height).astype(np.int64)
+    row_ends = np.clip(np.ceil(np.maximum(y0, y1)), 0, height).astype(np.int64)
+    row_counts = row_ends - row_begins
+    crossing_count = int(row_counts.sum())
+    if crossing_count == 0:
+        return mask
+
+    edge_indices = np.repeat(np.arange(len(edges)), row_counts)
+    rows = np.arange(crossing_count) - np.repeat(np.cumsum(row_counts) - row_counts, row_counts) + row_begins[edge_indices]
+    slopes = (x1 - x0) / np.where(y1 != y0, y1 - y0, 1.0)
+    xs = x0[edge_indices] + (rows - y0[edge_indices]) * slopes[edge_indices]
+    columns = np.clip(np.ceil(xs), 0, width).astype(np.int64)
+
+    toggles = np.bincount(rows * (width + 1) + columns, minlength=height * (width + 1)).reshape(height, width + 1)
+    np.cumsum(toggles[:, :width], axis=1, out=toggles[:, :width])
+    np.bitwise_and(toggles[:, :width], 1, out=toggles[:, :width])
+    mask[:] = toggles[:, :width]
+    return mask
+
+def evaluate_edge_function(ax, ay, bx, by, x, y):
+    # Returns the doubled signed area of (a, b, (x, y)). The verts are
+    # ordered before evaluating, so that swapping a and b exactly negates
+    # the result and the two triangles sharing an edge agree on it.
+    if (ax, ay) > (bx, by):
+        return -evaluate_edge_function(bx, by, ax, ay, x, y)
+    return (bx - ax) * (y - ay) - (by - ay) * (x - ax)
+
+def is_top_left_edge(ax, ay, bx, by, area):
+    # Pixel centers on an edge shared by two triangles belong to the one
+    # the edge is a top or left edge of (rows from the top), so that they
+    # are composited exactly once. The inward normal of a left edge points
+    # to the right and that of a top edge points down.
+    nx = -(by - ay) * np.sign(area)
+    ny = (bx - ax) * np.sign(area)
+    return (nx > 0.0) or ((nx == 0.0) and (ny > 0.0))
+
+def group_layers(entries):
+    # entries are (groups, layer) from the bottom, groups being the groups
+    # containing the layer from the outermost. A group is stacked where its
+    # first layer is. Returns the top level layers and groups.
+    layers = []
+    placed_group_ids = set()
+    for groups, layer in entries:
+        parent_layers = layers
+        for group in groups:
+            if not id(group) in placed_group_ids:
+                parent_layers.append(group)
+                placed_group_ids.add(id(group))
+            parent_layers = group.layers
+        parent_layers.append(layer)
+    return layers
+
+class Compositor(object):
+    def __init__(self, memory_budget, cache_size, pixel_cache=None):
+        super(Compositor, self).__init__()
+        self.memory_budget = memory_budget
+        self.pixel_cache = pixel_cache
+        self.__cache = oiio.ImageCache(shared=False)
+        self.__cache.attribute("max_memory_MB", float(max(1, cache_size // (1024 ** 2))))
+        # Untiled files such as PNG are split into tiles in the cache so that
+        # only the regions in use stay resident.
+        self.__cache.attribute("autotile", 64)
+        self.__cache.attribute("autoscanline", 0)
+        # Sources are straight alpha, the same as in Blender.
+        self.__cache.attribute("unassociatedalpha", 1)
+        self.__mip_sizes = {}
+
+    def close(self):
+        # An unshared cache is freed with its last reference.
+        self.__cache = None
+
+    def invalidate(self, file_path):
+        self.__cache.invalidate(file_path)
+        self.__mip_sizes.pop(file_path, None)
+
+    def get_mip_sizes(self, source):
+        if source.pixels is not None:
+            return [(source.pixels.shape[1], source.pixels.shape[0])]
+
+        mip_sizes = self.__mip_sizes.get(source.file_path)
+        if mip_sizes is None:
+            # The cache reports the first level for missing levels, so the
+            # levels are counted from the file header.
+            mip_sizes = []
+            image_input = oiio.ImageInput.open(source.file_path)
+            if not image_input:
+                raise RuntimeError(f"Failed to read \"{source.file_path}\": {oiio.geterror()}")
+            try:
+                while True:
+                    spec = image_input.spec_dimensions(0, len(mip_sizes))
+                    if spec.width <= 0:
+                        break
+                    mip_sizes.append((spec.width, spec.height))
+            finally:
+                image_input.close()
+            if not mip_sizes:
+                raise RuntimeError(f"Failed to read \"{source.file_path}\"")
+            self.__mip_sizes[source.file_path] = mip_sizes
+        return mip_sizes
+
+    def get_source_size(self, source, miplevel=0):
+        return self.get_mip_sizes(source)[miplevel]
+
+    def select_miplevel(self, source, jacobian):
+        # jacobian is the (2, 2) derivative of the UVs by the output pixel
+        # coords. The level is chosen so that a pixel covers about a texel.
+        if isinstance(source, ProceduralSource):
+            return 0
+        mip_sizes = self.get_mip_sizes(source)
+        if len(mip_sizes) == 1:
+            return 0
+        width, height = mip_sizes[0]
+        footprint = max(np.hypot(jacobian[0, 0] * width, jacobian[0, 1] * height), np.hypot(jacobian[1, 0] * width, jacobian[1, 1] * height))
+        if not (footprint > 1.0):
+            return 0
+        return min(len(mip_sizes) - 1, int(np.floor(np.log2(footprint))))
+
+    def read_source_region(self, source, xbegin, xend, ybegin, yend, miplevel=0):
+        if source.pixels is not None:
+            pixels = source.pixels[ybegin:yend, xbegin:xend]
+        else:
+            pixels = self.__cache.get_pixels(source.file_path, 0, miplevel, xbegin, xend, ybegin, yend, 0, 1, oiio.FLOAT)
+            if (pixels is None) or (pixels.size == 0):
+                raise RuntimeError(f"Failed to read \"{source.file_path}\": {self.__cache.geterror()}")
+            pixels = pixels.reshape(yend - ybegin, xend - xbegin, -1)
+        pixels = to_rgba(np.asarray(pixels, np.float32))
+        if source.b_is_srgb:
+            pixels = np.concatenate([srgb_to_linear(pixels[..., :3]), pixels[..., 3:]], axis=-1)
+        return pixels
+
+    def sample(self, source, uvs, miplevel=0):
+        # Bilinear lookup with repeat extension, the same as the image
+        # texture node defaults. Returns (N, 4) linear colors.
+        width, height = self.get_source_size(source, miplevel)
+        xs = uvs[:, 0] * width - 0.5
+        ys = (1.0 - uvs[:, 1]) * height - 0.5
+        x0 = np.floor(xs)
+        y0 = np.floor(ys)
+        fx = (xs - x0).astype(np.float32)[:, np.newaxis]
+        fy = (ys - y0).astype(np.float32)[:, np.newaxis]
+        x0 = x0.astype(np.int64) % width
+        y0 = y0.astype(np.int64) % height
+        x1 = (x0 + 1) % width
+        y1 = (y0 + 1) % height
+
+        colors = np.zeros((len(uvs), 4), np.float32)
+        self.sample_chunk(source, miplevel, colors, np.arange(len(uvs)), x0, x1, y0, y1, fx, fy)
+        return colors
+
+    def sample_source(self, source, uvs, miplevel, cache_key):
+        # Procedural sources are evaluated at the UVs and cached by cache_key,
+        # which identifies the UVs.
+        if not isinstance(source, ProceduralSource):
+            return self.sample(source, uvs, miplevel)
+        key = (get_source_key(source),) + cache_key
+        colors = None
+        if self.pixel_cache is not None:
+            colors = self.pixel_cache.get(key)
+        if colors is None:
+            colors = procedural.evaluate(source.params, uvs)
+            if self.pixel_cache is not None:
+                self.pixel_cache.put(key, colors)
+        return colors
+
+    def sample_chunk(self, source, miplevel, colors, indices, x0, x1, y0, y1, fx, fy):
+        if len(indices) == 0:
+            return
+
+        xbegin = int(min(x0[indices].min(), x1[indices].min()))
+        xend = int(max(x0[indices].max(), x1[indices].max())) + 1
+        ybegin = int(min(y0[indices].min(), y1[indices].min()))
+        yend = int(max(y0[indices].max(), y1[indices].max())) + 1
+
+        # Splits the lookups until the source region fits in the budget.
+        if ((xend - xbegin) * (yend - ybegin) > MAX_SOURCE_REGION_PIXEL_COUNT) and (len(indices) > 1):
+            half = len(indices) // 2
+            self.sample_chunk(source, miplevel, colors, indices[:half], x0, x1, y0, y1, fx, fy)
+            self.sample_chunk(source, miplevel, colors, indices[half:], x0, x1, y0, y1, fx, fy)
+            return
+
+        region = self.read_source_region(source, xbegin, xend, ybegin, yend, miplevel)
+        rx0 = x0[indices] - xbegin
+        rx1 = x1[indices] - xbegin
+        ry0 = y0[indices] - ybegin
+        ry1 = y1[indices] - ybegin
+        cfx = fx[indices]
+        cfy = fy[indices]
+        top = region[ry0, rx0] * (1.0 - cfx) + region[ry0, rx1] * cfx
+        bottom = region[ry1, rx0] * (1.0 - cfx) + region[ry1, rx1] * cfx
+        colors[indices] = top * (1.0 - cfy) + bottom * cfy
+
+    def get_strip_height(self, resolution):
+        return max(1, min(resolution, self.memory_budget // (resolution * BYTES_PER_PIXEL)))
+
+    def composite_layer(self, layer, strip, strip_ybegin, uv_tile_coord, resolution):
+        strip_height = strip.shape[0]
+        layer_geometry_key = None
+        for triangle_index, (coords, uvs) in enumerate(zip(layer.triangle_coords, layer.triangle_uvs)):
+            # Pixel space of the tile with the first row at the top.
+            px = (coords[:, 0] - uv_tile_coord[0]) * resolution - 0.5
+            py = (uv_tile_coord[1] + 1.0 - coords[:, 1]) * resolution - 0.5 - strip_ybegin
+
+            xbegin = max(0, int(np.ceil(px.min())))
+            xend = min(resolution, int(np.floor(px.max())) + 1)
+            ybegin = max(0, int(np.ceil(py.min())))
+            yend = min(strip_height, int(np.floor(py.max())) + 1)
+            if (xbegin >= xend) or (ybegin >= yend):
+                continue
+
+            area = evaluate_edge_function(px[1], py[1], px[2], py[2], px[0], py[0])
+            if area == 0.0:
+                continue
+
+            gx, gy = np.meshgrid(np.arange(xbegin, xend, dtype=np.float64), np.arange(ybegin, yend, dtype=np.float64))
+            mask = np.ones(gx.shape, bool)
+            edge_values = []
+            for i in range(3):
+                j = (i + 1) % 3
+                k = (i + 2) % 3
+                edge_value = evaluate_edge_function(px[j], py[j], px[k], py[k], gx, gy) * np.sign(area)
+                if is_top_left_edge(px[j], py[j], px[k], py[k], area):
+                    mask &= edge_value >= 0.0
+                else:
+                    mask &= edge_value > 0.0
+                edge_values.append(edge_value)
+            if not mask.any():
+                continue
+
+            weights = np.stack([v[mask] for v in edge_values], axis=1) / abs(area)
+            corner_uvs = uvs @ layer.mapping_matrix[:, :2].T + layer.mapping_matrix[:, 2]
+            mapped_uvs = weights @ corner_uvs
+
+            # The mapping is affine within a triangle, so the footprint of a
+            # pixel is the same everywhere in it.
+            jacobian = np.linalg.solve(np.stack([px, py, np.ones(3)], axis=1), corner_uvs)[:2]
+            basic_miplevel = self.select_miplevel(layer.basic_map_source, jacobian)
+            opacity_miplevel = self.select_miplevel(layer.opacity_map_source, jacobian)
+
+            if layer_geometry_key is None:
+                layer_geometry_key = get_layer_geometry_key(layer)
+            cache_key = (layer_geometry_key, tuple(uv_tile_coord[:2]), resolution, strip_ybegin, strip_height, triangle_index)
+            colors = self.sample_source(layer.basic_map_source, mapped_uvs, basic_miplevel, cache_key)
+            opacity_colors = self.sample_source(layer.opacity_map_source, mapped_uvs, opacity_miplevel, cache_key)
+            if layer.b_use_grayscale_as_opacity:
+                alphas = opacity_colors[:, :3] @ LUMINANCE_COEFFICIENTS
+            else:
+                alphas = opacity_colors[:, 3]
+            alphas = np.clip(alphas * layer.opacity, 0.0, 1.0)[:, np.newaxis]
+
+            region = strip[ybegin:yend, xbegin:xend]
+            dst = region[mask]
+            blending.blend(dst, colors[:, :3], alphas, layer.blend_mode)
+            region[mask] = dst
+
+    def composite_basic_layer(self, layer, strip, strip_ybegin, uv_tile_coord, resolution):
+        strip_height = strip.shape[0]
+        edges = np.empty_like(layer.edge_coords)
+        edges[..., 0] = (layer.edge_coords[..., 0] - uv_tile_coord[0]) * resolution - 0.5
+        edges[..., 1] = (uv_tile_coord[1] + 1.0 - layer.edge_coords[..., 1]) * resolution - 0.5 - strip_ybegin
+        mask = fill_even_odd(edges, resolution, strip_height)
+        if not mask.any():
+            return
+
+        dst = strip[mask]
+        colors = np.broadcast_to(np.asarray(layer.color, np.float32), (len(dst), 3))
+        alphas = np.full((len(dst), 1), np.clip(layer.opacity, 0.0, 1.0), np.float32)
+        blending.blend(dst, colors, alphas, "Normal")
+        strip[mask] = dst
+
+    def composite_group(self, group, strip, strip_ybegin, uv_tile_coord, resolution):
+        key = (get_group_key(group), tuple(uv_tile_coord[:2]), resolution, strip_ybegin, strip.shape[0])
+        flattened = None
+        if self.pixel_cache is not None:
+            flattened = self.pixel_cache.get(key)
+        if flattened is None:
+            flattened = np.zeros_like(strip)
+            self.composite_layers(group.layers, flattened, strip_ybegin, uv_tile_coord, resolution)
+            if not flattened[..., 3].any():
+                flattened = EMPTY_STRIP
+            if self.pixel_cache is not None:
+                self.pixel_cache.put(key, flattened)
+        if flattened.size == 0:
+            return
+
+        # Source-over of the premultiplied group.
+        strip *= 1.0 - flattened[..., 3:] * group.opacity
+        strip += flattened * group.opacity
+
+    def composite_layers(self, layers, strip, strip_ybegin, uv_tile_coord, resolution):
+        for layer in layers:
+            if isinstance(layer, LayerGroup):
+                self.composite_group(layer, strip, strip_ybegin, uv_tile_coord, resolution)
+            elif isinstance(layer, BasicLayer):
+                self.composite_basic_layer(layer, strip, strip_ybegin, uv_tile_coord, resolution)
+            else:
+                self.composite_layer(layer, strip, strip_ybegin, uv_tile_coord, resolution)
+
+    def iterate_strips(self, layers, uv_tile_coord, resolution):
+        # Yields the first row, the end row and the pixels of every strip
+        # from the top. Pixels are straight sRGB RGBA in [0, 1].
+        strip_height = self.get_strip_height(resolution)
+        for strip_ybegin in range(0, resolution, strip_height):
+            strip_yend = min(resolution, strip_ybegin + strip_height)
+            # Linear premultiplied RGBA.
+            strip = np.zeros((strip_yend - strip_ybegin, resolution, 4), np.float32)
+            self.composite_layers(layers, strip, strip_ybegin, uv_tile_coord, resolution)
+
+            alphas = strip[..., 3:]
+            safe_alphas = np.where(alphas > 0.0, alphas, 1.0)
+            strip[..., :3] = linear_to_srgb(strip[..., :3] / safe_alphas)
+            np.clip(strip, 0.0, 1.0, out=strip)
+            yield strip_ybegin, strip_yend, strip
+
+    def composite_pixels(self, layers, uv_tile_coord, resolution):
+        # Returns the (resolution, resolution, 4) pixels of the tile in
+        # memory, rows from the top, e.g. for previews.
+        pixels = np.empty((resolution, resolution, 4), np.float32)
+        for strip_ybegin, strip_yend, strip in self.iterate_strips(layers, uv_tile_coord, resolution):
+            pixels[strip_ybegin:strip_yend] = strip
+        return pixels
+
+    def composite(self, layers, uv_tile_coord, resolution, file_path, color_depth, previous_pixel_hash=""):
+        # Returns the pixel hash of the tile and whether the file was written.
+        # Tiles whose pixel hash equals previous_pixel_hash are neither
+        # encoded nor written.
+        dtype = np.dtype(COLOR_DEPTH_FORMATS.get(color_depth, "uint8"))
+        pixel_hasher = create_pixel_hasher(resolution, resolution, 4, dtype)
+
+        # Quantized strips are kept until the hash is known, in memory if they
+        # fit in the budget and in a raw file next to the output otherwise.
+        spill_file_path = f"{file_path}.raw"
+        if resolution * resolution * 4 * dtype.itemsize <= self.memory_budget:
+            pixels = np.empty((resolution, resolution, 4), dtype)
+        else:
+            pixels = np.memmap(spill_file_path, dtype, "w+", shape=(resolution, resolution, 4))
+
+        try:
+            for strip_ybegin, strip_yend, strip in self.iterate_strips(layers, uv_tile_coord, resolution):
+                strip *= np.iinfo(dtype).max
+                np.rint(strip, out=strip)
+                pixels[strip_ybegin:strip_yend] = strip
+                pixel_hasher.update(pixels[strip_ybegin:strip_yend])
+
+            pixel_hash = pixel_hasher.hexdigest()
+            if pixel_hash == previous_pixel_hash:
+                return pixel_hash, False
+
+            spec = oiio.ImageSpec(resolution, resolution, 4, dtype.name)
+            # Otherwise the pixels are taken as premultiplied and divided by
+            # the alpha again.
+            spec.attribute("oiio:UnassociatedAlpha", 1)
+            output = oiio.ImageOutput.create(file_path)
+            if not output:
+                raise RuntimeError(f"Failed to create \"{file_path}\": {oiio.geterror()}")
+            if not output.open(file_path, spec):
+                raise RuntimeError(f"Failed to open \"{file_path}\": {output.geterror()}")
+            try:
+                strip_height = self.get_strip_height(resolution)
+                for strip_ybegin in range(0, resolution, strip_height):
+                    strip_yend = min(resolution, strip_ybegin + strip_height)
+                    if not output.write_scanlines(strip_ybegin, strip_yend, 0, np.ascontiguousarray(pixels[strip_ybegin:strip_yend])):
+                        raise RuntimeError(f"Failed to write \"{file_path}\": {output.geterror()}")
+            finally:
+                output.close()
+
+            return pixel_hash, True
+        finally:
+            if isinstance(pixels, np.memmap):
+                del pixels
+                os.remove(spill_file_path)
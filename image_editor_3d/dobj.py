@@ -1,5 +1,6 @@
 import abc
 import json
+import os
 
 from . import error
 
@@ -41,15 +42,50 @@ def dict_dict_to_dobj_dict(dict_dict, cls):
     return dobj_dict
 
 def write_dobj(dobj, file_path):
+    temp_file_path = f"{file_path}.tmp"
     try:
         d = dobj.to_dict()
-        with open(file_path, "w", encoding="utf-8") as file:
+        with open(temp_file_path, "w", encoding="utf-8") as file:
             json.dump(d, file, indent=4)
+        os.replace(temp_file_path, file_path)
     except:
+        try:
+            if os.path.isfile(temp_file_path):
+                os.remove(temp_file_path)
+        except OSError:
+            pass
         return error.Error("An error occurred while writing to the file.")
 
     return None
 
+def append_dobj(dobj, file_path):
+    # Appends the dobj as one line, so files growing with every record are
+    # not rewritten.
+    try:
+        line = json.dumps(dobj.to_dict())
+        with open(file_path, "a", encoding="utf-8") as file:
+            file.write(f"{line}\n")
+    except:
+        return error.Error("An error occurred while writing to the file.")
+
+    return None
+
+def read_dobj_lines(file_path, cls):
+    # A line cut off by a crash ends the records.
+    dobjs = []
+    try:
+        with open(file_path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    d = json.loads(line)
+                except ValueError:
+                    break
+                dobjs.append(cls.from_dict(d))
+    except:
+        return [], error.Error("An error occurred while reading from the file.")
+
+    return dobjs, None
+
 def read_dobj(file_path, cls):
     try:
         d = {}
@@ -0,0 +1,684 @@
+import glob
+import hashlib
+import json
+import os
+
+import bpy
+
+from . import dobj, error, profiling, properties
+
+
+class ExportUnit(object):
+    def __init__(self):
+        super(ExportUnit, self).__init__()
+        self.uv_tile_num = 0
+        self.uv_tile_coord = [0, 0]
+        self.map_internal_name = ""
+        self.map_display_name = ""
+        self.color_depth = ""
+        self.file_path = ""
+
+class ExportedFile(dobj.Dobj):
+    def __init__(self):
+        self.uv_tile_num = 0
+        self.map_internal_name = ""
+        self.map_display_name = ""
+        self.file_path = ""
+        # Hash of the quantized pixels, and the size and mtime of the file
+        # when it was written, to detect files changed by other tools.
+        self.pixel_hash = ""
+        self.file_size = 0
+        self.mtime_ns = 0
+
+    def to_dict(self):
+        d = {
+            "uv_tile_num": self.uv_tile_num,
+            "map_internal_name": self.map_internal_name,
+            "map_display_name": self.map_display_name,
+            "file_path": self.file_path,
+            "pixel_hash": self.pixel_hash,
+            "file_size": self.file_size,
+            "mtime_ns": self.mtime_ns,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.uv_tile_num = d["uv_tile_num"]
+        instance.map_internal_name = d["map_internal_name"]
+        instance.map_display_name = d["map_display_name"]
+        instance.file_path = d["file_path"]
+        # Manifests written by older versions have no hashes.
+        instance.pixel_hash = d.get("pixel_hash", "")
+        instance.file_size = d.get("file_size", 0)
+        instance.mtime_ns = d.get("mtime_ns", 0)
+        return instance
+
+class ExportManifest(dobj.Dobj):
+    def __init__(self):
+        self.signature = ""
+        self.exported_files = {}
+
+    def to_dict(self):
+        d = {
+            "signature": self.signature,
+            "exported_files": dobj.dobj_dict_to_dict_dict(self.exported_files),
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.signature = d["signature"]
+        instance.exported_files = dobj.dict_dict_to_dobj_dict(d["exported_files"], ExportedFile)
+        return instance
+
+class ExportJournalEntry(dobj.Dobj):
+    # A file exported since the manifest was last written.
+    def __init__(self):
+        self.signature = ""
+        self.file_name = ""
+        self.exported_file = ExportedFile()
+
+    def to_dict(self):
+        d = {
+            "signature": self.signature,
+            "file_name": self.file_name,
+            "exported_file": self.exported_file.to_dict(),
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.signature = d["signature"]
+        instance.file_name = d["file_name"]
+        instance.exported_file = ExportedFile.from_dict(d["exported_file"])
+        return instance
+
+class ExportChanges(dobj.Dobj):
+    # Files written by an export and files skipped because their pixels did
+    # not change, for delivery tools syncing the output directory.
+    def __init__(self):
+        self.directory = ""
+        self.changed_files = []
+        self.unchanged_files = []
+
+    def to_dict(self):
+        d = {
+            "directory": self.directory,
+            "changed_files": dobj.dobjs_to_dicts(self.changed_files),
+            "unchanged_files": dobj.dobjs_to_dicts(self.unchanged_files),
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.directory = d["directory"]
+        instance.changed_files = dobj.dicts_to_dobjs(d["changed_files"], ExportedFile)
+        instance.unchanged_files = dobj.dicts_to_dobjs(d["unchanged_files"], ExportedFile)
+        return instance
+
+class ExportReport(dobj.Dobj):
+    def __init__(self):
+        self.b_is_succeeded = True
+        self.blend_file_path = ""
+        self.scene_name = ""
+        self.directory = ""
+        self.elapsed_time = 0.0
+        self.exported_files = []
+        self.skipped_file_paths = []
+        self.unchanged_file_paths = []
+        self.errors = []
+
+    def to_dict(self):
+        d = {
+            "b_is_succeeded": self.b_is_succeeded,
+            "blend_file_path": self.blend_file_path,
+            "scene_name": self.scene_name,
+            "directory": self.directory,
+            "elapsed_time": self.elapsed_time,
+            "exported_files": dobj.dobjs_to_dicts(self.exported_files),
+            "skipped_file_paths": self.skipped_file_paths,
+            "unchanged_file_paths": self.unchanged_file_paths,
+            "errors": self.errors,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.b_is_succeeded = d["b_is_succeeded"]
+        instance.blend_file_path = d["blend_file_path"]
+        instance.scene_name = d["scene_name"]
+        instance.directory = d["directory"]
+        instance.elapsed_time = d["elapsed_time"]
+        instance.exported_files = dobj.dicts_to_dobjs(d["exported_files"], ExportedFile)
+        instance.skipped_file_paths = d["skipped_file_paths"]
+        instance.unchanged_file_paths = d["unchanged_file_paths"]
+        instance.errors = d["errors"]
+        return instance
+
+MANIFEST_FILE_NAME_PREFIX = "ie3_manifest"
+MANIFEST_JOURNAL_FILE_EXT = ".journal"
+CHANGES_FILE_NAME_PREFIX = "ie3_changes"
+
+# Flattened layer groups and procedural samples kept between exports and
+# previews of the session.
+pixel_cache = None
+
+def get_pixel_cache(scene):
+    from . import compositor
+
+    global pixel_cache
+    max_size = scene.ie3.pixel_cache_size * 1024 ** 2
+    if pixel_cache is None:
+        pixel_cache = compositor.PixelCache(max_size)
+    elif pixel_cache.max_size != max_size:
+        pixel_cache.max_size = max_size
+        pixel_cache.clear()
+    return pixel_cache
+
+def create_map_file_name(map_file_name, uv_tile_num, map_display_name):
+    return f"{map_file_name}_{uv_tile_num}_{map_display_name}.png"
+
+def create_temp_file_path(file_path):
+    # Keeps the extension so Blender does not append another one.
+    directory, file_name = os.path.split(file_path)
+    return os.path.join(directory, f".{file_name}.tmp.png")
+
+def create_export_signature(scene, resolution, export_backend):
+    # Outputs recorded under another signature were exported with
+    # different settings and must not be reused when resuming.
+    scene_setting_group = scene.ie3.create_scene_setting_group()
+    d = scene_setting_group.to_dict()
+    d["resolution"] = resolution
+    if export_backend != properties.ExportBackend.Render:
+        d["export_backend"] = export_backend.name
+    s = json.dumps(d, sort_keys=True)
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+def create_image_source(image, b_use_texture_cache=False):
+    import numpy as np
+
+    from . import compositor
+
+    b_is_srgb = image.colorspace_settings.name == "sRGB"
+    file_path = bpy.path.abspath(properties.get_image_source_file_path(image), library=image.library)
+    if (not image.packed_file) and os.path.isfile(file_path):
+        if b_use_texture_cache:
+            from . import txcache
+            file_path = txcache.get_tx_file_path(file_path)
+        return compositor.ImageSource(file_path=file_path, b_is_srgb=b_is_srgb)
+
+    # Packed images, e.g. the dummy images, are read from Blender. Pixels
+    # start from the bottom row and only float images are stored linear.
+    width, height = image.size
+    pixels = np.zeros(width * height * 4, np.float32)
+    image.pixels.foreach_get(pixels)
+    pixels = pixels.reshape(height, width, 4)[::-1]
+    return compositor.ImageSource(pixels=pixels, b_is_srgb=b_is_srgb and (not image.is_float))
+
+def hash_image_file(file_path, color_depth):
+    import numpy as np
+    import OpenImageIO as oiio
+
+    from . import compositor
+
+    config = oiio.ImageSpec()
+    config.attribute("oiio:UnassociatedAlpha", 1)
+    image_buf = oiio.ImageBuf(file_path, 0, 0, config)
+    spec = image_buf.spec()
+    dtype = np.dtype(compositor.COLOR_DEPTH_FORMATS.get(color_depth, "uint8"))
+    pixels = image_buf.get_pixels(oiio.TypeDesc(dtype.name))
+    if pixels is None:
+        raise RuntimeError(f"Failed to read \"{file_path}\": {image_buf.geterror()}")
+    pixel_hasher = compositor.create_pixel_hasher(spec.width, spec.height, spec.nchannels, dtype)
+    pixel_hasher.update(np.ascontiguousarray(pixels, dtype))
+    return pixel_hasher.hexdigest()
+
+def get_manifest_file_path(directory, manifest_tag):
+    return os.path.join(directory, f"{MANIFEST_FILE_NAME_PREFIX}_{manifest_tag}.json")
+
+def get_manifest_journal_file_path(manifest_file_path):
+    return f"{manifest_file_path}{MANIFEST_JOURNAL_FILE_EXT}"
+
+def find_manifest_file_paths(directory):
+    # Manifests of exports which stopped before writing them have only a
+    # journal.
+    file_paths = set(glob.glob(os.path.join(directory, f"{MANIFEST_FILE_NAME_PREFIX}_*.json")))
+    for journal_file_path in glob.glob(os.path.join(directory, f"{MANIFEST_FILE_NAME_PREFIX}_*.json{MANIFEST_JOURNAL_FILE_EXT}")):
+        file_paths.add(journal_file_path[:-len(MANIFEST_JOURNAL_FILE_EXT)])
+    return sorted(file_paths)
+
+def read_manifest(file_path):
+    # Exports append each file to the journal and write the manifest at the
+    # end, so the journal is merged into the manifest. A journal with another
+    # signature belongs to an export which replaces the manifest.
+    manifest = None
+    if os.path.isfile(file_path):
+        manifest, e = dobj.read_dobj(file_path, ExportManifest)
+        if e:
+            manifest = None
+
+    journal_file_path = get_manifest_journal_file_path(file_path)
+    if os.path.isfile(journal_file_path):
+        journal_entries, e = dobj.read_dobj_lines(journal_file_path, ExportJournalEntry)
+        for journal_entry in journal_entries:
+            if (manifest is None) or (manifest.signature != journal_entry.signature):
+                manifest = ExportManifest()
+                manifest.signature = journal_entry.signature
+            manifest.exported_files[journal_entry.file_name] = journal_entry.exported_file
+
+    return manifest
+
+def read_exported_files(directory, signature):
+    # Every process writes its own manifest, so parallel workers never
+    # race on a single file. Resuming merges all of them.
+    exported_files = {}
+    for file_path in find_manifest_file_paths(directory):
+        manifest = read_manifest(file_path)
+        if (manifest is None) or (manifest.signature != signature):
+            continue
+        exported_files.update(manifest.exported_files)
+    return exported_files
+
+def read_previous_exported_files(directory):
+    # Files of any previous export which are still as they were written, so
+    # their pixel hashes can be compared regardless of the settings.
+    previous_exported_files = {}
+    for file_path in find_manifest_file_paths(directory):
+        manifest = read_manifest(file_path)
+        if manifest is None:
+            continue
+        for file_name, exported_file in manifest.exported_files.items():
+            if not exported_file.pixel_hash:
+                continue
+            try:
+                st = os.stat(os.path.join(directory, file_name))
+            except OSError:
+                continue
+            if (st.st_size == exported_file.file_size) and (st.st_mtime_ns == exported_file.mtime_ns):
+                previous_exported_files[file_name] = exported_file
+    return previous_exported_files
+
+class MapExporter(object):
+    def __init__(self, scene, directory, uv_tile_nums=None, map_internal_names=None, resolution=None, b_dirty_tiles_only=False, b_resume=False, manifest_tag="main"):
+        super(MapExporter, self).__init__()
+        ie3 = scene.ie3
+
+        self.scene = scene
+        self.directory = directory
+        self.resolution = int(resolution or ie3.resolution)
+        self.export_backend = properties.ExportBackend(ie3.export_backend)
+        self.b_use_texture_cache = ie3.b_use_texture_cache
+        self.units = []
+        self.skipped_units = []
+
+        self.manifest = ExportManifest()
+        self.manifest.signature = create_export_signature(scene, self.resolution, self.export_backend)
+        self.manifest_file_path = get_manifest_file_path(directory, manifest_tag)
+        self.manifest_journal_file_path = get_manifest_journal_file_path(self.manifest_file_path)
+        self.changes = ExportChanges()
+        self.changes.directory = directory
+        self.changes_file_path = os.path.join(directory, f"{CHANGES_FILE_NAME_PREFIX}_{manifest_tag}.json")
+        self.unchanged_file_paths = []
+        self.previous_exported_files = read_previous_exported_files(directory)
+        previous_exported_files = {}
+        if b_resume:
+            previous_exported_files = read_exported_files(directory, self.manifest.signature)
+
+        self.__camera = None
+        self.__camera_obj = None
+        self.__compositor = None
+        self.__compositor_layers = {}
+        self.__image_sources = {}
+        self.__image_obj_wrappers = []
+        self.__basic_layer_obj_wrappers = []
+        self.__proxy_file_paths = {}
+        self.__hidden_layer_obj_names = []
+        self.__remaining_unit_counts = {}
+
+        current_basic_map_data_list = ie3.get_current_basic_map_data_list()
+        if map_internal_names is not None:
+            current_basic_map_data_list = [d for d in current_basic_map_data_list if d.internal_name in map_internal_names]
+
+        for uv_tile_data in ie3.uv_tile_data_list:
+            if (uv_tile_nums is not None) and (not uv_tile_data.num in uv_tile_nums):
+                continue
+            if b_dirty_tiles_only and (not uv_tile_data.b_is_dirty):
+                continue
+
+            for basic_map_data in current_basic_map_data_list:
+                unit = ExportUnit()
+                unit.uv_tile_num = uv_tile_data.num
+                unit.uv_tile_coord = list(uv_tile_data.coord)
+                unit.map_internal_name = basic_map_data.internal_name
+                unit.map_display_name = basic_map_data.get_display_name()
+                unit.color_depth = basic_map_data.color_depth
+                unit.file_path = os.path.join(directory, create_map_file_name(ie3.map_file_name, unit.uv_tile_num, unit.map_display_name))
+
+                file_name = os.path.basename(unit.file_path)
+                if (file_name in previous_exported_files) and os.path.isfile(unit.file_path):
+                    self.manifest.exported_files[file_name] = previous_exported_files[file_name]
+                    self.skipped_units.append(unit)
+                    continue
+
+                self.units.append(unit)
+
+                self.__remaining_unit_counts[unit.uv_tile_num] = self.__remaining_unit_counts.get(unit.uv_tile_num, 0) + 1
+
+    def begin(self):
+        # A journal left by an export which stopped is written into its
+        # manifest, so this export starts a journal of its own.
+        if os.path.isfile(self.manifest_journal_file_path):
+            manifest = read_manifest(self.manifest_file_path)
+            e = None
+            if manifest:
+                e = dobj.write_dobj(manifest, self.manifest_file_path)
+            if not e:
+                os.remove(self.manifest_journal_file_path)
+
+        if self.export_backend == properties.ExportBackend.Compositor:
+            from . import compositor
+
+            ie3 = self.scene.ie3
+            self.__compositor = compositor.Compositor(ie3.compositor_memory_budget * 1024 ** 2, ie3.compositor_cache_size * 1024 ** 2, get_pixel_cache(self.scene))
+            self.__compositor_layers = {}
+            self.__image_sources = {}
+            return
+
+        self.__camera = bpy.data.cameras.new("Camera")
+        self.__camera.type = "ORTHO"
+        self.__camera.ortho_scale = 1.0
+        self.__camera_obj = bpy.data.objects.new("Camera", self.__camera)
+        self.scene.collection.objects.link(self.__camera_obj)
+        self.scene.camera = self.__camera_obj
+
+        self.scene.render.resolution_x = self.resolution
+        self.scene.render.resolution_y = self.resolution
+
+        image_objs = properties.find_layer_objs_with_type(properties.LayerObjType.Image)
+        self.__image_obj_wrappers = properties.create_image_obj_wrappers(image_objs)
+        basic_layer_objs = properties.find_layer_objs_with_type(properties.LayerObjType.Basic)
+        self.__basic_layer_obj_wrappers = properties.create_basic_layer_obj_wrappers(basic_layer_objs)
+
+        # Renders draw the group opacities with the layer materials, and the
+        # layers of groups hidden in export are hidden until the end.
+        properties.apply_layer_group_opacities(self.scene)
+        self.__hidden_layer_obj_names = []
+        for layer_obj in properties.find_objs_with_type(properties.ObjType.Layer, self.scene):
+            if (not layer_obj.hide_render) and any(o.hide_render for o in properties.find_layer_group_objs(layer_obj)):
+                layer_obj.hide_render = True
+                self.__hidden_layer_obj_names.append(layer_obj.name)
+
+        # Texture cache proxies are downsampled for the viewport, so the
+        # sources of the exported maps are rendered and the proxies are loaded
+        # again at the end.
+        self.__proxy_file_paths = {}
+        map_internal_names = {u.map_internal_name for u in self.units} | {properties.SpecialMapType.Opacity.name}
+        for image_obj_wrapper in self.__image_obj_wrappers:
+            for map_internal_name, image in image_obj_wrapper.get_maps().items():
+                if (not map_internal_name in map_internal_names) or (image.name in self.__proxy_file_paths):
+                    continue
+                if properties.SOURCE_FILE_PATH_KEY in image:
+                    self.__proxy_file_paths[image.name] = image.filepath
+                    image.filepath = image[properties.SOURCE_FILE_PATH_KEY]
+
+    def get_image_source(self, image):
+        key = image.as_pointer()
+        if not key in self.__image_sources:
+            self.__image_sources[key] = create_image_source(image, self.b_use_texture_cache)
+        return self.__image_sources[key]
+
+    def create_compositor_layers(self, map_internal_name):
+        import numpy as np
+
+        from . import compositor
+
+        entries = []
+        groups = {}
+        layer_objs = properties.find_objs_with_type(properties.ObjType.Layer, self.scene)
+        layer_objs.sort(key=lambda o: o.location.z)
+        for layer_obj in layer_objs:
+            if layer_obj.hide_render:
+                continue
+            group_objs = properties.find_layer_group_objs(layer_obj)
+            if any(o.hide_render for o in group_objs):
+                continue
+            layer_obj_type = properties.get_layer_obj_type(layer_obj)
+            if not layer_obj_type in [properties.LayerObjType.Image, properties.LayerObjType.Procedural, properties.LayerObjType.Basic]:
+                continue
+
+            if layer_obj_type == properties.LayerObjType.Basic:
+                layer = self.create_compositor_basic_layer(layer_obj, map_internal_name)
+                entries.append((self.get_compositor_groups(groups, group_objs), layer))
+                continue
+
+            mesh = layer_obj.data
+            mesh.calc_loop_triangles()
+            triangle_vert_indices = np.zeros(len(mesh.loop_triangles) * 3, np.int64)
+            mesh.loop_triangles.foreach_get("vertices", triangle_vert_indices)
+            triangle_loop_indices = np.zeros(len(mesh.loop_triangles) * 3, np.int64)
+            mesh.loop_triangles.foreach_get("loops", triangle_loop_indices)
+            vert_coords = np.zeros(len(mesh.vertices) * 3, np.float64)
+            mesh.vertices.foreach_get("co", vert_coords)
+            uvs = np.zeros(len(mesh.loops) * 2, np.float64)
+            mesh.uv_layers.active.data.foreach_get("uv", uvs)
+
+            matrix_world = np.array(layer_obj.matrix_world, np.float64)
+            world_coords = vert_coords.reshape(-1, 3) @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+
+            image_obj_wrapper = properties.ImageObjWrapper(layer_obj)
+
+            layer = compositor.Layer()
+            layer.triangle_coords = world_coords[triangle_vert_indices.reshape(-1, 3)][:, :, :2]
+            layer.triangle_uvs = uvs.reshape(-1, 2)[triangle_loop_indices.reshape(-1, 3)]
+            layer.mapping_matrix = np.array(image_obj_wrapper.get_mapping_uv_matrix(), np.float64)
+            if layer_obj_type == properties.LayerObjType.Procedural:
+                # The colors and the alpha come from the same evaluation.
+                layer.basic_map_source = compositor.ProceduralSource(properties.ProceduralLayerObjWrapper(layer_obj).get_params())
+                layer.opacity_map_source = layer.basic_map_source
+            else:
+                layer.basic_map_source = self.get_image_source(image_obj_wrapper.get_map(map_internal_name))
+                layer.opacity_map_source = self.get_image_source(image_obj_wrapper.get_map(properties.SpecialMapType.Opacity.name))
+                layer.b_use_grayscale_as_opacity = image_obj_wrapper.get_b_use_grayscale_as_opacity()
+            layer.opacity = image_obj_wrapper.get_opacity() * layer_obj.color[3]
+            layer.blend_mode = image_obj_wrapper.get_blend_mode().name
+
+            entries.append((self.get_compositor_groups(groups, group_objs), layer))
+
+        return compositor.group_layers(entries)
+
+    def get_compositor_groups(self, groups, group_objs):
+        from . import compositor
+
+        for group_obj in group_objs:
+            if not group_obj.name in groups:
+                group = compositor.LayerGroup()
+                group.opacity = properties.LayerGroupObjWrapper(group_obj).get_opacity()
+                groups[group_obj.name] = group
+        return [groups[o.name] for o in group_objs]
+
+    def create_compositor_basic_layer(self, layer_obj, map_internal_name):
+        import numpy as np
+
+        from . import compositor
+
+        mesh = layer_obj.data
+        vert_coords = np.zeros(len(mesh.vertices) * 3, np.float64)
+        mesh.vertices.foreach_get("co", vert_coords)
+        loop_vert_indices = np.zeros(len(mesh.loops), np.int64)
+        mesh.loops.foreach_get("vertex_index", loop_vert_indices)
+        loop_totals = np.zeros(len(mesh.polygons), np.int64)
+        mesh.polygons.foreach_get("loop_total", loop_totals)
+
+        matrix_world = np.array(layer_obj.matrix_world, np.float64)
+        world_coords = vert_coords.reshape(-1, 3) @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+
+        basic_layer_obj_wrapper = properties.BasicLayerObjWrapper(layer_obj)
+
+        layer = compositor.BasicLayer()
+        layer.edge_coords = compositor.create_outline_edges(world_coords[:, :2], loop_vert_indices, loop_totals)
+        layer.color = np.array(basic_layer_obj_wrapper.get_value(map_internal_name), np.float32)
+        layer.opacity = basic_layer_obj_wrapper.get_opacity() * layer_obj.color[3]
+        return layer
+
+    def composite_unit(self, unit, file_path, previous_pixel_hash):
+        if not unit.map_internal_name in self.__compositor_layers:
+            self.__compositor_layers[unit.map_internal_name] = self.create_compositor_layers(unit.map_internal_name)
+        layers = self.__compositor_layers[unit.map_internal_name]
+
+        with profiling.span("MapExporter.composite"):
+            return self.__compositor.composite(layers, unit.uv_tile_coord, self.resolution, file_path, unit.color_depth, previous_pixel_hash)
+
+    def render_unit(self, unit, file_path):
+        self.__camera_obj.location = properties.uv_tile_coord_to_location(unit.uv_tile_coord)
+        self.__camera_obj.location.z = 500.0
+
+        # The map is switched for every unit, as the display map can be
+        # changed while a modal export runs.
+        with profiling.span("MapExporter.switch_map"):
+            for image_obj_wrapper in self.__image_obj_wrappers:
+                image_obj_wrapper.switch_map(unit.map_internal_name)
+            for basic_layer_obj_wrapper in self.__basic_layer_obj_wrappers:
+                basic_layer_obj_wrapper.switch_map(unit.map_internal_name)
+
+        self.scene.render.filepath = file_path
+        self.scene.render.image_settings.color_depth = unit.color_depth
+        with profiling.span("MapExporter.render"):
+            bpy.ops.render.render(write_still=True, scene=self.scene.name)
+
+    def export_unit(self, unit):
+        file_name = os.path.basename(unit.file_path)
+        previous_pixel_hash = ""
+        if file_name in self.previous_exported_files:
+            previous_pixel_hash = self.previous_exported_files[file_name].pixel_hash
+
+        # Files whose pixels did not change are left untouched, so their
+        # mtime does not change and sync tools skip them.
+        temp_file_path = create_temp_file_path(unit.file_path)
+        try:
+            if self.export_backend == properties.ExportBackend.Compositor:
+                pixel_hash, b_is_written = self.composite_unit(unit, temp_file_path, previous_pixel_hash)
+            else:
+                # Blender encodes while rendering, so only the write is
+                # skipped.
+                self.render_unit(unit, temp_file_path)
+                with profiling.span("MapExporter.hash"):
+                    pixel_hash = hash_image_file(temp_file_path, unit.color_depth)
+                b_is_written = pixel_hash != previous_pixel_hash
+            if b_is_written:
+                os.replace(temp_file_path, unit.file_path)
+            elif os.path.isfile(temp_file_path):
+                os.remove(temp_file_path)
+        except:
+            if os.path.isfile(temp_file_path):
+                os.remove(temp_file_path)
+            return error.Error(f"An error occurred while exporting \"{unit.file_path}\".")
+
+        # Only the exported file is appended per unit, and the manifest and
+        # the changes are written once at the end.
+        exported_file = self.create_exported_file(unit, pixel_hash)
+        self.manifest.exported_files[file_name] = exported_file
+        journal_entry = ExportJournalEntry()
+        journal_entry.signature = self.manifest.signature
+        journal_entry.file_name = file_name
+        journal_entry.exported_file = exported_file
+        e = dobj.append_dobj(journal_entry, self.manifest_journal_file_path)
+        if e:
+            return e
+
+        if b_is_written:
+            self.changes.changed_files.append(exported_file)
+        else:
+            self.changes.unchanged_files.append(exported_file)
+            self.unchanged_file_paths.append(unit.file_path)
+
+        self.__remaining_unit_counts[unit.uv_tile_num] -= 1
+        if self.__remaining_unit_counts[unit.uv_tile_num] == 0:
+            for uv_tile_data in self.scene.ie3.uv_tile_data_list:
+                if uv_tile_data.num == unit.uv_tile_num:
+                    uv_tile_data.b_is_dirty = False
+
+        return None
+
+    def end(self):
+        if self.__compositor:
+            self.__compositor.close()
+            self.__compositor = None
+        self.__compositor_layers = {}
+        self.__image_sources = {}
+        if self.__camera_obj:
+            bpy.data.objects.remove(self.__camera_obj)
+            self.__camera_obj = None
+        if self.__camera:
+            bpy.data.cameras.remove(self.__camera)
+            self.__camera = None
+        self.__image_obj_wrappers = []
+        self.__basic_layer_obj_wrappers = []
+        for image_name, proxy_file_path in self.__proxy_file_paths.items():
+            image = bpy.data.images.get(image_name)
+            if image and (properties.SOURCE_FILE_PATH_KEY in image):
+                image.filepath = proxy_file_path
+        self.__proxy_file_paths = {}
+        for layer_obj_name in self.__hidden_layer_obj_names:
+            layer_obj = bpy.data.objects.get(layer_obj_name)
+            if layer_obj:
+                layer_obj.hide_render = False
+        self.__hidden_layer_obj_names = []
+
+        return self.write_manifest()
+
+    def write_manifest(self):
+        if not os.path.isfile(self.manifest_journal_file_path):
+            return None
+        e = dobj.write_dobj(self.manifest, self.manifest_file_path)
+        if e:
+            return e
+        e = dobj.write_dobj(self.changes, self.changes_file_path)
+        if e:
+            return e
+        try:
+            os.remove(self.manifest_journal_file_path)
+        except OSError:
+            return error.Error(f"An error occurred while removing \"{self.manifest_journal_file_path}\".")
+        return None
+
+    def create_exported_file(self, unit, pixel_hash):
+        exported_file = ExportedFile()
+        exported_file.uv_tile_num = unit.uv_tile_num
+        exported_file.map_internal_name = unit.map_internal_name
+        exported_file.map_display_name = unit.map_display_name
+        exported_file.file_path = unit.file_path
+        exported_file.pixel_hash = pixel_hash
+        st = os.stat(unit.file_path)
+        exported_file.file_size = st.st_size
+        exported_file.mtime_ns = st.st_mtime_ns
+        return exported_file
+
+    def export(self, report=None):
+        errors = []
+        self.begin()
+        try:
+            for unit in self.units:
+                e = self.export_unit(unit)
+                if e:
+                    errors.append(e)
+                    continue
+                if report:
+                    report.exported_files.append(self.manifest.exported_files[os.path.basename(unit.file_path)])
+        finally:
+            e = self.end()
+            if e:
+                errors.append(e)
+
+        if report:
+            report.skipped_file_paths += [u.file_path for u in self.skipped_units]
+            report.unchanged_file_paths += self.unchanged_file_paths
+            report.errors += [str(e) for e in errors]
+            report.b_is_succeeded = report.b_is_succeeded and (not errors)
+
+        return errors
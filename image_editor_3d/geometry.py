@@ -0,0 +1,197 @@
+import numpy as np
+
+
+# Array based 2D geometry kernels. This module depends only on NumPy so that
+# it can be tested and benchmarked outside Blender.
+#
+# Points are (..., 2) arrays, segments are (M, 2, 2) arrays and polygons are
+# (M, K, 2) arrays padded with their first vertex, so every polygon has K
+# vertices. The padding adds zero length edges which do not affect results.
+
+MAX_CHUNK_ELEMENT_COUNT = 2 ** 22
+
+def loop_index(index, length):
+    if length == 0:
+        return index
+    return index % length
+
+def iterate_chunks(row_count, row_element_count):
+    chunk_row_count = max(1, MAX_CHUNK_ELEMENT_COUNT // max(1, row_element_count))
+    for start in range(0, row_count, chunk_row_count):
+        yield slice(start, min(row_count, start + chunk_row_count))
+
+def cross(p0, p1, p2):
+    val = (p1[..., 0] - p0[..., 0]) * (p2[..., 1] - p0[..., 1]) - (p1[..., 1] - p0[..., 1]) * (p2[..., 0] - p0[..., 0])
+    return val
+
+def find_intersections(p00, p01, p10, p11):
+    p00 = np.asarray(p00, np.float64)
+    p01 = np.asarray(p01, np.float64)
+    p10 = np.asarray(p10, np.float64)
+    p11 = np.asarray(p11, np.float64)
+
+    val0 = cross(p00, p01, p10)
+    val1 = cross(p00, p01, p11)
+    val2 = cross(p10, p11, p00)
+    val3 = cross(p10, p11, p01)
+    det = (p00[..., 0] - p01[..., 0]) * (p11[..., 1] - p10[..., 1]) - (p11[..., 0] - p10[..., 0]) * (p00[..., 1] - p01[..., 1])
+    mask = (val0 * val1 <= 0.0) & (val2 * val3 <= 0.0) & (det != 0.0)
+
+    safe_det = np.where(det != 0.0, det, 1.0)
+    t = ((p11[..., 1] - p10[..., 1]) * (p11[..., 0] - p01[..., 0]) + (p10[..., 0] - p11[..., 0]) * (p11[..., 1] - p01[..., 1])) / safe_det
+    t = t[..., np.newaxis]
+    points = t * p00 + (1.0 - t) * p01
+    return points, mask
+
+def find_segment_intersections(segments0, segments1):
+    segments0 = np.asarray(segments0, np.float64)
+    segments1 = np.asarray(segments1, np.float64)
+    p00 = segments0[:, np.newaxis, 0]
+    p01 = segments0[:, np.newaxis, 1]
+    p10 = segments1[np.newaxis, :, 0]
+    p11 = segments1[np.newaxis, :, 1]
+    return find_intersections(p00, p01, p10, p11)
+
+def find_first_intersections(segments0, segments1):
+    # Finds the intersection closest to the start point of each segment in
+    # segments0. Ties resolve to the lowest index in segments1.
+    segments0 = np.asarray(segments0, np.float64)
+    segments1 = np.asarray(segments1, np.float64)
+    points = np.zeros((len(segments0), 2), np.float64)
+    indices = np.full(len(segments0), -1, np.int64)
+    if (len(segments0) == 0) or (len(segments1) == 0):
+        return points, indices
+
+    for s in iterate_chunks(len(segments0), len(segments1)):
+        chunk_points, mask = find_segment_intersections(segments0[s], segments1)
+        distances = np.linalg.norm(chunk_points - segments0[s, np.newaxis, 0], axis=-1)
+        distances = np.where(mask, distances, np.inf)
+        chunk_indices = np.argmin(distances, axis=1)
+        rows = np.arange(len(chunk_indices))
+        b_are_found = mask[rows, chunk_indices]
+        points[s] = chunk_points[rows, chunk_indices]
+        indices[s] = np.where(b_are_found, chunk_indices, -1)
+    return points, indices
+
+def find_closest_points(p0, p1, p):
+    p0 = np.asarray(p0, np.float64)
+    p1 = np.asarray(p1, np.float64)
+    p = np.asarray(p, np.float64)
+
+    diff0 = p - p0
+    diff1 = p1 - p0
+    dot = np.sum(diff0 * diff1, axis=-1)
+    length_squared = np.sum(diff1 * diff1, axis=-1)
+
+    safe_length_squared = np.where(length_squared > 0.0, length_squared, 1.0)
+    t = np.clip(dot / safe_length_squared, 0.0, 1.0)
+    t = np.where(length_squared > 0.0, t, 0.0)[..., np.newaxis]
+    points = p0 + diff1 * t
+    return points
+
+def find_closest_points_on_segments(points, segments):
+    # Finds the closest point on all segments for each point. Ties resolve to
+    # the lowest segment index.
+    points = np.asarray(points, np.float64)
+    segments = np.asarray(segments, np.float64)
+    closest_points = np.zeros((len(points), 2), np.float64)
+    indices = np.full(len(points), -1, np.int64)
+    if (len(points) == 0) or (len(segments) == 0):
+        return closest_points, indices
+
+    for s in iterate_chunks(len(points), len(segments)):
+        p = points[s, np.newaxis]
+        chunk_points = find_closest_points(segments[np.newaxis, :, 0], segments[np.newaxis, :, 1], p)
+        distances = np.sum((chunk_points - p) ** 2, axis=-1)
+        chunk_indices = np.argmin(distances, axis=1)
+        closest_points[s] = chunk_points[np.arange(len(chunk_indices)), chunk_indices]
+        indices[s] = chunk_indices
+    return closest_points, indices
+
+def find_closest_vert_indices(points, vert_coords):
+    points = np.asarray(points, np.float64)
+    vert_coords = np.asarray(vert_coords, np.float64)
+    indices = np.full(len(points), -1, np.int64)
+    if (len(points) == 0) or (len(vert_coords) == 0):
+        return indices
+
+    for s in iterate_chunks(len(points), len(vert_coords)):
+        distances = np.sum((vert_coords[np.newaxis] - points[s, np.newaxis]) ** 2, axis=-1)
+        indices[s] = np.argmin(distances, axis=1)
+    return indices
+
+def create_padded_polygons(vert_coords, loop_vert_indices, loop_starts, loop_totals):
+    vert_coords = np.asarray(vert_coords, np.float64)
+    loop_vert_indices = np.asarray(loop_vert_indices, np.int64)
+    loop_starts = np.asarray(loop_starts, np.int64)
+    loop_totals = np.asarray(loop_totals, np.int64)
+    if len(loop_starts) == 0:
+        return np.zeros((0, 0, 2), np.float64)
+
+    k = np.arange(loop_totals.max())
+    loop_indices = np.where(k[np.newaxis] < loop_totals[:, np.newaxis], loop_starts[:, np.newaxis] + k[np.newaxis], loop_starts[:, np.newaxis])
+    polygons = vert_coords[loop_vert_indices[loop_indices]]
+    return polygons
+
+def compute_winding_nums(current_coords, next_coords, points):
+    # Returns (N, M) winding numbers of the M polygons with the given edges
+    # around the N points, without chunking.
+    p = points[:, np.newaxis, np.newaxis]
+    py = p[..., 1]
+    current_y = current_coords[np.newaxis, ..., 1]
+    next_y = next_coords[np.newaxis, ..., 1]
+    b_are_upward = (current_y <= py) & (next_y > py)
+    b_are_downward = (current_y > py) & (next_y <= py)
+
+    dy = next_y - current_y
+    safe_dy = np.where(dy != 0.0, dy, 1.0)
+    t = (py - current_y) / safe_dy
+    b_are_left = p[..., 0] < current_coords[np.newaxis, ..., 0] + t * (next_coords[np.newaxis, ..., 0] - current_coords[np.newaxis, ..., 0])
+
+    val = (b_are_upward & b_are_left).astype(np.int64) - (b_are_downward & b_are_left).astype(np.int64)
+    return np.sum(val, axis=-1)
+
+def find_winding_nums(polygons, points):
+    # Returns (N, M) winding numbers of M polygons around N points. The
+    # result itself is N * M, so callers with many polygons should reduce
+    # per chunk instead, see find_closest_contained_vert_indices.
+    polygons = np.asarray(polygons, np.float64)
+    points = np.asarray(points, np.float64)
+    winding_nums = np.zeros((len(points), len(polygons)), np.int64)
+    if (len(points) == 0) or (len(polygons) == 0):
+        return winding_nums
+
+    next_coords = np.roll(polygons, -1, axis=1)
+    for s in iterate_chunks(len(points), polygons.shape[0] * polygons.shape[1]):
+        winding_nums[s] = compute_winding_nums(polygons, next_coords, points[s])
+    return winding_nums
+
+def polygons_contain_points(polygons, points):
+    return find_winding_nums(polygons, points) != 0
+
+def find_closest_contained_vert_indices(polygons, points):
+    # Finds the closest vert of the polygons containing each point. Returns
+    # the polygon index and the vert index in the polygon, or -1 for points
+    # outside every polygon. Ties resolve to the lowest polygon index. Only
+    # the chunk is N * M, so memory stays O(N + chunk).
+    polygons = np.asarray(polygons, np.float64)
+    points = np.asarray(points, np.float64)
+    polygon_indices = np.full(len(points), -1, np.int64)
+    vert_indices = np.full(len(points), -1, np.int64)
+    if (len(points) == 0) or (len(polygons) == 0):
+        return polygon_indices, vert_indices
+
+    vert_count = polygons.shape[1]
+    next_coords = np.roll(polygons, -1, axis=1)
+    for s in iterate_chunks(len(points), polygons.shape[0] * vert_count):
+        b_are_contained = compute_winding_nums(polygons, next_coords, points[s]) != 0
+        distances = np.sum((polygons[np.newaxis] - points[s, np.newaxis, np.newaxis]) ** 2, axis=-1)
+        distances[~b_are_contained] = np.inf
+        distances = distances.reshape(len(distances), -1)
+        # The padding repeats the first vert, so the first occurrence of the
+        # minimum is always a real vert.
+        chunk_indices = np.argmin(distances, axis=1)
+        b_are_found = np.isfinite(distances[np.arange(len(chunk_indices)), chunk_indices])
+        polygon_indices[s] = np.where(b_are_found, chunk_indices // vert_count, -1)
+        vert_indices[s] = np.where(b_are_found, chunk_indices % vert_count, -1)
+    return polygon_indices, vert_indices
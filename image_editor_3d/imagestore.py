@@ -0,0 +1,216 @@
+import hashlib
+import os
+import shutil
+import time
+
+import bpy
+
+from . import dobj, profiling, properties
+
+
+# Content-addressed store for images generated by the add-on, e.g. the dummy
+# and overlay images. Images are referenced by path instead of being packed,
+# so saves and undo steps do not carry their pixels, and identical content is
+# stored once across scenes and files.
+#
+# Files are named by the digest of their content. The index maps generation
+# keys to file names, so generated images are found without reading them,
+# and records the file names referenced by each saved .blend file for the
+# garbage collection.
+
+STORE_DIR_NAME = "image_store"
+INDEX_FILE_NAME = "index.json"
+# ID property of images loaded with a generation key, so their files can be
+# found again when the path does not exist.
+STORE_KEY_KEY = "ie3_store_key"
+# Files used within this period are kept by the garbage collection even if no
+# saved file is known to reference them, e.g. those of copied .blend files.
+# Adding or loading a file counts as a use.
+GARBAGE_GRACE_PERIOD = 30 * 24 * 60 * 60
+
+class StoreIndex(dobj.Dobj):
+    def __init__(self):
+        self.keys = {}
+        self.references = {}
+
+    def to_dict(self):
+        d = {
+            "keys": self.keys,
+            "references": self.references,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.keys = d["keys"]
+        instance.references = d["references"]
+        return instance
+
+index = None
+# Store file path -> image name, so loaded images are found without
+# scanning bpy.data.images.
+image_names = {}
+
+def get_store_dir_path():
+    store_dir_path = os.path.join(properties.get_data_dir_path(), STORE_DIR_NAME)
+    os.makedirs(store_dir_path, exist_ok=True)
+    return store_dir_path
+
+def get_index():
+    global index
+    if index is None:
+        index = StoreIndex()
+        index_file_path = os.path.join(get_store_dir_path(), INDEX_FILE_NAME)
+        if os.path.isfile(index_file_path):
+            loaded_index, e = dobj.read_dobj(index_file_path, StoreIndex)
+            if not e:
+                index = loaded_index
+    return index
+
+def write_index():
+    return dobj.write_dobj(get_index(), os.path.join(get_store_dir_path(), INDEX_FILE_NAME))
+
+def get_store_file_path(store_file_name):
+    return os.path.join(get_store_dir_path(), store_file_name[:2], store_file_name)
+
+def find_file(key):
+    store_file_name = get_index().keys.get(key)
+    if not store_file_name:
+        return None
+    store_file_path = get_store_file_path(store_file_name)
+    if not os.path.isfile(store_file_path):
+        return None
+    return store_file_path
+
+def add_file(file_path, key=None, b_move=False):
+    with open(file_path, "rb") as file:
+        digest = hashlib.file_digest(file, "sha1").hexdigest()
+    store_file_name = digest + os.path.splitext(file_path)[1].lower()
+    store_file_path = get_store_file_path(store_file_name)
+
+    if os.path.isfile(store_file_path):
+        if b_move:
+            os.remove(file_path)
+        touch_file(store_file_path)
+    else:
+        os.makedirs(os.path.dirname(store_file_path), exist_ok=True)
+        if b_move:
+            os.replace(file_path, store_file_path)
+        else:
+            temp_file_path = f"{store_file_path}.tmp"
+            shutil.copyfile(file_path, temp_file_path)
+            os.replace(temp_file_path, store_file_path)
+
+    if key and (get_index().keys.get(key) != store_file_name):
+        get_index().keys[key] = store_file_name
+        write_index()
+
+    return store_file_path
+
+def touch_file(store_file_path):
+    try:
+        os.utime(store_file_path)
+    except OSError:
+        pass
+
+def load_image(store_file_path, key=None):
+    image_name = image_names.get(store_file_path)
+    if image_name:
+        image = bpy.data.images.get(image_name)
+        if (image is not None) and (image.filepath == store_file_path):
+            return image
+
+    image = bpy.data.images.load(store_file_path, check_existing=True)
+    touch_file(store_file_path)
+    if key:
+        image[STORE_KEY_KEY] = key
+    image_names[store_file_path] = image.name
+    return image
+
+def is_store_file_path(file_path):
+    store_dir_path = get_store_dir_path()
+    return os.path.commonpath([store_dir_path, os.path.abspath(file_path)]) == store_dir_path
+
+def find_referenced_file_names():
+    file_names = set()
+    for image in bpy.data.images:
+        if image.packed_file or (not image.filepath):
+            continue
+        # Images loaded from the texture cache reference their source.
+        for file_path in [image.filepath, properties.get_image_source_file_path(image)]:
+            file_path = bpy.path.abspath(file_path, library=image.library)
+            if is_store_file_path(file_path):
+                file_names.add(os.path.basename(file_path))
+    return file_names
+
+def record_references():
+    if not bpy.data.filepath:
+        return
+    file_names = sorted(find_referenced_file_names())
+    references = get_index().references
+    if references.get(bpy.data.filepath) == file_names:
+        return
+    if file_names:
+        references[bpy.data.filepath] = file_names
+    else:
+        references.pop(bpy.data.filepath, None)
+    write_index()
+
+@bpy.app.handlers.persistent
+def record_references_handler(*args):
+    with profiling.span("imagestore.record_references"):
+        record_references()
+
+def find_garbage_files():
+    # Returns the (file path, size) of the files referenced neither by the
+    # current session nor by any saved .blend file which still exists, and
+    # not used within GARBAGE_GRACE_PERIOD.
+    record_references()
+
+    store_index = get_index()
+    file_names = find_referenced_file_names()
+    for blend_file_path, referenced_file_names in store_index.references.items():
+        if os.path.isfile(blend_file_path):
+            file_names.update(referenced_file_names)
+
+    garbage_files = []
+    min_used_time = time.time() - GARBAGE_GRACE_PERIOD
+    for dir_entry in os.scandir(get_store_dir_path()):
+        if not dir_entry.is_dir():
+            continue
+        for file_entry in os.scandir(dir_entry.path):
+            if file_entry.name in file_names:
+                continue
+            st = file_entry.stat()
+            if st.st_mtime >= min_used_time:
+                continue
+            garbage_files.append((file_entry.path, st.st_size))
+    return garbage_files
+
+def collect_garbage():
+    # Removes the files of find_garbage_files. Returns the removed file count
+    # and size.
+    garbage_files = find_garbage_files()
+
+    store_index = get_index()
+    for blend_file_path in list(store_index.references.keys()):
+        if not os.path.isfile(blend_file_path):
+            del store_index.references[blend_file_path]
+    garbage_file_names = {os.path.basename(p) for p, _ in garbage_files}
+    for key, store_file_name in list(store_index.keys.items()):
+        if store_file_name in garbage_file_names:
+            del store_index.keys[key]
+    write_index()
+
+    removed_file_count = 0
+    removed_size = 0
+    for file_path, size in garbage_files:
+        os.remove(file_path)
+        removed_file_count += 1
+        removed_size += size
+        dir_path = os.path.dirname(file_path)
+        if not os.listdir(dir_path):
+            os.rmdir(dir_path)
+
+    return removed_file_count, removed_size
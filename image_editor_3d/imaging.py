@@ -0,0 +1,191 @@
+import os
+
+import numpy as np
+import OpenImageIO as oiio
+
+
+# Image file helpers depending on OpenImageIO and NumPy. This module is
+# imported on first use so that registering the add-on does not load them.
+
+def write_solid_image(file_path, size, opacity):
+    spec = oiio.ImageSpec(size, size, 4, "float")
+    pixels = np.zeros((size, size, 4), np.float64)
+    pixels[:, :, 3] = opacity
+    output = oiio.ImageOutput.create(file_path)
+    output.open(file_path, spec)
+    output.write_image(pixels)
+    output.close()
+
+OVERLAY_FILL_OPACITY = 0.25
+
+def find_uv_tile_layout(vert_coords, segments, loop_vert_indices, loop_starts, loop_totals, uv_tile_coord):
+    # Returns the edges and the face outlines of a UV layout within the tile,
+    # relative to the tile, for write_overlay_image. Edges belong to the
+    # tiles their centers are in, borders included, and faces to the tile
+    # their centers are in.
+    from . import compositor
+
+    tile_origin = np.asarray(uv_tile_coord[:2], np.float64)
+    edge_coords = np.asarray(segments, np.float64).reshape(-1, 2, 2) - tile_origin
+    edge_centers = edge_coords.mean(axis=1)
+    edge_coords = edge_coords[np.all((edge_centers >= 0.0) & (edge_centers <= 1.0), axis=1)]
+
+    vert_coords = np.asarray(vert_coords, np.float64).reshape(-1, 2) - tile_origin
+    loop_vert_indices = np.asarray(loop_vert_indices, np.int64)
+    loop_starts = np.asarray(loop_starts, np.int64)
+    loop_totals = np.asarray(loop_totals, np.int64)
+    face_indices = np.repeat(np.arange(len(loop_totals)), loop_totals)
+    face_loop_indices = loop_starts[face_indices] + np.arange(len(face_indices)) - np.repeat(np.cumsum(loop_totals) - loop_totals, loop_totals)
+    face_vert_indices = loop_vert_indices[face_loop_indices]
+    face_centers = np.zeros((len(loop_totals), 2), np.float64)
+    np.add.at(face_centers, face_indices, vert_coords[face_vert_indices])
+    face_centers /= np.maximum(loop_totals, 1)[:, np.newaxis]
+    b_are_in_tile = np.all(np.floor(face_centers) == 0.0, axis=1)
+    outline_edge_coords = compositor.create_outline_edges(vert_coords, face_vert_indices[b_are_in_tile[face_indices]], loop_totals[b_are_in_tile])
+
+    return edge_coords, outline_edge_coords
+
+def write_overlay_image(file_path, size, edge_coords, outline_edge_coords, border_width):
+    # Draws the UV layout of a tile like "Export UV Layout", with the faces
+    # filled by OVERLAY_FILL_OPACITY and a border. edge_coords are the (E, 2,
+    # 2) UVs of the edges within the tile and outline_edge_coords those of the
+    # face outlines, both relative to the tile. The image only depends on the
+    # arguments, so it can be generated again from the UvLayout mesh.
+    from . import compositor
+
+    pixels = np.zeros((size, size, 4), np.float32)
+
+    # Pixel coords with the pixel centers at integer coords, rows from the top.
+    def to_pixel_coords(coords):
+        pixel_coords = np.empty_like(coords)
+        pixel_coords[..., 0] = coords[..., 0] * size - 0.5
+        pixel_coords[..., 1] = (1.0 - coords[..., 1]) * size - 0.5
+        return pixel_coords
+
+    fill_mask = compositor.fill_even_odd(to_pixel_coords(np.asarray(outline_edge_coords, np.float64)), size, size)
+    pixels[fill_mask] = (1.0, 1.0, 1.0, OVERLAY_FILL_OPACITY)
+
+    # Edges are drawn by a sample per pixel of their length.
+    edges = to_pixel_coords(np.asarray(edge_coords, np.float64))
+    if len(edges):
+        lengths = np.abs(edges[:, 1] - edges[:, 0]).max(axis=1)
+        sample_counts = np.ceil(lengths).astype(np.int64) + 1
+        edge_indices = np.repeat(np.arange(len(edges)), sample_counts)
+        sample_indices = np.arange(len(edge_indices)) - np.repeat(np.cumsum(sample_counts) - sample_counts, sample_counts)
+        ts = (sample_indices / np.maximum(sample_counts - 1, 1)[edge_indices])[:, np.newaxis]
+        points = np.rint(edges[edge_indices, 0] * (1.0 - ts) + edges[edge_indices, 1] * ts).astype(np.int64)
+        b_is_inside = (points[:, 0] >= 0) & (points[:, 0] < size) & (points[:, 1] >= 0) & (points[:, 1] < size)
+        pixels[points[b_is_inside, 1], points[b_is_inside, 0]] = 1.0
+
+    for i in range(border_width):
+        pixels[i, :] = 1.0
+        pixels[size - i - 1, :] = 1.0
+        pixels[:, i] = 1.0
+        pixels[:, size - i - 1] = 1.0
+
+    spec = oiio.ImageSpec(size, size, 4, "uint8")
+    spec.attribute("oiio:UnassociatedAlpha", 1)
+    output = oiio.ImageOutput.create(file_path)
+    output.open(file_path, spec)
+    output.write_image(pixels)
+    output.close()
+
+def create_procedural_preview_pixels(size, params):
+    # Returns the flat sRGB straight RGBA pixels of a preview image, rows from
+    # the bottom as in Blender images.
+    from . import compositor, procedural
+
+    ys, xs = np.mgrid[0:size, 0:size]
+    uvs = np.stack([(xs.ravel() + 0.5) / size, (ys.ravel() + 0.5) / size], axis=1)
+    pixels = procedural.evaluate(params, uvs)
+    pixels[:, :3] = compositor.linear_to_srgb(pixels[:, :3])
+    return np.clip(pixels, 0.0, 1.0).astype(np.float32).ravel()
+
+CHANNEL_ORDER = ["R", "G", "B", "A"]
+
+def group_channel_names(channel_names):
+    # Returns (name, channel indices) per layer of the channel names, e.g.
+    # "albedo" for "albedo.R". Channels are ordered as RGBA, and an alpha
+    # without a layer is shared by the layers without their own alpha.
+    groups = {}
+    for i, channel_name in enumerate(channel_names):
+        group_name, _, suffix = channel_name.rpartition(".")
+        groups.setdefault(group_name, []).append((suffix, i))
+
+    root_channels = groups.get("", [])
+    if (len(groups) > 1) and (len(root_channels) == 1) and (root_channels[0][0] == "A"):
+        del groups[""]
+        for group_name, channels in groups.items():
+            if not "A" in [suffix for suffix, _ in channels]:
+                channels.append(root_channels[0])
+
+    channel_groups = []
+    for group_name, channels in groups.items():
+        if all(suffix in CHANNEL_ORDER for suffix, _ in channels):
+            channels.sort(key=lambda c: CHANNEL_ORDER.index(c[0]))
+        channel_groups.append((group_name, [i for _, i in channels[:4]]))
+    return channel_groups
+
+def split_layered_image(file_path, output_dir_path):
+    # Yields (part name, [(channel group name, file path, has alpha)]) for
+    # every part (subimage) of a layered file from the bottom, writing an
+    # image per channel group. Parts are read one channel at a time, so only
+    # one channel group of them is in memory. Float parts are written as EXR
+    # and the others as straight alpha PNG. The first subimage of a PSD is
+    # the merged image and is skipped.
+    config = oiio.ImageSpec()
+    config.attribute("oiio:UnassociatedAlpha", 1)
+    image_input = oiio.ImageInput.open(file_path, config)
+    if not image_input:
+        raise RuntimeError(f"Failed to read \"{file_path}\": {oiio.geterror()}")
+    try:
+        subimage = 1 if image_input.format_name() == "psd" else 0
+        while image_input.seek_subimage(subimage, 0):
+            spec = image_input.spec()
+            part_name = spec.getattribute("oiio:subimagename") or f"Part{subimage}"
+            b_is_float = spec.format.basetype in [oiio.HALF, oiio.FLOAT, oiio.DOUBLE]
+            ext = ".exr" if b_is_float else ".png"
+
+            channel_files = []
+            for group_index, (group_name, channel_indices) in enumerate(group_channel_names(spec.channelnames)):
+                # Layers of a PSD only cover their bounds.
+                full_pixels = None
+                x = spec.x - spec.full_x
+                y = spec.y - spec.full_y
+                xbegin = max(0, x)
+                ybegin = max(0, y)
+                xend = min(spec.full_width, x + spec.width)
+                yend = min(spec.full_height, y + spec.height)
+                for k, channel_index in enumerate(channel_indices):
+                    pixels = image_input.read_image(subimage, 0, channel_index, channel_index + 1, spec.format)
+                    if pixels is None:
+                        raise RuntimeError(f"Failed to read \"{file_path}\": {image_input.geterror()}")
+                    pixels = pixels.reshape(spec.height, spec.width)
+                    if full_pixels is None:
+                        full_pixels = np.zeros((spec.full_height, spec.full_width, len(channel_indices)), pixels.dtype)
+                    if (xbegin < xend) and (ybegin < yend):
+                        full_pixels[ybegin:yend, xbegin:xend, k] = pixels[ybegin - y:yend - y, xbegin - x:xend - x]
+                    del pixels
+
+                output_file_path = os.path.join(output_dir_path, f"layered_{subimage}_{group_index}{ext}")
+                output_spec = oiio.ImageSpec(spec.full_width, spec.full_height, len(channel_indices), spec.format)
+                output_spec.channelnames = tuple(spec.channelnames[i].rpartition(".")[2] for i in channel_indices)
+                output_spec.attribute("oiio:UnassociatedAlpha", 1)
+                output = oiio.ImageOutput.create(output_file_path)
+                if not output:
+                    raise RuntimeError(f"Failed to create \"{output_file_path}\": {oiio.geterror()}")
+                if not output.open(output_file_path, output_spec):
+                    raise RuntimeError(f"Failed to open \"{output_file_path}\": {output.geterror()}")
+                try:
+                    if not output.write_image(full_pixels):
+                        raise RuntimeError(f"Failed to write \"{output_file_path}\": {output.geterror()}")
+                finally:
+                    output.close()
+                del full_pixels
+
+                channel_files.append((group_name, output_file_path, "A" in output_spec.channelnames))
+
+            yield part_name, channel_files
+            subimage += 1
+    finally:
+        image_input.close()
@@ -0,0 +1,217 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import bpy
+
+from . import cli, dobj, properties
+
+
+# Usage:
+#   blender -b --python-expr "import importlib; importlib.import_module('bl_ext.user_default.image_editor_3d.jobs').main()" -- queue.json
+#
+# queue.json:
+#   {"jobs": [{"blend_file_path": "a.blend", "settings_file_path": "a.json", "directory": "out/a"}, ...]}
+#
+# Finished jobs are recorded next to the queue file and every job resumes
+# from the manifests in its output directory, so running the same command
+# again continues where the previous run stopped.
+
+POLL_INTERVAL = 0.5
+BASE_JOB_MEMORY = 1024 ** 3
+DEFAULT_RESOLUTION = 4096
+
+class ExportJob(dobj.Dobj):
+    def __init__(self):
+        self.blend_file_path = ""
+        self.scene_name = ""
+        self.settings_file_path = ""
+        self.directory = ""
+        self.tiles = ""
+        self.maps = ""
+        self.resolution = 0
+
+    def to_dict(self):
+        d = {
+            "blend_file_path": self.blend_file_path,
+            "scene_name": self.scene_name,
+            "settings_file_path": self.settings_file_path,
+            "directory": self.directory,
+            "tiles": self.tiles,
+            "maps": self.maps,
+            "resolution": self.resolution,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.blend_file_path = d["blend_file_path"]
+        instance.scene_name = d.get("scene_name", "")
+        instance.settings_file_path = d.get("settings_file_path", "")
+        instance.directory = d["directory"]
+        instance.tiles = d.get("tiles", "")
+        instance.maps = d.get("maps", "")
+        instance.resolution = d.get("resolution", 0)
+        return instance
+
+    def get_key(self):
+        return "|".join([os.path.abspath(self.blend_file_path), self.scene_name, os.path.abspath(self.directory)])
+
+    def get_report_file_path(self):
+        return os.path.join(self.directory, "ie3_report.json")
+
+    def estimate_memory(self):
+        resolution = self.resolution
+        if (not resolution) and self.settings_file_path:
+            scene_setting_group, e = dobj.read_dobj(self.settings_file_path, properties.SceneSettingGroup)
+            if not e:
+                resolution = int(scene_setting_group.resolution)
+        if not resolution:
+            resolution = DEFAULT_RESOLUTION
+
+        # Render result, display buffer and write buffer of one RGBA float frame
+        # plus a margin for textures.
+        frame_memory = resolution * resolution * 4 * 4
+        return BASE_JOB_MEMORY + frame_memory * 4
+
+    def create_command(self, blender_file_path, thread_count):
+        python_expr = f"import importlib; importlib.import_module('{cli.__name__}').main()"
+        argv = [
+            "--output", self.directory,
+            "--report", self.get_report_file_path(),
+            "--resume",
+        ]
+        if self.scene_name:
+            argv += ["--scene", self.scene_name]
+        if self.settings_file_path:
+            argv += ["--settings", self.settings_file_path]
+        if self.tiles:
+            argv += ["--tiles", self.tiles]
+        if self.maps:
+            argv += ["--maps", self.maps]
+        if self.resolution:
+            argv += ["--resolution", str(self.resolution)]
+
+        command = [blender_file_path, "-b", self.blend_file_path, "-t", str(thread_count), "--python-expr", python_expr, "--"] + argv
+        return command
+
+class ExportJobQueue(dobj.Dobj):
+    def __init__(self):
+        self.jobs = []
+
+    def to_dict(self):
+        d = {
+            "jobs": dobj.dobjs_to_dicts(self.jobs),
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.jobs = dobj.dicts_to_dobjs(d["jobs"], ExportJob)
+        return instance
+
+class ExportJobQueueState(dobj.Dobj):
+    def __init__(self):
+        self.completed_job_keys = []
+
+    def to_dict(self):
+        d = {
+            "completed_job_keys": self.completed_job_keys,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.completed_job_keys = d["completed_job_keys"]
+        return instance
+
+def get_total_memory():
+    try:
+        return os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES")
+    except (ValueError, OSError, AttributeError):
+        return 16 * 1024 ** 3
+
+def run_jobs(jobs, state, state_file_path, max_job_count, memory_budget, blender_file_path):
+    thread_count = max(1, (os.cpu_count() or 1) // max_job_count)
+
+    pending_jobs = [j for j in jobs if not j.get_key() in state.completed_job_keys]
+    running_jobs = []
+    failed_jobs = []
+    while pending_jobs or running_jobs:
+        while pending_jobs and (len(running_jobs) < max_job_count):
+            job = pending_jobs[0]
+            job_memory = job.estimate_memory()
+            used_memory = sum([m for _, _, m in running_jobs])
+            # A job larger than the whole budget still runs, but alone.
+            if running_jobs and (used_memory + job_memory > memory_budget):
+                break
+
+            pending_jobs.pop(0)
+            os.makedirs(job.directory, exist_ok=True)
+            print(f"Start: {job.get_key()}")
+            process = subprocess.Popen(job.create_command(blender_file_path, thread_count), stdout=subprocess.DEVNULL)
+            running_jobs.append((job, process, job_memory))
+
+        time.sleep(POLL_INTERVAL)
+
+        for running_job in list(running_jobs):
+            job, process, _ = running_job
+            return_code = process.poll()
+            if return_code is None:
+                continue
+
+            running_jobs.remove(running_job)
+            if return_code == cli.EXIT_SUCCESS:
+                print(f"Done: {job.get_key()}")
+                state.completed_job_keys.append(job.get_key())
+                dobj.write_dobj(state, state_file_path)
+            else:
+                print(f"Failed ({return_code}): {job.get_key()}", file=sys.stderr)
+                failed_jobs.append(job)
+
+    return failed_jobs
+
+def main(argv=None):
+    if argv is None:
+        argv = cli.get_script_argv()
+
+    parser = argparse.ArgumentParser(prog="image_editor_3d.jobs", description="Export maps of multiple Image Editor 3D scenes.")
+    parser.add_argument("queue", help="Job queue JSON file path")
+    parser.add_argument("--max-jobs", type=int, default=os.cpu_count() or 1, help="Maximum number of jobs running at the same time")
+    parser.add_argument("--memory-budget", type=int, default=0, help="Memory budget in MB for all running jobs (default: 75%% of the physical memory)")
+    parser.add_argument("--blender", default=bpy.app.binary_path, help="Blender executable")
+    parser.add_argument("--restart", action="store_true", help="Ignore jobs recorded as completed")
+    args = parser.parse_args(argv)
+
+    job_queue, e = dobj.read_dobj(args.queue, ExportJobQueue)
+    if e:
+        print(str(e), file=sys.stderr)
+        sys.exit(cli.EXIT_USAGE)
+
+    state_file_path = f"{os.path.splitext(args.queue)[0]}_state.json"
+    state = ExportJobQueueState()
+    if (not args.restart) and os.path.isfile(state_file_path):
+        state, e = dobj.read_dobj(state_file_path, ExportJobQueueState)
+        if e:
+            print(str(e), file=sys.stderr)
+            sys.exit(cli.EXIT_USAGE)
+
+    memory_budget = args.memory_budget * 1024 ** 2
+    if not memory_budget:
+        memory_budget = get_total_memory() * 3 // 4
+
+    failed_jobs = run_jobs(job_queue.jobs, state, state_file_path, max(1, args.max_jobs), memory_budget, args.blender)
+
+    summary = {
+        "completed_job_keys": state.completed_job_keys,
+        "failed_job_keys": [j.get_key() for j in failed_jobs],
+    }
+    print(json.dumps(summary, indent=4))
+    sys.stdout.flush()
+    sys.exit(cli.EXIT_FAILURE if failed_jobs else cli.EXIT_SUCCESS)
@@ -0,0 +1,39 @@
+from enum import StrEnum
+
+
+# Types of layers and maps shared by the Blender properties and by the
+# modules reading snapshots without Blender. This module depends only on the
+# standard library.
+
+class SpecialMapType(StrEnum):
+    Opacity = "Opacity"
+
+class LayerObjType(StrEnum):
+    Invalid = "Invalid"
+    Basic = "Basic"
+    Image = "Image"
+    Overlay = "Overlay"
+    Procedural = "Procedural"
+
+class BlendMode(StrEnum):
+    Normal = "Normal"
+    Multiply = "Multiply"
+    Screen = "Screen"
+    Overlay = "Overlay"
+    SoftLight = "SoftLight"
+    HardLight = "HardLight"
+    Add = "Add"
+    Subtract = "Subtract"
+    Darken = "Darken"
+    Lighten = "Lighten"
+    Difference = "Difference"
+
+# Layers drawn into the exported maps.
+COMPOSITED_LAYER_OBJ_TYPES = [
+    LayerObjType.Image,
+    LayerObjType.Procedural,
+    LayerObjType.Basic,
+]
+
+# Value of the maps missing in the table, the same as the dummy image.
+DEFAULT_BASIC_VALUE = (0.0, 0.0, 0.0)
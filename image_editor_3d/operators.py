@@ -1,36 +1,55 @@
 import glob
+import math
 import os
-import re
-import sys
+import time
 from enum import StrEnum
 
 import bmesh
 import bpy
 import mathutils
-import OpenImageIO as oiio
 
-from . import dobj, properties
+from . import dobj, error, export, imagestore, preview, profiling, properties, snapshot
 
 
+@profiling.profiled("active_obj_changed")
 def active_obj_changed():
     ie3 = bpy.context.scene.ie3
     ie3.b_is_initializing_image_obj_properties = True
 
+    if properties.get_obj_type(bpy.context.active_object) == properties.ObjType.LayerGroup:
+        ie3.group_opacity = properties.LayerGroupObjWrapper(bpy.context.active_object).get_opacity()
+        ie3.b_is_initializing_image_obj_properties = False
+        return
+
     layer_obj_type = properties.get_layer_obj_type(bpy.context.active_object)
-    if layer_obj_type != properties.LayerObjType.Image:
+    if layer_obj_type == properties.LayerObjType.Basic:
+        basic_layer_obj_wrapper = properties.BasicLayerObjWrapper(bpy.context.active_object)
+        ie3.basic_value = basic_layer_obj_wrapper.get_value(ie3.display_map_name)
+        ie3.opacity = basic_layer_obj_wrapper.get_opacity()
+        ie3.b_is_initializing_image_obj_properties = False
+        return
+    if not layer_obj_type in [properties.LayerObjType.Image, properties.LayerObjType.Procedural]:
         return
 
     image_obj_wrapper = properties.ImageObjWrapper(bpy.context.active_object)
 
-    for map_data in ie3.map_data_list:
-        m = image_obj_wrapper.obj[map_data.internal_name]
-        map_data.file_path = m.filepath
+    if layer_obj_type == properties.LayerObjType.Image:
+        maps = image_obj_wrapper.get_maps()
+        for map_data in ie3.map_data_list:
+            file_path = ""
+            if map_data.internal_name in maps:
+                file_path = properties.get_image_source_file_path(maps[map_data.internal_name])
+            if map_data.file_path != file_path:
+                map_data.file_path = file_path
+    else:
+        ie3.apply_procedural_params(properties.ProceduralLayerObjWrapper(bpy.context.active_object).get_params())
 
     ie3.b_use_grayscale_as_opacity = image_obj_wrapper.get_b_use_grayscale_as_opacity()
     ie3.mapping_location = image_obj_wrapper.get_mapping_location()
     ie3.mapping_rotation = image_obj_wrapper.get_mapping_rotation()
     ie3.mapping_scale = image_obj_wrapper.get_mapping_scale()
     ie3.opacity = image_obj_wrapper.get_opacity()
+    ie3.blend_mode = image_obj_wrapper.get_blend_mode().name
 
     uv_layout_objs = properties.find_objs_with_type(properties.ObjType.UvLayout)
     if uv_layout_objs:
@@ -43,16 +62,33 @@ class OT_StartEditing(bpy.types.Operator):
     bl_idname = "scene.start_editing"
     bl_label = "Start editing"
 
+    def create_raster_overlay_obj(self, uv_layout_mesh, uv_tile_num, uv_tile_coord, addon_collection, ie3):
+        with profiling.span("OT_StartEditing.create_overlay"):
+            key, store_file_path = properties.find_overlay_image_file(uv_layout_mesh, uv_tile_num)
+            overlay = imagestore.load_image(store_file_path, key=key)
+
+        overlay_obj = bpy.data.objects.new(f"Overlay_{uv_tile_num}", None)
+        addon_collection.objects.link(overlay_obj)
+        overlay_obj.empty_display_type = "IMAGE"
+        overlay_obj.data = overlay
+        overlay_obj.empty_image_offset = [0.0, 0.0]
+        overlay_obj.use_empty_image_alpha = True
+        overlay_obj.color = [1.0, 1.0, 1.0, ie3.overlay_opacity]
+        overlay_obj.hide_select = True
+        overlay_obj.hide_render = True
+        overlay_obj.location = properties.uv_tile_coord_to_location(uv_tile_coord) - mathutils.Vector((0.5, 0.5, 0.0))
+        properties.set_obj_type(overlay_obj, properties.ObjType.Layer)
+        properties.set_layer_obj_type(overlay_obj, properties.LayerObjType.Overlay)
+
+        return overlay_obj
+
     def execute(self, context):
-        user_dir_path = properties.get_user_dir_path()
-        # self.report({"INFO"}, f"User Dir Path: {user_dir_path}")
+        overlay_mode = properties.OverlayMode(context.scene.ie3.overlay_mode)
 
         uv_bm = bmesh.new()
+        uv_tile_nums = set()
 
         if context.active_object and (context.active_object.type == "MESH"):
-            uv_layout_file_path = os.path.join(user_dir_path, "UvLayout.png")
-            bpy.ops.uv.export_layout(filepath=uv_layout_file_path, export_tiles="UDIM")
-
             bm = bmesh.new()
             bm.from_mesh(context.active_object.data)
 
@@ -64,67 +100,38 @@ class OT_StartEditing(bpy.types.Operator):
                     uv_verts.append(uv_vert)
                 uv_bm.faces.new(uv_verts)
 
+                # Tiles are the tiles of the face centers.
+                face_center = sum([v.co for v in uv_verts], mathutils.Vector()) / len(uv_verts)
+                uv_tile_coord = [math.floor(face_center.x), math.floor(face_center.y)]
+                if (0 <= uv_tile_coord[0] < 10) and (0 <= uv_tile_coord[1]):
+                    uv_tile_nums.add(properties.uv_tile_coord_to_num(uv_tile_coord))
+
             bm.free()
 
         new_scene = bpy.data.scenes.new("Image Editor 3D")
         new_scene.ie3.b_is_editor_scene = True
+        new_scene.ie3.overlay_mode = overlay_mode.name
         new_scene.render.film_transparent = True
         new_scene.view_settings.view_transform = "Standard"
-        bpy.context.window.scene = new_scene
-        bpy.context.space_data.shading.type = "RENDERED"
-        bpy.ops.view3d.view_axis(type="TOP")
+        if context.window:
+            context.window.scene = new_scene
+        if context.space_data and (context.space_data.type == "VIEW_3D"):
+            context.space_data.shading.type = "RENDERED"
+            bpy.ops.view3d.view_axis(type="TOP")
 
         addon_collection = bpy.data.collections.new("DO_NOT_EDIT")
-        bpy.context.collection.children.link(addon_collection)
+        new_scene.collection.children.link(addon_collection)
         addon_collection.hide_render = True
 
-        for i in range(properties.BASIC_MAP_COUNT):
-            map_data = new_scene.ie3.map_data_list.add()
-            map_data.type = properties.MapType.Basic.name
-            map_data.internal_name = f"BasicMap{i}"
-            map_data.default_name = f"Map{i + 1}"
-
-        for special_map_type in properties.SpecialMapType:
-            map_data = new_scene.ie3.map_data_list.add()
-            map_data.type = properties.MapType.Special.name
-            map_data.internal_name = special_map_type.name
-            map_data.default_name = special_map_type.name
-
-        re_pattern = re.compile(r"UvLayout\.(\d+)\.png")
-        uv_layout_file_paths = glob.glob(f"{user_dir_path}/UvLayout.*.png")
-        if not uv_layout_file_paths:
-            uv_layout_file_paths = [
-                properties.create_dummy_image("UvLayout.1001.png", 1024, 0.0)
-            ]
+        new_scene.ie3.ensure_basic_map_data_list(new_scene.ie3.basic_map_count)
 
-        for uv_layout_file_path in uv_layout_file_paths:
-            uv_layout_file_name = os.path.basename(uv_layout_file_path)
-            search_result = re_pattern.search(uv_layout_file_name)
-            uv_tile_num = int(search_result.group(1))
-            uv_tile_coord = properties.uv_tile_num_to_coord(uv_tile_num)
+        new_scene.ie3.ensure_special_map_data_list()
 
-            image_buf = oiio.ImageBuf(uv_layout_file_path)
-            image_spec = image_buf.spec()
-            for i in range(3):
-                oiio.ImageBufAlgo.render_box(image_buf, i, i, image_spec.width - i - 1, image_spec.height - i - 1, (1.0, 1.0, 1.0, 1.0))
-            overlay_file_path = os.path.join(user_dir_path, f"Overlay_{uv_tile_num}.png")
-            image_buf.write(overlay_file_path)
-            overlay = bpy.data.images.load(overlay_file_path)
-            overlay.pack()
-            os.remove(overlay_file_path)
-
-            overlay_obj = bpy.data.objects.new(f"Overlay_{uv_tile_num}", None)
-            addon_collection.objects.link(overlay_obj)
-            overlay_obj.empty_display_type = "IMAGE"
-            overlay_obj.data = overlay
-            overlay_obj.empty_image_offset = [0.0, 0.0]
-            overlay_obj.use_empty_image_alpha = True
-            overlay_obj.color = [1.0, 1.0, 1.0, new_scene.ie3.overlay_opacity]
-            overlay_obj.hide_select = True
-            overlay_obj.hide_render = True
-            overlay_obj.location = properties.uv_tile_coord_to_location(uv_tile_coord) - mathutils.Vector((0.5, 0.5, 0.0))
-            properties.set_obj_type(overlay_obj, properties.ObjType.Layer)
-            properties.set_layer_obj_type(overlay_obj, properties.LayerObjType.Overlay)
+        if not uv_tile_nums:
+            uv_tile_nums = {1001}
+
+        for uv_tile_num in sorted(uv_tile_nums):
+            uv_tile_coord = properties.uv_tile_num_to_coord(uv_tile_num)
 
             uv_tile_data = new_scene.ie3.uv_tile_data_list.add()
             uv_tile_data.num = uv_tile_num
@@ -164,11 +171,21 @@ class OT_StartEditing(bpy.types.Operator):
         node_bsdf.inputs[4].default_value = 0.0
         uv_layout_obj.data.materials.append(material)
 
-        layer_objs = properties.find_objs_with_type(properties.ObjType.Layer)
-        properties.sort_layer_objs(layer_objs)
+        # Raster overlays are drawn from the UvLayout mesh, so they can be
+        # generated again when the image store does not have them.
+        if overlay_mode == properties.OverlayMode.Raster:
+            for uv_tile_num in sorted(uv_tile_nums):
+                uv_tile_coord = properties.uv_tile_num_to_coord(uv_tile_num)
+                self.create_raster_overlay_obj(uv_layout_mesh, uv_tile_num, uv_tile_coord, addon_collection, new_scene.ie3)
+        elif overlay_mode == properties.OverlayMode.Vector:
+            overlay_obj = properties.create_vector_overlay_obj(uv_layout_mesh, new_scene.ie3.resolution)
+            addon_collection.objects.link(overlay_obj)
+            overlay_obj.color = [1.0, 1.0, 1.0, new_scene.ie3.overlay_opacity]
+            overlay_obj.hide_select = True
+            overlay_obj.hide_render = True
 
-        for uv_layout_file_path in uv_layout_file_paths:
-            os.remove(uv_layout_file_path)
+        layer_objs = properties.find_objs_with_type(properties.ObjType.Layer, new_scene)
+        properties.sort_layer_objs(layer_objs)
 
         bpy.msgbus.clear_by_owner("ie3")
         bpy.msgbus.subscribe_rna(
@@ -201,22 +218,7 @@ class OT_SaveSceneSettingGroup(bpy.types.Operator):
             self.report({"ERROR"}, "The settings file must be in JSON format.")
             return {"FINISHED"}
 
-        scene_setting_group = properties.SceneSettingGroup()
-        scene_setting_group.map_file_name = ie3.map_file_name
-        scene_setting_group.resolution = ie3.resolution
-        scene_setting_group.basic_map_count = ie3.basic_map_count
-
-        for map_data in ie3.map_data_list:
-            map_setting_group = properties.MapSettingGroup()
-            map_setting_group.internal_name = map_data.internal_name
-            map_setting_group.file_name_keywords = map_data.file_name_keywords
-            t = map_data.get_type()
-            if t == properties.MapType.Basic:
-                map_setting_group.display_name = map_data.display_name
-                map_setting_group.color_depth = map_data.color_depth
-            elif t == properties.MapType.Special:
-                pass
-            scene_setting_group.map_setting_groups.append(map_setting_group)
+        scene_setting_group = ie3.create_scene_setting_group()
 
         error = dobj.write_dobj(scene_setting_group, self.filepath)
         if error:
@@ -245,24 +247,73 @@ class OT_LoadSceneSettingGroup(bpy.types.Operator):
             self.report({"ERROR"}, error)
             return {"FINISHED"}
 
-        ie3.map_file_name = scene_setting_group.map_file_name
-        ie3.resolution = scene_setting_group.resolution
-        ie3.basic_map_count = scene_setting_group.basic_map_count
+        ie3.apply_scene_setting_group(scene_setting_group)
 
-        for map_setting_group in scene_setting_group.map_setting_groups:
-            for map_data in ie3.map_data_list:
-                if map_data.internal_name != map_setting_group.internal_name:
-                    continue
+        return {"FINISHED"}
+
+class OT_ExportSnapshot(bpy.types.Operator):
+    bl_idname = "scene.export_snapshot"
+    bl_label = "Export snapshot"
+
+    filepath: bpy.props.StringProperty(options={"HIDDEN"})
+    filename: bpy.props.StringProperty(options={"HIDDEN"})
+
+    def invoke(self, context, event):
+        self.filename = f"Scene{snapshot.SNAPSHOT_FILE_EXT}"
+        context.window_manager.fileselect_add(self)
+
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        e = snapshot.write_scene_snapshot(context.scene, self.filepath)
+        if e:
+            self.report({"ERROR"}, str(e))
+
+        return {"FINISHED"}
+
+class OT_ImportSnapshot(bpy.types.Operator):
+    bl_idname = "scene.import_snapshot"
+    bl_label = "Import snapshot"
+    bl_options = {"REGISTER", "UNDO"}
+
+    filepath: bpy.props.StringProperty(options={"HIDDEN"})
+    filter_glob: bpy.props.StringProperty(default=f"*{snapshot.SNAPSHOT_FILE_EXT}", options={"HIDDEN"})
+    b_apply_scene_settings: bpy.props.BoolProperty(name="Apply scene settings", default=True)
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == "OBJECT"
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        ie3 = context.scene.ie3
 
-                map_data.file_name_keywords = map_setting_group.file_name_keywords
+        scene_snapshot, e = snapshot.read_snapshot(self.filepath)
+        if e:
+            self.report({"ERROR"}, str(e))
+            return {"FINISHED"}
+
+        if self.b_apply_scene_settings:
+            ie3.apply_scene_setting_group(properties.SceneSettingGroup.from_dict(scene_snapshot.header.scene_setting_group))
+
+        # Imported layers are stacked above the existing ones.
+        sorted_layer_objs = properties.find_sorted_layer_objs()
+        group_objs = snapshot.create_layer_group_objs(scene_snapshot.header)
+        for group_obj in group_objs.values():
+            context.scene.collection.objects.link(group_obj)
+        mesh_objs = {}
+        for layer_snapshot in scene_snapshot.layers:
+            layer_obj = snapshot.create_layer_obj(layer_snapshot, mesh_objs, group_objs)
+            context.scene.collection.objects.link(layer_obj)
+            sorted_layer_objs.append(layer_obj)
+        properties.sort_layer_objs(sorted_layer_objs)
+        properties.apply_layer_group_opacities(context.scene)
 
-                t = map_data.get_type()
-                if t == properties.MapType.Basic:
-                    map_data.display_name = map_setting_group.display_name
-                    map_data.color_depth = map_setting_group.color_depth
-                    pass
-                elif t == properties.MapType.Special:
-                    pass
+        self.report({"INFO"}, f"{len(scene_snapshot.layers)} layers were imported.")
 
         return {"FINISHED"}
 
@@ -296,6 +347,235 @@ class OT_CreateImageObj(bpy.types.Operator):
 
         return {"FINISHED"}
 
+class OT_CreateProceduralLayerObj(bpy.types.Operator):
+    bl_idname = "object.create_procedural_layer_obj"
+    bl_label = "Create procedural layer obj"
+    bl_options = {"REGISTER", "UNDO"}
+
+    kind: bpy.props.EnumProperty(items=properties.enum_cls_to_enum_property_items(properties.ProceduralKind), options={"HIDDEN"})
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == "OBJECT"
+
+    def execute(self, context):
+        procedural_obj = properties.ProceduralLayerObjWrapper.create_obj()
+        procedural_obj_wrapper = properties.ProceduralLayerObjWrapper(procedural_obj)
+        context.scene.collection.objects.link(procedural_obj_wrapper.obj)
+        procedural_obj_wrapper.obj.name = self.kind
+        params = procedural_obj_wrapper.get_params()
+        params["kind"] = self.kind
+        procedural_obj_wrapper.set_params(params)
+
+        camera_location = properties.get_camera_location()
+        uv_tile_coord = properties.location_to_uv_tile_coord(camera_location)
+        procedural_obj_wrapper.obj.location = properties.uv_tile_coord_to_location(uv_tile_coord)
+
+        sorted_layer_objs = properties.find_sorted_layer_objs()
+        sorted_layer_objs.append(procedural_obj_wrapper.obj)
+        properties.sort_layer_objs(sorted_layer_objs)
+
+        context.view_layer.objects.active = procedural_obj_wrapper.obj
+        for obj in context.scene.collection.all_objects:
+            obj.select_set(obj == procedural_obj_wrapper.obj)
+
+        return {"FINISHED"}
+
+class OT_ImportImageObjs(bpy.types.Operator):
+    bl_idname = "object.import_image_objs"
+    bl_label = "Import image objs"
+    bl_options = {"REGISTER", "UNDO"}
+
+    class Arrangement(StrEnum):
+        Tile = "Tile"
+        Grid = "Grid"
+
+    directory: bpy.props.StringProperty(options={"HIDDEN"})
+    files: bpy.props.CollectionProperty(type=bpy.types.OperatorFileListElement, options={"HIDDEN"})
+    filter_glob: bpy.props.StringProperty(default=properties.IMAGE_FILE_FILTER, options={"HIDDEN"})
+    arrangement: bpy.props.EnumProperty(name="Arrangement", items=properties.enum_cls_to_enum_property_items(Arrangement))
+    column_count: bpy.props.IntProperty(name="Column Count", description="0 means automatic", min=0, default=0)
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == "OBJECT"
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        ie3 = context.scene.ie3
+
+        file_paths = [os.path.join(self.directory, f.name) for f in self.files if f.name]
+        if not file_paths:
+            file_paths = glob.glob(os.path.join(self.directory, "*"))
+
+        current_map_data_list = ie3.get_current_map_data_list()
+        map_file_path_dicts = properties.group_image_file_paths_with_keywords(current_map_data_list, file_paths)
+        if not map_file_path_dicts:
+            self.report({"ERROR"}, "No supported image files were found.")
+            return {"CANCELLED"}
+
+        column_count = self.column_count
+        if column_count == 0:
+            column_count = math.ceil(math.sqrt(len(map_file_path_dicts)))
+        row_count = math.ceil(len(map_file_path_dicts) / column_count)
+
+        camera_location = properties.get_camera_location()
+        uv_tile_coord = properties.location_to_uv_tile_coord(camera_location)
+        uv_tile_origin = properties.uv_tile_coord_to_location(uv_tile_coord) - mathutils.Vector((0.5, 0.5, 0.0))
+
+        arrangement = self.Arrangement(self.arrangement)
+        cell_size = 1.0
+        if arrangement == self.Arrangement.Tile:
+            cell_size = 1.0 / max(column_count, row_count)
+
+        # Sorting and selection are done once for the whole batch instead of
+        # once per layer as in OT_CreateImageObj.
+        sorted_layer_objs = properties.find_sorted_layer_objs()
+
+        image_objs = []
+        for i, map_file_path_dict in enumerate(map_file_path_dicts):
+            image_obj = properties.ImageObjWrapper.create_obj()
+            image_obj_wrapper = properties.ImageObjWrapper(image_obj)
+            context.scene.collection.objects.link(image_obj_wrapper.obj)
+            image_obj_wrapper.obj.name = f"Image"
+
+            column = i % column_count
+            row = i // column_count
+            if arrangement == self.Arrangement.Tile:
+                image_obj_wrapper.obj.location = uv_tile_origin + mathutils.Vector((
+                    (column + 0.5) * cell_size,
+                    1.0 - (row + 0.5) * cell_size,
+                    0.0
+                ))
+                image_obj_wrapper.obj.scale = mathutils.Vector((cell_size, cell_size, 1.0))
+            elif arrangement == self.Arrangement.Grid:
+                image_obj_wrapper.obj.location = properties.uv_tile_coord_to_location([
+                    uv_tile_coord[0] + column,
+                    uv_tile_coord[1] + row
+                ])
+
+            image_obj_wrapper.update_maps(map_file_path_dict)
+            image_obj_wrapper.switch_map(ie3.display_map_name)
+
+            sorted_layer_objs.append(image_obj_wrapper.obj)
+            image_objs.append(image_obj_wrapper.obj)
+
+        properties.sort_layer_objs(sorted_layer_objs)
+
+        for obj in context.selected_objects:
+            obj.select_set(False)
+        for image_obj in image_objs:
+            image_obj.select_set(True)
+        context.view_layer.objects.active = image_objs[-1]
+
+        self.report({"INFO"}, f"{len(image_objs)} image layers were created.")
+
+        return {"FINISHED"}
+
+class OT_ImportLayeredImage(bpy.types.Operator):
+    bl_idname = "object.import_layered_image"
+    bl_label = "Import layered image"
+    bl_options = {"REGISTER", "UNDO"}
+
+    filepath: bpy.props.StringProperty(subtype="FILE_PATH", options={"HIDDEN"})
+    filter_glob: bpy.props.StringProperty(default="*.exr;*.psd", options={"HIDDEN"})
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == "OBJECT"
+
+    def invoke(self, context, event):
+        context.window_manager.fileselect_add(self)
+
+        return {"RUNNING_MODAL"}
+
+    def bind_channel_files(self, map_data_list, part_name, channel_files):
+        # Channel groups are bound to maps by their names, or by the part name
+        # if they have none. Unbound channels go to the first map unless it is
+        # already bound. The opacity map reads the alpha of the image, so a
+        # group with alpha is bound to it unless a group is bound by name.
+        map_file_path_dict = {}
+        alpha_file_path = ""
+        for group_name, file_path, b_has_alpha in channel_files:
+            if b_has_alpha and (not alpha_file_path):
+                alpha_file_path = file_path
+            map_internal_name = properties.find_map_internal_name_with_keywords(map_data_list, group_name or part_name)
+            if (not map_internal_name) and map_data_list:
+                map_internal_name = map_data_list[0].internal_name
+            if (not map_internal_name) or (map_internal_name in map_file_path_dict):
+                continue
+            map_file_path_dict[map_internal_name] = file_path
+
+        opacity_map_internal_name = properties.SpecialMapType.Opacity.name
+        b_has_opacity_map = any(d.internal_name == opacity_map_internal_name for d in map_data_list)
+        if alpha_file_path and b_has_opacity_map and (not opacity_map_internal_name in map_file_path_dict):
+            map_file_path_dict[opacity_map_internal_name] = alpha_file_path
+        return map_file_path_dict
+
+    def execute(self, context):
+        from . import imaging
+
+        ie3 = context.scene.ie3
+
+        current_map_data_list = ie3.get_current_map_data_list()
+
+        camera_location = properties.get_camera_location()
+        uv_tile_coord = properties.location_to_uv_tile_coord(camera_location)
+
+        # Parts are stacked from the bottom on top of the existing layers,
+        # and the whole stack is a single undo step.
+        sorted_layer_objs = properties.find_sorted_layer_objs()
+
+        image_objs = []
+        skipped_channel_count = 0
+        try:
+            for part_name, channel_files in imaging.split_layered_image(bpy.path.abspath(self.filepath), properties.get_user_dir_path()):
+                with profiling.span("OT_ImportLayeredImage.store_part"):
+                    store_channel_files = [(group_name, imagestore.add_file(file_path, b_move=True), b_has_alpha) for group_name, file_path, b_has_alpha in channel_files]
+                map_file_path_dict = self.bind_channel_files(current_map_data_list, part_name, store_channel_files)
+                skipped_channel_count += len(set(p for _, p, _ in store_channel_files) - set(map_file_path_dict.values()))
+                if not map_file_path_dict:
+                    continue
+
+                image_obj = properties.ImageObjWrapper.create_obj()
+                image_obj_wrapper = properties.ImageObjWrapper(image_obj)
+                context.scene.collection.objects.link(image_obj_wrapper.obj)
+                image_obj_wrapper.obj.name = part_name
+                image_obj_wrapper.obj.location = properties.uv_tile_coord_to_location(uv_tile_coord)
+                image_obj_wrapper.update_maps(map_file_path_dict)
+                image_obj_wrapper.switch_map(ie3.display_map_name)
+
+                sorted_layer_objs.append(image_obj_wrapper.obj)
+                image_objs.append(image_obj_wrapper.obj)
+        except:
+            for image_obj in image_objs:
+                bpy.data.objects.remove(image_obj)
+            self.report({"ERROR"}, "An error occurred while importing the layered image.")
+            return {"CANCELLED"}
+
+        if not image_objs:
+            self.report({"ERROR"}, "No parts were bound to maps.")
+            return {"CANCELLED"}
+
+        properties.sort_layer_objs(sorted_layer_objs)
+
+        for obj in context.selected_objects:
+            obj.select_set(False)
+        for image_obj in image_objs:
+            image_obj.select_set(True)
+        context.view_layer.objects.active = image_objs[-1]
+
+        if skipped_channel_count:
+            self.report({"WARNING"}, f"{len(image_objs)} image layers were created. {skipped_channel_count} channel groups were not bound to maps.")
+        else:
+            self.report({"INFO"}, f"{len(image_objs)} image layers were created.")
+
+        return {"FINISHED"}
+
 class OT_CreateBasicLayerObj(bpy.types.Operator):
     bl_idname = "object.create_basic_layer_obj"
     bl_label = "Create basic layer obj"
@@ -331,6 +611,8 @@ class OT_DuplicateLayerObj(bpy.types.Operator):
     bl_label = "Duplicate layer obj"
     bl_options = {"REGISTER", "UNDO"}
 
+    b_as_instance: bpy.props.BoolProperty(name="As instance", description="Share mesh, material and images with the original layer")
+
     @classmethod
     def poll(cls, context):
         return context.mode == "OBJECT"
@@ -346,9 +628,9 @@ class OT_DuplicateLayerObj(bpy.types.Operator):
 
         for obj in context.scene.objects:
             obj.select_set(obj == context.active_object)
-        bpy.ops.object.duplicate()
+        bpy.ops.object.duplicate(linked=self.b_as_instance)
 
-        if layer_obj_type == properties.LayerObjType.Image:
+        if (layer_obj_type in [properties.LayerObjType.Image, properties.LayerObjType.Procedural, properties.LayerObjType.Basic]) and context.active_object.data.materials and (not self.b_as_instance):
             context.active_object.data.materials[0] = context.active_object.data.materials[0].copy()
 
         sorted_layer_objs = properties.find_sorted_layer_objs()
@@ -357,6 +639,33 @@ class OT_DuplicateLayerObj(bpy.types.Operator):
 
         return {"FINISHED"}
 
+class OT_MakeLayerObjUnique(bpy.types.Operator):
+    bl_idname = "object.make_layer_obj_unique"
+    bl_label = "Make layer obj unique"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        return (context.mode == "OBJECT") and context.active_object and (context.active_object.type == "MESH")
+
+    def execute(self, context):
+        obj_type = properties.get_obj_type(context.active_object)
+        if obj_type != properties.ObjType.Layer:
+            return {"FINISHED"}
+
+        if context.active_object.data.users <= 1:
+            return {"FINISHED"}
+
+        context.active_object.data = context.active_object.data.copy()
+
+        layer_obj_type = properties.get_layer_obj_type(context.active_object)
+        if (layer_obj_type in [properties.LayerObjType.Image, properties.LayerObjType.Procedural, properties.LayerObjType.Basic]) and context.active_object.data.materials:
+            context.active_object.data.materials[0] = context.active_object.data.materials[0].copy()
+
+        active_obj_changed()
+
+        return {"FINISHED"}
+
 class OT_SelectImageObjMap(bpy.types.Operator):
     bl_idname = "wm.select_image_obj_map"
     bl_label = "Select image obj map"
@@ -397,17 +706,10 @@ class OT_SelectImageObjMapsWithKeywords(bpy.types.Operator):
         file_paths = glob.glob(f"{self.directory}\*")
 
         current_map_data_list = ie3.get_current_map_data_list()
+        map_file_path_dict = properties.find_map_file_paths_with_keywords(current_map_data_list, file_paths)
         for map_data in current_map_data_list:
-            file_name_keywords = map_data.file_name_keywords.split(",")
-
-            for file_path in file_paths:
-                if not properties.is_image_file_supported(file_path):
-                    continue
-
-                file_name = os.path.basename(file_path)
-                for file_name_keyword in file_name_keywords:
-                    if file_name_keyword and (file_name_keyword in file_name):
-                        map_data.file_path = file_path
+            if map_data.internal_name in map_file_path_dict:
+                map_data.file_path = map_file_path_dict[map_data.internal_name]
 
         return {"FINISHED"}
 
@@ -430,83 +732,50 @@ class OT_SnapVertToClosestUvVert(bpy.types.Operator):
 
     def invoke(self, context, event):
         self.offset_amount = 0.0
-        self.vert_data_list = []
+        self.vert_data_list = self.find_vert_data_list(context)
+
+        return self.execute(context)
+
+    def find_vert_data_list(self, context):
+        from . import snapping
+
+        vert_data_list = []
 
         uv_layout_objs = properties.find_objs_with_type(properties.ObjType.UvLayout)
         if not uv_layout_objs:
-            return {"FINISHED"}
-        uv_layout_obj = uv_layout_objs[0]
-        uv_bm = bmesh.new()
-        uv_bm.from_mesh(uv_layout_obj.data)
+            return vert_data_list
+        uv_layout_arrays = snapping.UvLayoutArrays.from_mesh(uv_layout_objs[0].data)
 
         bm = bmesh.from_edit_mesh(context.edit_object.data)
 
-        for vert in bm.verts:
-            if not vert.select:
+        verts = [v for v in bm.verts if v.select]
+        vert_coords = [context.edit_object.matrix_world @ v.co for v in verts]
+        target_coords, offset_directions, b_are_found = snapping.find_closest_uv_vert_targets(uv_layout_arrays, [c.xy for c in vert_coords])
+
+        for i, vert in enumerate(verts):
+            if not b_are_found[i]:
                 continue
 
             vert_data = self.VertData()
             vert_data.index = vert.index
+            vert_data.target_location = mathutils.Vector((*target_coords[i], vert_coords[i].z))
+            vert_data.offset_direction = mathutils.Vector((*offset_directions[i], 0.0))
+            vert_data_list.append(vert_data)
 
-            vert_coord = context.edit_object.matrix_world @ vert.co
-
-            min_distance = sys.float_info.max
-            b_is_found = False
-            for uv_face in uv_bm.faces:
-                uv_vert_coords = []
-                for uv_loop in uv_face.loops:
-                    uv_vert_coords.append(uv_loop.vert.co)
-
-                if not properties.face_contains_point(uv_vert_coords, vert_coord):
-                    continue
-
-                for i, uv_vert_coord in enumerate(uv_vert_coords):
-                    uv_vert_coord.z = vert_coord.z
-                    distance = (uv_vert_coord - vert_coord).length
-                    if distance < min_distance:
-                        min_distance = distance
-                        vert_data.target_location = uv_vert_coord
-                        b_is_found = True
-
-                        prev_vert_coord = uv_vert_coords[properties.loop_index(i - 1, len(uv_vert_coords))]
-                        prev_vert_coord.z = vert_coord.z
-                        next_vert_coord = uv_vert_coords[properties.loop_index(i + 1, len(uv_vert_coords))]
-                        next_vert_coord.z = vert_coord.z
-                        edge0 = (prev_vert_coord - uv_vert_coord).normalized()
-                        edge1 = (next_vert_coord - uv_vert_coord).normalized()
-                        vert_data.offset_direction = (edge0 + edge1).normalized()
-                        if not properties.face_contains_point(uv_vert_coords, uv_vert_coord + vert_data.offset_direction * 0.001):
-                            vert_data.offset_direction.negate()
-
-            if not b_is_found:
-                for uv_face in uv_bm.faces:
-                    for uv_loop in uv_face.loops:
-                        uv_vert_coord = uv_loop.vert.co
-                        uv_vert_coord.z = vert_coord.z
-                        distance = (uv_vert_coord - vert_coord).length
-                        if distance < min_distance:
-                            min_distance = distance
-                            vert_data.target_location = uv_vert_coord
-                            b_is_found = True
-
-            self.vert_data_list.append(vert_data)
-
-        return self.execute(context)
+        return vert_data_list
 
     def execute(self, context):
-        bm = bmesh.from_edit_mesh(context.edit_object.data)
+        # Redo and calls without an event (e.g. in background mode) skip invoke.
+        if not hasattr(self, "vert_data_list"):
+            self.vert_data_list = self.find_vert_data_list(context)
 
-        for vert in bm.verts:
-            vert_data = None
-            for data in self.vert_data_list:
-                if data.index == vert.index:
-                    vert_data = data
-                    break
-            if not vert_data:
-                continue
+        bm = bmesh.from_edit_mesh(context.edit_object.data)
+        bm.verts.ensure_lookup_table()
+        matrix_world_inverted = context.edit_object.matrix_world.inverted()
 
+        for vert_data in self.vert_data_list:
             co = vert_data.target_location + vert_data.offset_direction * self.offset_amount
-            vert.co = context.edit_object.matrix_world.inverted() @ co
+            bm.verts[vert_data.index].co = matrix_world_inverted @ co
 
         bmesh.update_edit_mesh(context.edit_object.data)
 
@@ -530,53 +799,33 @@ class OT_SnapVertToUvEdge(bpy.types.Operator):
         return context.mode == "EDIT_MESH"
 
     def execute(self, context):
+        from . import snapping
+
         uv_layout_objs = properties.find_objs_with_type(properties.ObjType.UvLayout)
         if not uv_layout_objs:
             return {"FINISHED"}
-        uv_layout_obj = uv_layout_objs[0]
-        uv_bm = bmesh.new()
-        uv_bm.from_mesh(uv_layout_obj.data)
+        uv_layout_arrays = snapping.UvLayoutArrays.from_mesh(uv_layout_objs[0].data)
 
         bm = bmesh.from_edit_mesh(context.edit_object.data)
 
-        for vert in bm.verts:
-            if not vert.select:
+        direction_vectors = {
+            self.Direction.XPlus: (1.0, 0.0),
+            self.Direction.XMinus: (-1.0, 0.0),
+            self.Direction.YPlus: (0.0, 1.0),
+            self.Direction.YMinus: (0.0, -1.0),
+        }
+        direction_vector = direction_vectors[self.Direction(self.direction)]
+
+        verts = [v for v in bm.verts if v.select]
+        vert_coords = [context.edit_object.matrix_world @ v.co for v in verts]
+        target_coords, b_are_found = snapping.find_uv_edge_targets(uv_layout_arrays, [c.xy for c in vert_coords], direction_vector)
+
+        matrix_world_inverted = context.edit_object.matrix_world.inverted()
+        for i, vert in enumerate(verts):
+            if not b_are_found[i]:
                 continue
-
-            p00 = context.edit_object.matrix_world @ vert.co
-            p01 = p00.copy()
-            direction = self.Direction(self.direction)
-            if direction == self.Direction.XMinus:
-                p00 += mathutils.Vector((-0.001, 0.0, 0.0))
-                p01 += mathutils.Vector((-1000.0, 0.0, 0.0))
-            elif direction == self.Direction.XPlus:
-                p00 += mathutils.Vector((0.001, 0.0, 0.0))
-                p01 += mathutils.Vector((1000.0, 0.0, 0.0))
-            if direction == self.Direction.YMinus:
-                p00 += mathutils.Vector((0.0, -0.001, 0.0))
-                p01 += mathutils.Vector((0.0, -1000.0, 0.0))
-            elif direction == self.Direction.YPlus:
-                p00 += mathutils.Vector((0.0, 0.001, 0.0))
-                p01 += mathutils.Vector((0.0, 1000.0, 0.0))
-
-            min_distance = sys.float_info.max
-            target_location = mathutils.Vector()
-            b_is_found = False
-            for uv_edge in uv_bm.edges:
-                p10 = uv_edge.verts[0].co
-                p11 = uv_edge.verts[1].co
-
-                intersection = properties.find_intersection(p00, p01, p10, p11)
-                if intersection:
-                    distance = (intersection - p00).length
-                    if distance < min_distance:
-                        min_distance = distance
-                        target_location = intersection
-                        target_location.z = p00.z
-                        b_is_found = True
-
-            if b_is_found:
-                vert.co = context.edit_object.matrix_world.inverted() @ target_location
+            target_location = mathutils.Vector((*target_coords[i], vert_coords[i].z))
+            vert.co = matrix_world_inverted @ target_location
 
         bmesh.update_edit_mesh(context.edit_object.data)
 
@@ -592,38 +841,25 @@ class OT_SnapVertToClosestUvEdge(bpy.types.Operator):
         return context.mode == "EDIT_MESH"
 
     def execute(self, context):
+        from . import snapping
+
         uv_layout_objs = properties.find_objs_with_type(properties.ObjType.UvLayout)
         if not uv_layout_objs:
             return {"FINISHED"}
-        uv_layout_obj = uv_layout_objs[0]
-        uv_bm = bmesh.new()
-        uv_bm.from_mesh(uv_layout_obj.data)
+        uv_layout_arrays = snapping.UvLayoutArrays.from_mesh(uv_layout_objs[0].data)
 
         bm = bmesh.from_edit_mesh(context.edit_object.data)
 
-        for vert in bm.verts:
-            if not vert.select:
-                continue
-
-            vert_coord = context.edit_object.matrix_world @ vert.co
-
-            min_distance = sys.float_info.max
-            target_location = mathutils.Vector()
-            b_is_found = False
-            for uv_edge in uv_bm.edges:
-                p0 = uv_edge.verts[0].co
-                p1 = uv_edge.verts[1].co
-
-                closest_point = properties.find_closest_point(p0, p1, vert_coord)
-                distance = (closest_point - vert_coord).length
-                if distance < min_distance:
-                    min_distance = distance
-                    target_location = closest_point
-                    target_location.z = vert_coord.z
-                    b_is_found = True
+        verts = [v for v in bm.verts if v.select]
+        vert_coords = [context.edit_object.matrix_world @ v.co for v in verts]
+        target_coords, b_are_found = snapping.find_closest_uv_edge_targets(uv_layout_arrays, [c.xy for c in vert_coords])
 
-            if b_is_found:
-                vert.co = context.edit_object.matrix_world.inverted() @ target_location
+        matrix_world_inverted = context.edit_object.matrix_world.inverted()
+        for i, vert in enumerate(verts):
+            if not b_are_found[i]:
+                continue
+            target_location = mathutils.Vector((*target_coords[i], vert_coords[i].z))
+            vert.co = matrix_world_inverted @ target_location
 
         bmesh.update_edit_mesh(context.edit_object.data)
 
@@ -745,17 +981,277 @@ class OT_MoveLayerObj(bpy.types.Operator):
             or (other_obj_index >= len(sorted_layer_objs)):
             return {"FINISHED"}
 
+        if target in [self.Target.Up, self.Target.Down]:
+            # Groups keep their layers together, so a layer passes a group at
+            # once and stays in its own group.
+            step = other_obj_index - layer_obj_index
+            grouped_layer_objs = properties.group_layer_objs(sorted_layer_objs)
+            while 0 <= other_obj_index < len(sorted_layer_objs):
+                moved_layer_objs = list(sorted_layer_objs)
+                moved_layer_objs.remove(context.active_object)
+                moved_layer_objs.insert(other_obj_index, context.active_object)
+                if properties.group_layer_objs(moved_layer_objs) != grouped_layer_objs:
+                    properties.sort_layer_objs(moved_layer_objs)
+                    break
+                other_obj_index += step
+            return {"FINISHED"}
+
         sorted_layer_objs[layer_obj_index] = sorted_layer_objs[other_obj_index]
         sorted_layer_objs[other_obj_index] = context.active_object
         properties.sort_layer_objs(sorted_layer_objs)
 
         return {"FINISHED"}
 
+class OT_GroupLayerObjs(bpy.types.Operator):
+    bl_idname = "object.group_layer_objs"
+    bl_label = "Group layer objs"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == "OBJECT"
+
+    def execute(self, context):
+        sorted_layer_objs = properties.find_sorted_layer_objs()
+        layer_objs = []
+        for layer_obj in sorted_layer_objs:
+            if not layer_obj.select_get():
+                continue
+            if properties.get_layer_obj_type(layer_obj) == properties.LayerObjType.Overlay:
+                continue
+            layer_objs.append(layer_obj)
+        if not layer_objs:
+            return {"FINISHED"}
+
+        # The new group is nested in the innermost group containing all the
+        # layers.
+        parent_group_obj = None
+        for group_objs in zip(*[properties.find_layer_group_objs(o) for o in layer_objs]):
+            if any(o != group_objs[0] for o in group_objs):
+                break
+            parent_group_obj = group_objs[0]
+
+        group_obj = properties.LayerGroupObjWrapper.create_obj()
+        context.scene.collection.objects.link(group_obj)
+        group_obj.location = layer_objs[0].location
+        properties.set_layer_group_obj(group_obj, parent_group_obj)
+
+        # The layers are stacked together where the lowest of them is.
+        index = sorted_layer_objs.index(layer_objs[0])
+        for layer_obj in layer_objs:
+            properties.set_layer_group_obj(layer_obj, group_obj)
+            sorted_layer_objs.remove(layer_obj)
+        sorted_layer_objs[index:index] = layer_objs
+        properties.sort_layer_objs(sorted_layer_objs)
+        properties.apply_layer_group_opacities(context.scene)
+
+        context.view_layer.objects.active = group_obj
+
+        return {"FINISHED"}
+
+class OT_UngroupLayerObjs(bpy.types.Operator):
+    bl_idname = "object.ungroup_layer_objs"
+    bl_label = "Ungroup layer objs"
+    bl_options = {"REGISTER", "UNDO"}
+
+    @classmethod
+    def poll(cls, context):
+        return context.mode == "OBJECT"
+
+    def execute(self, context):
+        # Removes the active group, or the innermost group of the active layer.
+        group_obj = context.active_object
+        if properties.get_obj_type(group_obj) != properties.ObjType.LayerGroup:
+            group_obj = properties.get_layer_group_obj(group_obj)
+        if group_obj is None:
+            return {"FINISHED"}
+
+        parent_group_obj = properties.get_layer_group_obj(group_obj)
+        for obj in context.scene.objects:
+            if properties.get_layer_group_obj(obj) == group_obj:
+                properties.set_layer_group_obj(obj, parent_group_obj)
+        bpy.data.objects.remove(group_obj)
+
+        properties.sort_layer_objs(properties.find_sorted_layer_objs())
+        properties.apply_layer_group_opacities(context.scene)
+
+        return {"FINISHED"}
+
+class OT_ResetProfilingStats(bpy.types.Operator):
+    bl_idname = "wm.reset_profiling_stats"
+    bl_label = "Reset profiling stats"
+
+    def execute(self, context):
+        profiling.reset()
+
+        return {"FINISHED"}
+
+class OT_ExportProfilingStats(bpy.types.Operator):
+    bl_idname = "wm.export_profiling_stats"
+    bl_label = "Export profiling stats"
+
+    class Format(StrEnum):
+        Stats = "Stats"
+        ChromeTrace = "ChromeTrace"
+
+    filepath: bpy.props.StringProperty(options={"HIDDEN"})
+    filename: bpy.props.StringProperty(options={"HIDDEN"})
+    file_format: bpy.props.EnumProperty(name="Format", items=properties.enum_cls_to_enum_property_items(Format))
+
+    def invoke(self, context, event):
+        self.filename = "ProfilingStats.json"
+        context.window_manager.fileselect_add(self)
+
+        return {"RUNNING_MODAL"}
+
+    def execute(self, context):
+        e = None
+        f = self.Format(self.file_format)
+        if f == self.Format.Stats:
+            e = profiling.write_stats(self.filepath)
+        elif f == self.Format.ChromeTrace:
+            e = profiling.write_chrome_trace(self.filepath)
+
+        if e:
+            self.report({"ERROR"}, str(e))
+
+        return {"FINISHED"}
+
+class OT_BuildTextureCache(bpy.types.Operator):
+    bl_idname = "scene.build_texture_cache"
+    bl_label = "Build texture cache"
+
+    def execute(self, context):
+        from . import txcache
+
+        ie3 = context.scene.ie3
+
+        images = set()
+        image_objs = properties.find_layer_objs_with_type(properties.LayerObjType.Image)
+        for image_obj in image_objs:
+            image_obj_wrapper = properties.ImageObjWrapper(image_obj)
+            images.update(image_obj_wrapper.get_maps().values())
+
+        file_paths = set()
+        for image in images:
+            if image.packed_file:
+                continue
+            source_file_path = properties.get_image_source_file_path(image)
+            file_path = bpy.path.abspath(source_file_path)
+            if not os.path.isfile(file_path):
+                continue
+            if txcache.get_tx_file_path(file_path) != file_path:
+                file_paths.add(file_path)
+
+            if ie3.b_use_texture_cache:
+                # Maps loaded before the option was enabled switch to proxies.
+                proxy_file_path = txcache.get_proxy_file_path(file_path, int(ie3.viewport_max_texture_size))
+                if proxy_file_path != file_path:
+                    image[properties.SOURCE_FILE_PATH_KEY] = source_file_path
+                    if image.filepath != proxy_file_path:
+                        image.filepath = proxy_file_path
+
+        self.report({"INFO"}, f"{len(file_paths)} maps were converted.")
+
+        return {"FINISHED"}
+
+class OT_BuildAtlas(bpy.types.Operator):
+    bl_idname = "scene.build_atlas"
+    bl_label = "Build atlas"
+    bl_options = {"REGISTER", "UNDO"}
+
+    b_repack: bpy.props.BoolProperty(options={"HIDDEN"})
+
+    def execute(self, context):
+        from . import atlas
+
+        try:
+            layer_count, image_count = atlas.build_atlas(context.scene, self.b_repack)
+        except:
+            self.report({"ERROR"}, "An error occurred while building the atlas.")
+            return {"CANCELLED"}
+
+        self.report({"INFO"}, f"{layer_count} layers were packed into {image_count} atlas images.")
+
+        return {"FINISHED"}
+
+class OT_ClearAtlas(bpy.types.Operator):
+    bl_idname = "scene.clear_atlas"
+    bl_label = "Clear atlas"
+    bl_options = {"REGISTER", "UNDO"}
+
+    def execute(self, context):
+        from . import atlas
+
+        atlas.clear_atlas(context.scene)
+
+        return {"FINISHED"}
+
+class OT_CleanImageStore(bpy.types.Operator):
+    bl_idname = "wm.clean_image_store"
+    bl_label = "Clean image store"
+
+    def invoke(self, context, event):
+        # The files to remove are listed before anything is removed.
+        garbage_files = imagestore.find_garbage_files()
+        if not garbage_files:
+            self.report({"INFO"}, "No images can be removed.")
+            return {"CANCELLED"}
+
+        garbage_size = sum(s for _, s in garbage_files)
+        grace_days = imagestore.GARBAGE_GRACE_PERIOD // (24 * 60 * 60)
+        message = f"{len(garbage_files)} images ({garbage_size / 1024 ** 2:.1f} MB) unused for {grace_days} days and not referenced by any known saved file will be removed."
+        return context.window_manager.invoke_confirm(self, event, title="Clean image store", message=message, confirm_text="Remove")
+
+    def execute(self, context):
+        removed_file_count, removed_size = imagestore.collect_garbage()
+        self.report({"INFO"}, f"{removed_file_count} images ({removed_size / 1024 ** 2:.1f} MB) were removed.")
+
+        return {"FINISHED"}
+
+class OT_PreviewMap(bpy.types.Operator):
+    bl_idname = "render.preview_map"
+    bl_label = "Preview map"
+
+    def execute(self, context):
+        ie3 = context.scene.ie3
+
+        uv_tile_coord = properties.location_to_uv_tile_coord(properties.get_camera_location())
+        uv_tile_num = properties.uv_tile_coord_to_num(uv_tile_coord)
+        if not uv_tile_num in [d.num for d in ie3.uv_tile_data_list]:
+            self.report({"ERROR"}, "Please move the view to a UV tile.")
+            return {"CANCELLED"}
+
+        map_data_list = [d for d in ie3.get_current_basic_map_data_list() if d.internal_name == ie3.display_map_name]
+        if not map_data_list:
+            return {"CANCELLED"}
+        map_data = map_data_list[0]
+
+        start_time = time.perf_counter()
+        try:
+            image, b_is_cached = preview.get_preview_image(context.scene, uv_tile_num, map_data.internal_name, map_data.get_display_name(), int(ie3.preview_resolution))
+        except:
+            self.report({"ERROR"}, "An error occurred while compositing the preview.")
+            return {"CANCELLED"}
+        preview.show_image(context, image)
+
+        if not b_is_cached:
+            self.report({"INFO"}, f"The preview was composited in {time.perf_counter() - start_time:.2f}s.")
+
+        return {"FINISHED"}
+
 class OT_ExportMaps(bpy.types.Operator):
     bl_idname = "render.export_maps"
     bl_label = "Export maps"
 
     directory: bpy.props.StringProperty(options={"HIDDEN"})
+    b_export_dirty_tiles_only: bpy.props.BoolProperty(name="Dirty tiles only", description="Only export tiles whose source maps changed since the last export")
+
+    b_is_running = False
+
+    @classmethod
+    def poll(cls, context):
+        return not cls.b_is_running
 
     def invoke(self, context, event):
         ie3 = context.scene.ie3
@@ -769,49 +1265,100 @@ class OT_ExportMaps(bpy.types.Operator):
         return {"RUNNING_MODAL"}
 
     def execute(self, context):
-        ie3 = context.scene.ie3
+        # Units and their settings are captured here, so the scene settings
+        # can be edited while the export is running.
+        self.map_exporter = export.MapExporter(context.scene, self.directory, b_dirty_tiles_only=self.b_export_dirty_tiles_only)
+        if not self.map_exporter.units:
+            self.report({"INFO"}, "There is nothing to export.")
+            return {"FINISHED"}
 
-        camera = bpy.data.cameras.new("Camera")
-        camera.type = "ORTHO"
-        camera.ortho_scale = 1.0
-        camera_obj = bpy.data.objects.new("Camera", camera)
-        context.scene.collection.objects.link(camera_obj)
-        context.scene.camera = camera_obj
+        if not context.window:
+            errors = self.map_exporter.export()
+            for e in errors:
+                self.report({"ERROR"}, str(e))
+            return {"FINISHED"}
 
-        context.scene.render.resolution_x = int(ie3.resolution)
-        context.scene.render.resolution_y = int(ie3.resolution)
+        self.unit_index = 0
+        self.errors = []
+        self.start_time = time.perf_counter()
 
-        image_objs = properties.find_layer_objs_with_type(properties.LayerObjType.Image)
-        image_obj_wrappers = [properties.ImageObjWrapper(o) for o in image_objs]
+        self.map_exporter.begin()
+        OT_ExportMaps.b_is_running = True
+
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(0.01, window=context.window)
+        wm.progress_begin(0, len(self.map_exporter.units))
+        wm.modal_handler_add(self)
 
-        current_basic_map_data_list = ie3.get_current_basic_map_data_list()
+        return {"RUNNING_MODAL"}
 
-        for uv_tile_data in ie3.uv_tile_data_list:
-            camera_obj.location = properties.uv_tile_coord_to_location(uv_tile_data.coord)
-            camera_obj.location.z = 500.0
+    def modal(self, context, event):
+        if event.type == "ESC":
+            self.finish(context)
+            self.report({"WARNING"}, f"The export was cancelled after {self.unit_index} of {len(self.map_exporter.units)} maps.")
+            return {"CANCELLED"}
 
-            for basic_map_data in current_basic_map_data_list:
-                display_name = basic_map_data.get_display_name()
-                context.scene.render.filepath = os.path.join(self.directory, f"{ie3.map_file_name}_{uv_tile_data.num}_{display_name}.png")
+        if event.type != "TIMER":
+            return {"PASS_THROUGH"}
+
+        try:
+            return self.export_next_unit(context)
+        except:
+            self.finish(context)
+            raise
+
+    def export_next_unit(self, context):
+        unit = self.map_exporter.units[self.unit_index]
+        try:
+            e = self.map_exporter.export_unit(unit)
+        except:
+            e = error.Error(f"An error occurred while exporting \"{unit.file_path}\".")
+        if e:
+            self.errors.append(e)
+        self.unit_index += 1
+
+        unit_count = len(self.map_exporter.units)
+        if self.unit_index >= unit_count:
+            self.finish(context)
+            for e in self.errors:
+                self.report({"ERROR"}, str(e))
+            self.report({"INFO"}, f"{unit_count - len(self.errors)} maps were exported ({len(self.map_exporter.unchanged_file_paths)} unchanged).")
+            return {"FINISHED"}
 
-                for image_obj_wrapper in image_obj_wrappers:
-                    image_obj_wrapper.switch_map(basic_map_data.internal_name)
+        elapsed_time = time.perf_counter() - self.start_time
+        remaining_time = elapsed_time / self.unit_index * (unit_count - self.unit_index)
+        context.window_manager.progress_update(self.unit_index)
+        context.workspace.status_text_set(f"Exporting maps {self.unit_index}/{unit_count} (ETA {int(remaining_time)}s, Esc to cancel)")
 
-                context.scene.render.image_settings.color_depth = basic_map_data.color_depth
-                bpy.ops.render.render(write_still=True)
+        return {"PASS_THROUGH"}
 
-        bpy.data.objects.remove(camera_obj)
-        bpy.data.cameras.remove(camera)
+    def cancel(self, context):
+        self.finish(context)
 
-        return {"FINISHED"}
+    def finish(self, context):
+        e = self.map_exporter.end()
+        if e:
+            self.report({"ERROR"}, str(e))
+        OT_ExportMaps.b_is_running = False
+
+        wm = context.window_manager
+        wm.event_timer_remove(self.timer)
+        wm.progress_end()
+        context.workspace.status_text_set(None)
 
 clss = [
     OT_StartEditing,
     OT_SaveSceneSettingGroup,
     OT_LoadSceneSettingGroup,
+    OT_ExportSnapshot,
+    OT_ImportSnapshot,
     OT_CreateImageObj,
+    OT_CreateProceduralLayerObj,
+    OT_ImportImageObjs,
+    OT_ImportLayeredImage,
     OT_CreateBasicLayerObj,
     OT_DuplicateLayerObj,
+    OT_MakeLayerObjUnique,
     OT_SelectImageObjMap,
     OT_SelectImageObjMapsWithKeywords,
     OT_SnapVertToClosestUvVert,
@@ -819,5 +1366,14 @@ clss = [
     OT_SnapVertToClosestUvEdge,
     OT_AlignVerts,
     OT_MoveLayerObj,
+    OT_GroupLayerObjs,
+    OT_UngroupLayerObjs,
+    OT_ResetProfilingStats,
+    OT_ExportProfilingStats,
+    OT_BuildTextureCache,
+    OT_BuildAtlas,
+    OT_ClearAtlas,
+    OT_CleanImageStore,
+    OT_PreviewMap,
     OT_ExportMaps,
 ]
@@ -0,0 +1,60 @@
+# Rectangle packing for atlases. This module depends only on the standard
+# library, so it can be tested without Blender.
+
+class SkylinePacker(object):
+    # Bottom-left skyline packer in a square of size pixels. The skyline is
+    # a list of [x, y, width] segments covering the width from the left, y
+    # being the first free row from the top. A given skyline is updated in
+    # place, so it can be kept with the packed page.
+    def __init__(self, size, skyline=None):
+        super(SkylinePacker, self).__init__()
+        self.size = size
+        self.skyline = skyline if skyline is not None else [[0, 0, size]]
+
+    def find_position(self, width, height):
+        best_position = None
+        for i, (x, _, _) in enumerate(self.skyline):
+            if x + width > self.size:
+                break
+            # The rectangle rests on the lowest free row under it.
+            y = 0
+            j = i
+            while self.skyline[j][0] < x + width:
+                y = max(y, self.skyline[j][1])
+                j += 1
+                if j == len(self.skyline):
+                    break
+            if y + height > self.size:
+                continue
+            if (best_position is None) or ((y, x) < (best_position[1], best_position[0])):
+                best_position = (x, y)
+        return best_position
+
+    def pack(self, width, height):
+        # Returns the top left of the rectangle or None if it does not fit.
+        position = self.find_position(width, height)
+        if position is None:
+            return None
+        x, y = position
+
+        skyline = []
+        for segment_x, segment_y, segment_width in self.skyline:
+            segment_end = segment_x + segment_width
+            if (segment_end <= x) or (segment_x >= x + width):
+                skyline.append([segment_x, segment_y, segment_width])
+                continue
+            if segment_x < x:
+                skyline.append([segment_x, segment_y, x - segment_x])
+            if segment_end > x + width:
+                skyline.append([x + width, segment_y, segment_end - x - width])
+        skyline.append([x, y + height, width])
+        skyline.sort()
+
+        # Neighbors at the same row are merged.
+        self.skyline[:] = []
+        for segment in skyline:
+            if self.skyline and (self.skyline[-1][1] == segment[1]):
+                self.skyline[-1][2] += segment[2]
+            else:
+                self.skyline.append(segment)
+        return position
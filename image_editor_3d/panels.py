@@ -1,8 +1,10 @@
 import bpy
 
-from . import operators, properties
+from . import operators, profiling, properties
 
 
+PROFILING_STAT_DISPLAY_COUNT = 20
+
 class PT_Main(bpy.types.Panel):
     bl_idname = "IE3_PT_Main"
     bl_label = "Image Editor 3D"
@@ -15,6 +17,7 @@ class PT_Main(bpy.types.Panel):
         layout = self.layout
 
         if not ie3.b_is_editor_scene:
+            self.layout.prop(ie3, "overlay_mode")
             self.layout.operator(operators.OT_StartEditing.bl_idname)
             return
 
@@ -31,9 +34,9 @@ class PT_Main(bpy.types.Panel):
             grid.label(text="Keywords")
             grid.label(text="Color Depth")
 
-            current_map_data_list = ie3.get_current_map_data_list()
-            for map_data in current_map_data_list:
-                t = map_data.get_type()
+            map_list_model = ie3.get_map_list_model()
+            for i, t in zip(map_list_model.current_map_indices, map_list_model.current_map_types):
+                map_data = ie3.map_data_list[i]
                 if t == properties.MapType.Basic:
                     grid.label(text=map_data.default_name)
                     grid.prop(map_data, "display_name", text="")
@@ -48,12 +51,25 @@ class PT_Main(bpy.types.Panel):
             layout.operator(operators.OT_SaveSceneSettingGroup.bl_idname, text="Save")
             layout.operator(operators.OT_LoadSceneSettingGroup.bl_idname, text="Load")
 
+            row = layout.row()
+            row.operator(operators.OT_ExportSnapshot.bl_idname, text="Export snapshot")
+            row.operator(operators.OT_ImportSnapshot.bl_idname, text="Import snapshot")
+
         header_layer_creation, panel_layer_creation = layout.panel("layer_creation", default_closed=True)
         header_layer_creation.label(text="Layer Creation")
         if panel_layer_creation:
             self.layout.operator(operators.OT_CreateImageObj.bl_idname, text="Create image")
+            self.layout.operator(operators.OT_ImportImageObjs.bl_idname, text="Import images")
+            self.layout.operator(operators.OT_ImportLayeredImage.bl_idname, text="Import layered image")
             self.layout.operator(operators.OT_CreateBasicLayerObj.bl_idname, text="Create basic layer")
+            self.layout.label(text="Create procedural layer")
+            grid = layout.grid_flow(row_major=True, columns=2)
+            for kind in properties.ProceduralKind:
+                op = grid.operator(operators.OT_CreateProceduralLayerObj.bl_idname, text=kind.name)
+                op.kind = kind.name
             self.layout.operator(operators.OT_DuplicateLayerObj.bl_idname, text="Duplicate layer")
+            op = self.layout.operator(operators.OT_DuplicateLayerObj.bl_idname, text="Duplicate layer as instance")
+            op.b_as_instance = True
 
         header_active_layer, panel_active_layer = layout.panel("active_layer", default_closed=True)
         header_active_layer.label(text="Active Layer")
@@ -65,9 +81,9 @@ class PT_Main(bpy.types.Panel):
                 grid.label(text="File Path")
                 grid.label(text="")
 
-                current_map_data_list = ie3.get_current_map_data_list()
-                for i, map_data in enumerate(current_map_data_list):
-                    display_name = map_data.get_display_name()
+                map_list_model = ie3.get_map_list_model()
+                for i, display_name in enumerate(map_list_model.current_map_display_names):
+                    map_data = ie3.map_data_list[map_list_model.current_map_indices[i]]
                     grid.label(text=display_name)
                     grid.prop(map_data, "file_path", text="")
                     op = grid.operator(operators.OT_SelectImageObjMap.bl_idname, text="", icon="FILE_FOLDER")
@@ -76,10 +92,51 @@ class PT_Main(bpy.types.Panel):
                 self.layout.operator(operators.OT_SelectImageObjMapsWithKeywords.bl_idname, text="Select maps with keywords")
                 self.layout.prop(ie3, "b_use_grayscale_as_opacity")
                 self.layout.prop(ie3, "opacity")
+                self.layout.prop(ie3, "blend_mode")
 
                 self.layout.prop(ie3, "mapping_location")
                 self.layout.prop(ie3, "mapping_rotation")
                 self.layout.prop(ie3, "mapping_scale")
+            elif layer_obj_type == properties.LayerObjType.Procedural:
+                self.layout.prop(ie3, "procedural_kind")
+                self.layout.prop(ie3, "procedural_color_a")
+                self.layout.prop(ie3, "procedural_color_b")
+                procedural_kind = properties.ProceduralKind(ie3.procedural_kind)
+                if procedural_kind == properties.ProceduralKind.Gradient:
+                    self.layout.prop(ie3, "procedural_angle")
+                if procedural_kind in [properties.ProceduralKind.Noise, properties.ProceduralKind.EdgeWear]:
+                    self.layout.prop(ie3, "procedural_scale")
+                    self.layout.prop(ie3, "procedural_octaves")
+                    self.layout.prop(ie3, "procedural_seed")
+                if procedural_kind == properties.ProceduralKind.EdgeWear:
+                    self.layout.prop(ie3, "procedural_width")
+                self.layout.prop(ie3, "opacity")
+                self.layout.prop(ie3, "blend_mode")
+
+                self.layout.prop(ie3, "mapping_location")
+                self.layout.prop(ie3, "mapping_rotation")
+                self.layout.prop(ie3, "mapping_scale")
+            elif layer_obj_type == properties.LayerObjType.Basic:
+                self.layout.prop(ie3, "display_map_name")
+                self.layout.prop(ie3, "basic_value")
+                self.layout.prop(ie3, "opacity")
+
+            if layer_obj_type in [properties.LayerObjType.Image, properties.LayerObjType.Procedural, properties.LayerObjType.Basic]:
+                instance_count = context.active_object.data.users
+                if instance_count > 1:
+                    self.layout.label(text=f"Instances: {instance_count}")
+                    self.layout.prop(context.active_object, "color", index=3, text="Instance Opacity")
+                    self.layout.operator(operators.OT_MakeLayerObjUnique.bl_idname, text="Make unique")
+
+            obj_type = properties.get_obj_type(context.active_object)
+            if obj_type == properties.ObjType.LayerGroup:
+                self.layout.prop(context.active_object, "name", text="Group")
+                self.layout.prop(ie3, "group_opacity", text="Opacity")
+                self.layout.prop(context.active_object, "hide_render", text="Hide in export")
+            elif obj_type == properties.ObjType.Layer:
+                group_obj = properties.get_layer_group_obj(context.active_object)
+                if group_obj is not None:
+                    self.layout.label(text=f"Group: {group_obj.name}")
 
         header_snapping_and_alignment, panel_snapping_and_alignment = layout.panel("snapping_and_alignment", default_closed=True)
         header_snapping_and_alignment.label(text="Snapping & Alignment")
@@ -116,18 +173,73 @@ class PT_Main(bpy.types.Panel):
             op_top.target = operators.OT_MoveLayerObj.Target.Top.name
             op_bottom = row.operator(operators.OT_MoveLayerObj.bl_idname, text="Bottom")
             op_bottom.target = operators.OT_MoveLayerObj.Target.Bottom.name
+            row = layout.row()
+            row.operator(operators.OT_GroupLayerObjs.bl_idname, text="Group")
+            row.operator(operators.OT_UngroupLayerObjs.bl_idname, text="Ungroup")
 
         header_viewport, panel_viewport = layout.panel("viewport", default_closed=True)
         header_viewport.label(text="Viewport")
         if panel_viewport:
             layout.prop(ie3, "display_map_name")
+            self.layout.prop(ie3, "b_watch_source_maps")
             self.layout.prop(ie3, "b_show_overlay")
             self.layout.prop(ie3, "overlay_opacity")
+            self.layout.prop(ie3, "b_use_texture_cache")
+            if ie3.b_use_texture_cache:
+                self.layout.prop(ie3, "viewport_max_texture_size")
+            self.layout.operator(operators.OT_BuildTextureCache.bl_idname)
+            self.layout.prop(ie3, "atlas_size")
+            self.layout.prop(ie3, "atlas_max_source_size")
+            row = layout.row()
+            row.operator(operators.OT_BuildAtlas.bl_idname)
+            op = row.operator(operators.OT_BuildAtlas.bl_idname, text="Repack")
+            op.b_repack = True
+            row.operator(operators.OT_ClearAtlas.bl_idname)
+            self.layout.operator(operators.OT_CleanImageStore.bl_idname)
 
         header_export, panel_export = layout.panel("export", default_closed=True)
         header_export.label(text="Export")
         if panel_export:
+            self.layout.prop(ie3, "export_backend")
+            if properties.ExportBackend(ie3.export_backend) == properties.ExportBackend.Compositor:
+                self.layout.prop(ie3, "compositor_memory_budget")
+                self.layout.prop(ie3, "compositor_cache_size")
+                self.layout.prop(ie3, "pixel_cache_size")
+            row = layout.row()
+            row.prop(ie3, "preview_resolution", text="")
+            row.operator(operators.OT_PreviewMap.bl_idname)
             self.layout.operator(operators.OT_ExportMaps.bl_idname)
+            if operators.OT_ExportMaps.b_is_running:
+                self.layout.label(text="Exporting... (Esc to cancel)")
+
+            dirty_uv_tile_nums = [str(d.num) for d in ie3.uv_tile_data_list if d.b_is_dirty]
+            if dirty_uv_tile_nums:
+                self.layout.label(text=f"Changed tiles: {', '.join(dirty_uv_tile_nums)}")
+
+        header_profiling, panel_profiling = layout.panel("profiling", default_closed=True)
+        header_profiling.label(text="Profiling")
+        if panel_profiling:
+            self.layout.prop(ie3, "b_enable_profiling")
+
+            row = layout.row()
+            op = row.operator(operators.OT_ExportProfilingStats.bl_idname, text="Export stats")
+            op.file_format = operators.OT_ExportProfilingStats.Format.Stats.name
+            op = row.operator(operators.OT_ExportProfilingStats.bl_idname, text="Export trace")
+            op.file_format = operators.OT_ExportProfilingStats.Format.ChromeTrace.name
+            self.layout.operator(operators.OT_ResetProfilingStats.bl_idname, text="Reset")
+
+            sorted_stats = profiling.get_sorted_stats()
+            if sorted_stats:
+                grid = layout.grid_flow(row_major=True, columns=4)
+                grid.label(text="Name")
+                grid.label(text="Count")
+                grid.label(text="Total (ms)")
+                grid.label(text="p90 (ms)")
+                for stat in sorted_stats[:PROFILING_STAT_DISPLAY_COUNT]:
+                    grid.label(text=stat.name)
+                    grid.label(text=str(stat.count))
+                    grid.label(text=f"{stat.total_time * 1000.0:.1f}")
+                    grid.label(text=f"{stat.get_percentile(90) * 1000.0:.2f}")
 
 clss = [
     PT_Main,
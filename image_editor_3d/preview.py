@@ -0,0 +1,135 @@
+import hashlib
+import json
+import os
+
+import bpy
+
+from . import export, profiling, properties, snapshot
+
+
+# Preview of one map on one UDIM tile, composited in memory by the compositor
+# into a generated image without writing files.
+#
+# Only the layers overlapping the tile are snapshotted. Previews are cached
+# by a fingerprint of the snapshot, the source files and the settings, so
+# switching back to a previewed map or tile shows the existing image, and
+# any edit of the layer stack composites again.
+
+PREVIEW_IMAGE_NAME = "IE3 Preview"
+FINGERPRINT_KEY = "ie3_preview_fingerprint"
+MAX_PREVIEW_IMAGE_COUNT = 16
+
+# Fingerprint -> image name, from the least recently used.
+preview_image_names = {}
+
+def create_preview_snapshot(scene, uv_tile_num):
+    uv_tile_coord = properties.uv_tile_num_to_coord(uv_tile_num)[:2]
+
+    preview_snapshot = snapshot.Snapshot()
+    preview_snapshot.header = snapshot.create_snapshot_header(scene)
+    layer_objs = properties.find_objs_with_type(properties.ObjType.Layer, scene)
+    layer_objs.sort(key=lambda o: o.location.z)
+    for layer_obj in layer_objs:
+        if layer_obj.hide_render:
+            continue
+        layer_obj_type = properties.get_layer_obj_type(layer_obj)
+        if not layer_obj_type in [properties.LayerObjType.Image, properties.LayerObjType.Procedural, properties.LayerObjType.Basic]:
+            continue
+        if not uv_tile_coord in properties.find_uv_tile_coords_overlapping_obj(layer_obj):
+            continue
+        preview_snapshot.layers.append(snapshot.create_layer_snapshot(layer_obj))
+    return preview_snapshot
+
+def get_file_stamp(file_path):
+    try:
+        st = os.stat(file_path)
+    except OSError:
+        return None
+    return [st.st_size, st.st_mtime_ns]
+
+def create_fingerprint(preview_snapshot, map_internal_name, resolution, b_use_texture_cache):
+    file_paths = {preview_snapshot.header.default_map_file_path}
+    layer_dicts = []
+    for layer_snapshot in preview_snapshot.layers:
+        d = layer_snapshot.to_dict()
+        # Names do not affect pixels.
+        del d["name"]
+        del d["mesh_name"]
+        layer_dicts.append(d)
+        file_paths.update(layer_snapshot.maps.values())
+
+    d = {
+        "header": preview_snapshot.header.to_dict(),
+        "layers": layer_dicts,
+        "file_stamps": {p: get_file_stamp(p) for p in sorted(file_paths)},
+        "map_internal_name": map_internal_name,
+        "resolution": resolution,
+        "b_use_texture_cache": b_use_texture_cache,
+    }
+    s = json.dumps(d, sort_keys=True)
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+def find_preview_image(fingerprint):
+    image_name = preview_image_names.pop(fingerprint, None)
+    if not image_name:
+        return None
+    image = bpy.data.images.get(image_name)
+    if (image is None) or (image.get(FINGERPRINT_KEY) != fingerprint):
+        return None
+    preview_image_names[fingerprint] = image_name
+    return image
+
+def remove_old_preview_images():
+    while len(preview_image_names) > MAX_PREVIEW_IMAGE_COUNT:
+        fingerprint = next(iter(preview_image_names))
+        image = bpy.data.images.get(preview_image_names.pop(fingerprint))
+        if (image is not None) and (image.get(FINGERPRINT_KEY) == fingerprint):
+            bpy.data.images.remove(image)
+
+def composite_preview(scene, preview_snapshot, uv_tile_num, map_internal_name, resolution):
+    from . import compositor
+
+    ie3 = scene.ie3
+    layers = snapshot.create_compositor_layers(preview_snapshot, map_internal_name, ie3.b_use_texture_cache)
+    preview_compositor = compositor.Compositor(ie3.compositor_memory_budget * 1024 ** 2, ie3.compositor_cache_size * 1024 ** 2, export.get_pixel_cache(scene))
+    try:
+        return preview_compositor.composite_pixels(layers, properties.uv_tile_num_to_coord(uv_tile_num), resolution)
+    finally:
+        preview_compositor.close()
+
+def get_preview_image(scene, uv_tile_num, map_internal_name, map_display_name, resolution):
+    # Returns the preview image and whether it was found in the cache.
+    with profiling.span("preview.create_snapshot"):
+        preview_snapshot = create_preview_snapshot(scene, uv_tile_num)
+    fingerprint = create_fingerprint(preview_snapshot, map_internal_name, resolution, scene.ie3.b_use_texture_cache)
+
+    image = find_preview_image(fingerprint)
+    if image is not None:
+        return image, True
+
+    with profiling.span("preview.composite"):
+        pixels = composite_preview(scene, preview_snapshot, uv_tile_num, map_internal_name, resolution)
+
+    image = bpy.data.images.new(f"{PREVIEW_IMAGE_NAME} {uv_tile_num} {map_display_name}", resolution, resolution, alpha=True)
+    image[FINGERPRINT_KEY] = fingerprint
+    # Pixels of Blender images start from the bottom row.
+    image.pixels.foreach_set(pixels[::-1].ravel())
+    image.update()
+
+    preview_image_names[fingerprint] = image.name
+    remove_old_preview_images()
+
+    return image, False
+
+def show_image(context, image):
+    # Shows the image in an Image Editor of the screen, or in a new window if
+    # there is none.
+    for area in context.screen.areas:
+        if area.type == "IMAGE_EDITOR":
+            area.spaces.active.image = image
+            return
+
+    bpy.ops.wm.window_new()
+    area = context.window_manager.windows[-1].screen.areas[0]
+    area.type = "IMAGE_EDITOR"
+    area.spaces.active.image = image
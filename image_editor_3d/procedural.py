@@ -0,0 +1,113 @@
+import hashlib
+import json
+
+import numpy as np
+
+
+# Procedural layer kernels. This module depends only on NumPy.
+#
+# A procedural layer is evaluated per pixel from the (mapped) UVs of the
+# layer instead of being read from an image, so it is resolution
+# independent and never stored at full resolution. Every kind computes a
+# factor t in [0, 1] which mixes color_a into color_b, both linear straight
+# RGBA. Parameters are a plain dict with the keys of DEFAULT_PARAMS.
+#
+# The kernels see UVs wrapped into [0, 1), so every kind repeats outside the
+# layer UVs the same as its preview image, which the viewport draws with the
+# repeat extension of the image texture node.
+
+DEFAULT_PARAMS = {
+    "kind": "Fill",
+    "color_a": [1.0, 1.0, 1.0, 1.0],
+    "color_b": [0.0, 0.0, 0.0, 1.0],
+    # Gradient direction in degrees, 0 is from left to right.
+    "angle": 0.0,
+    # Noise cells per UV unit, octave count and seed.
+    "scale": 8.0,
+    "octaves": 4,
+    "seed": 0,
+    # Edge wear width in UV units.
+    "width": 0.05,
+}
+
+def get_params(params):
+    # Fills in the parameters missing in params.
+    d = dict(DEFAULT_PARAMS)
+    d.update(params)
+    return d
+
+def create_params_hash(params):
+    s = json.dumps(get_params(params), sort_keys=True)
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+def hash_lattice(ix, iy, seed):
+    # Integer hash of the lattice points, in [0, 1).
+    h = ix.astype(np.uint32) * np.uint32(0x8DA6B343)
+    h ^= iy.astype(np.uint32) * np.uint32(0xD8163841)
+    h ^= np.uint32((seed * 0xCB1AB31F) & 0xFFFFFFFF)
+    h ^= h >> np.uint32(13)
+    h *= np.uint32(0x5BD1E995)
+    h ^= h >> np.uint32(15)
+    return h.astype(np.float64) / 2.0 ** 32
+
+def value_noise(x, y, seed):
+    x0 = np.floor(x)
+    y0 = np.floor(y)
+    fx = x - x0
+    fy = y - y0
+    fx = fx * fx * (3.0 - 2.0 * fx)
+    fy = fy * fy * (3.0 - 2.0 * fy)
+    ix = x0.astype(np.int64)
+    iy = y0.astype(np.int64)
+    n00 = hash_lattice(ix, iy, seed)
+    n10 = hash_lattice(ix + 1, iy, seed)
+    n01 = hash_lattice(ix, iy + 1, seed)
+    n11 = hash_lattice(ix + 1, iy + 1, seed)
+    return (n00 * (1.0 - fx) + n10 * fx) * (1.0 - fy) + (n01 * (1.0 - fx) + n11 * fx) * fy
+
+def fractal_noise(uvs, scale, octaves, seed):
+    t = np.zeros(len(uvs), np.float64)
+    amplitude = 1.0
+    amplitude_sum = 0.0
+    frequency = scale
+    for i in range(max(1, int(octaves))):
+        t += value_noise(uvs[:, 0] * frequency, uvs[:, 1] * frequency, seed + i) * amplitude
+        amplitude_sum += amplitude
+        amplitude *= 0.5
+        frequency *= 2.0
+    return t / amplitude_sum
+
+def fill(params, uvs):
+    return np.zeros(len(uvs), np.float64)
+
+def gradient(params, uvs):
+    angle = np.radians(params["angle"])
+    t = (uvs[:, 0] - 0.5) * np.cos(angle) + (uvs[:, 1] - 0.5) * np.sin(angle) + 0.5
+    return np.clip(t, 0.0, 1.0)
+
+def noise(params, uvs):
+    return fractal_noise(uvs, params["scale"], params["octaves"], params["seed"])
+
+def edge_wear(params, uvs):
+    # color_b near the borders of the layer UVs, over a width roughened by
+    # the noise.
+    distances = np.minimum(np.minimum(uvs[:, 0], 1.0 - uvs[:, 0]), np.minimum(uvs[:, 1], 1.0 - uvs[:, 1]))
+    widths = params["width"] * (0.5 + fractal_noise(uvs, params["scale"], params["octaves"], params["seed"]))
+    return np.clip(1.0 - distances / np.maximum(widths, 1.0e-8), 0.0, 1.0)
+
+# Kind name -> kernel computing the mix factor.
+KERNELS = {
+    "Fill": fill,
+    "Gradient": gradient,
+    "Noise": noise,
+    "EdgeWear": edge_wear,
+}
+
+def evaluate(params, uvs):
+    # uvs is (N, 2). Returns (N, 4) linear straight RGBA.
+    params = get_params(params)
+    uvs = np.asarray(uvs, np.float64)
+    t = KERNELS[params["kind"]](params, uvs - np.floor(uvs))[:, np.newaxis]
+    color_a = np.array(params["color_a"], np.float64)
+    color_b = np.array(params["color_b"], np.float64)
+    return (color_a + (color_b - color_a) * t).astype(np.float32)
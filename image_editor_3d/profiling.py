@@ -0,0 +1,199 @@
+import contextlib
+import functools
+import json
+import random
+import time
+import tracemalloc
+
+from . import error
+
+
+MAX_SAMPLE_COUNT = 4096
+MAX_EVENT_COUNT = 100000
+
+b_is_enabled = False
+
+class Stat(object):
+    def __init__(self, name):
+        super(Stat, self).__init__()
+        self.name = name
+        self.count = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.peak_memory = 0
+        self.samples = []
+
+    def add(self, elapsed_time, peak_memory):
+        self.count += 1
+        self.total_time += elapsed_time
+        self.max_time = max(self.max_time, elapsed_time)
+        self.peak_memory = max(self.peak_memory, peak_memory)
+
+        # Reservoir sampling keeps the percentiles meaningful with a bounded
+        # number of samples.
+        if len(self.samples) < MAX_SAMPLE_COUNT:
+            self.samples.append(elapsed_time)
+        else:
+            i = random.randrange(self.count)
+            if i < MAX_SAMPLE_COUNT:
+                self.samples[i] = elapsed_time
+
+    def get_percentile(self, percentile):
+        if not self.samples:
+            return 0.0
+        samples = sorted(self.samples)
+        i = min(len(samples) - 1, int(len(samples) * percentile / 100.0))
+        return samples[i]
+
+    def to_dict(self):
+        d = {
+            "name": self.name,
+            "count": self.count,
+            "total_time": self.total_time,
+            "mean_time": self.total_time / self.count if self.count else 0.0,
+            "p50_time": self.get_percentile(50),
+            "p90_time": self.get_percentile(90),
+            "p99_time": self.get_percentile(99),
+            "max_time": self.max_time,
+            "peak_python_memory": self.peak_memory,
+        }
+        return d
+
+stats = {}
+events = []
+span_stack = []
+origin_time = time.perf_counter()
+
+class Span(object):
+    def __init__(self, name):
+        super(Span, self).__init__()
+        self.name = name
+        self.start_time = 0.0
+        self.peak_memory = 0
+
+    def __enter__(self):
+        # Peaks are tracked per span by resetting the tracemalloc peak and
+        # handing the partial peak over to the enclosing span.
+        if span_stack:
+            parent = span_stack[-1]
+            parent.peak_memory = max(parent.peak_memory, tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+        span_stack.append(self)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        end_time = time.perf_counter()
+        elapsed_time = end_time - self.start_time
+        self.peak_memory = max(self.peak_memory, tracemalloc.get_traced_memory()[1])
+
+        if span_stack and (span_stack[-1] is self):
+            span_stack.pop()
+        if span_stack:
+            parent = span_stack[-1]
+            parent.peak_memory = max(parent.peak_memory, self.peak_memory)
+
+        if not self.name in stats:
+            stats[self.name] = Stat(self.name)
+        stats[self.name].add(elapsed_time, self.peak_memory)
+
+        if len(events) < MAX_EVENT_COUNT:
+            events.append({
+                "name": self.name,
+                "ph": "X",
+                "ts": (self.start_time - origin_time) * 1000000.0,
+                "dur": elapsed_time * 1000000.0,
+                "pid": 0,
+                "tid": 0,
+            })
+
+        return False
+
+null_span = contextlib.nullcontext()
+
+def span(name):
+    if not b_is_enabled:
+        return null_span
+    return Span(name)
+
+def call(name, func, args):
+    if not b_is_enabled:
+        return func(*args)
+    with Span(name):
+        return func(*args)
+
+def profiled(name):
+    # Blender checks the argument count of property callbacks and operator
+    # methods, so the wrapper keeps the positional parameters of func
+    # instead of taking *args.
+    def decorator(func):
+        arg_count = func.__code__.co_argcount
+        if arg_count == 0:
+            def wrapper():
+                return call(name, func, ())
+        elif arg_count == 2:
+            def wrapper(self, context):
+                return call(name, func, (self, context))
+        elif arg_count == 3:
+            def wrapper(self, context, event):
+                return call(name, func, (self, context, event))
+        else:
+            raise TypeError(f"\"{func.__qualname__}\" has an unsupported number of arguments.")
+        functools.update_wrapper(wrapper, func)
+        wrapper.b_is_profiled = True
+        return wrapper
+    return decorator
+
+def instrument_operator_classes(clss):
+    for cls in clss:
+        for method_name in ["invoke", "execute", "modal"]:
+            method = cls.__dict__.get(method_name)
+            if (method is None) or getattr(method, "b_is_profiled", False):
+                continue
+            setattr(cls, method_name, profiled(f"{cls.__name__}.{method_name}")(method))
+
+def set_enabled(val):
+    global b_is_enabled
+    if val == b_is_enabled:
+        return
+    b_is_enabled = val
+
+    if b_is_enabled:
+        tracemalloc.start()
+    else:
+        span_stack.clear()
+        tracemalloc.stop()
+
+def reset():
+    global origin_time
+    stats.clear()
+    events.clear()
+    origin_time = time.perf_counter()
+
+def get_sorted_stats():
+    return sorted(stats.values(), key=lambda s: s.total_time, reverse=True)
+
+def write_stats(file_path):
+    try:
+        d = {
+            "stats": [s.to_dict() for s in get_sorted_stats()],
+        }
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(d, file, indent=4)
+    except:
+        return error.Error("An error occurred while writing to the file.")
+
+    return None
+
+def write_chrome_trace(file_path):
+    try:
+        d = {
+            "traceEvents": events,
+            "displayTimeUnit": "ms",
+        }
+        with open(file_path, "w", encoding="utf-8") as file:
+            json.dump(d, file)
+    except:
+        return error.Error("An error occurred while writing to the file.")
+
+    return None
@@ -1,33 +1,48 @@
 import math
 import os
+import tempfile
 from enum import StrEnum
 
 import bmesh
 import bpy
 import mathutils
-import numpy as np
-import OpenImageIO as oiio
 
-from . import dobj
+from . import dobj, profiling
+from .layertypes import DEFAULT_BASIC_VALUE, BlendMode, LayerObjType, SpecialMapType
 
 
-class SpecialMapType(StrEnum):
-    Opacity = "Opacity"
-
 class ObjType(StrEnum):
     Invalid = "Invalid"
     UvLayout = "UvLayout"
     Layer = "Layer"
+    LayerGroup = "LayerGroup"
+
+class ProceduralKind(StrEnum):
+    Fill = "Fill"
+    Gradient = "Gradient"
+    Noise = "Noise"
+    EdgeWear = "EdgeWear"
+
+# Blend modes drawn exactly in the viewport. The others are drawn as Normal
+# and only exported exactly by the compositor.
+VIEWPORT_BLEND_MODES = [
+    BlendMode.Multiply,
+    BlendMode.Screen,
+    BlendMode.Add,
+]
 
-class LayerObjType(StrEnum):
-    Invalid = "Invalid"
-    Basic = "Basic"
-    Image = "Image"
-    Overlay = "Overlay"
+class OverlayMode(StrEnum):
+    Raster = "Raster"
+    Vector = "Vector"
+
+# Width of the vector overlay wires in texels of the export resolution, as
+# a UV tile is one world unit wide.
+OVERLAY_WIRE_WIDTH = 2.0
+OVERLAY_WIRE_THICKNESS_KEY = "overlay_wire_thickness"
 
-BASIC_MAP_COUNT = 20
-SPECIAL_MAP_COUNT = 1
-MAP_COUNT = BASIC_MAP_COUNT + SPECIAL_MAP_COUNT
+class ExportBackend(StrEnum):
+    Render = "Render"
+    Compositor = "Compositor"
 
 RESOLUTIONS = [
     128,
@@ -65,20 +80,93 @@ SUPPORTED_IMAGE_EXTS = [
 ]
 IMAGE_FILE_FILTER = ";".join([f"*{f}" for f in SUPPORTED_IMAGE_EXTS])
 
+SOURCE_FILE_PATH_KEY = "source_file_path"
+LAYER_GROUP_KEY = "layer_group"
+# 1 - the product of the opacities of the groups containing a layer, stored on
+# the layer object so that ungrouped layers need no property.
+GROUP_TRANSPARENCY_KEY = "group_transparency"
+PROCEDURAL_PARAMS_KEY = "procedural_params"
+PROCEDURAL_PREVIEW_SIZE = 256
+PROCEDURAL_PREVIEW_MATERIAL_KEY = "procedural_preview_material"
+BASIC_VALUES_KEY = "basic_values"
+ATLAS_MAPS_KEY = "atlas_maps"
+ATLAS_STATE_KEY = "ie3_atlas_state"
+DUMMY_IMAGE_TRANSPARENT_FILE_NAME = "dummy_transparent.png"
+DUMMY_IMAGE_OPAQUE_FILE_NAME = "dummy_opaque.png"
+DUMMY_IMAGE_OPACITIES = {
+    DUMMY_IMAGE_TRANSPARENT_FILE_NAME: 0.0,
+    DUMMY_IMAGE_OPAQUE_FILE_NAME: 1.0,
+}
+# Raster overlays are stored with a key of the tile and a hash of its
+# layout, so they can be generated again from the UvLayout mesh.
+OVERLAY_KEY_PREFIX = "Overlay_"
+OVERLAY_IMAGE_SIZE = 1024
+OVERLAY_BORDER_WIDTH = 3
+
 def loop_index(index, length):
     if length == 0:
         return index
-    i = index
-    while i < 0:
-        i += length
-    while i >= length:
-        i -= length
-    return i
+    return index % length
 
 def is_image_file_supported(file_path):
     _, ext = os.path.splitext(file_path)
     return ext in SUPPORTED_IMAGE_EXTS
 
+def find_map_file_paths_with_keywords(map_data_list, file_paths):
+    map_file_path_dict = {}
+    for map_data in map_data_list:
+        file_name_keywords = map_data.file_name_keywords.split(",")
+
+        for file_path in file_paths:
+            if not is_image_file_supported(file_path):
+                continue
+
+            file_name = os.path.basename(file_path)
+            for file_name_keyword in file_name_keywords:
+                if file_name_keyword and (file_name_keyword in file_name):
+                    map_file_path_dict[map_data.internal_name] = file_path
+
+    return map_file_path_dict
+
+def find_map_internal_name_with_keywords(map_data_list, name):
+    for map_data in map_data_list:
+        for file_name_keyword in map_data.file_name_keywords.split(","):
+            if file_name_keyword and (file_name_keyword in name):
+                return map_data.internal_name
+    return ""
+
+def group_image_file_paths_with_keywords(map_data_list, file_paths):
+    # Files that only differ by a map keyword (e.g. "decal_albedo.png" and
+    # "decal_rough.png") end up in the same group, i.e. on the same layer.
+    groups = {}
+    for file_path in sorted(file_paths):
+        if not is_image_file_supported(file_path):
+            continue
+
+        file_name = os.path.basename(file_path)
+        stem, _ = os.path.splitext(file_name)
+
+        key = file_name
+        map_internal_name = ""
+        for map_data in map_data_list:
+            for file_name_keyword in map_data.file_name_keywords.split(","):
+                if file_name_keyword and (file_name_keyword in stem):
+                    key = stem.replace(file_name_keyword, "", 1)
+                    map_internal_name = map_data.internal_name
+                    break
+            if map_internal_name:
+                break
+
+        if not map_internal_name:
+            if not map_data_list:
+                continue
+            map_internal_name = map_data_list[0].internal_name
+
+        group = groups.setdefault(key, {})
+        group[map_internal_name] = file_path
+
+    return list(groups.values())
+
 def uv_tile_num_to_coord(num):
     coord = [
         (num - 1001) % 10,
@@ -106,51 +194,229 @@ def location_to_uv_tile_coord(location):
     ]
     return coord
 
+def find_uv_tile_coords_overlapping_obj(obj):
+    corners = [obj.matrix_world @ mathutils.Vector(c) for c in obj.bound_box]
+    min_coord = location_to_uv_tile_coord([min(c.x for c in corners), min(c.y for c in corners)])
+    max_coord = location_to_uv_tile_coord([max(c.x for c in corners), max(c.y for c in corners)])
+
+    coords = []
+    for y in range(min_coord[1], max_coord[1] + 1):
+        for x in range(min_coord[0], max_coord[0] + 1):
+            coords.append([x, y])
+    return coords
+
 def get_addon_dir_path():
     return os.path.dirname(__file__)
 
 def get_user_dir_path():
-    # for development
-    # addon_dir_path = get_addon_dir_path()
-    # user_dir_path = os.path.join(addon_dir_path, "..", "temp")
+    if not __package__.startswith("bl_ext."):
+        # for development and benchmarks, where the add-on is not installed as an extension
+        user_dir_path = os.path.join(tempfile.gettempdir(), "image_editor_3d")
+        os.makedirs(user_dir_path, exist_ok=True)
+        return user_dir_path
     user_dir_path = bpy.utils.extension_path_user(__package__, path="", create=True)
     return user_dir_path
 
+def get_data_dir_path():
+    # Same as get_user_dir_path, but for files which must outlive the
+    # session, so it never falls back to the temporary directory.
+    if not __package__.startswith("bl_ext."):
+        return bpy.utils.user_resource("DATAFILES", path="image_editor_3d", create=True)
+    return get_user_dir_path()
+
 def create_dummy_image(file_name, size, opacity):
     user_dir_path = get_user_dir_path()
     file_path = os.path.join(user_dir_path, file_name)
 
     if not os.path.isfile(file_path):
-        spec = oiio.ImageSpec(size, size, 4, "float")
-        pixels = np.zeros((size, size, 4), np.float64)
-        for row in pixels:
-            for pixel in row:
-                pixel[3] = opacity
-        output = oiio.ImageOutput.create(file_path)
-        output.open(file_path, spec)
-        output.write_image(pixels)
-        output.close()
+        from . import imaging
+        imaging.write_solid_image(file_path, size, opacity)
 
     return file_path
 
+def find_dummy_image_file(file_name, opacity):
+    from . import imagestore
+
+    store_file_path = imagestore.find_file(file_name)
+    if not store_file_path:
+        file_path = create_dummy_image(file_name, 1, opacity)
+        store_file_path = imagestore.add_file(file_path, key=file_name)
+
+    return store_file_path
+
 def find_dummy_image_internal(file_name, opacity):
-    file_path = create_dummy_image(file_name, 1, opacity)
+    from . import imagestore
+
+    dummy_image = imagestore.load_image(find_dummy_image_file(file_name, opacity), key=file_name)
+
+    return dummy_image
+
+def find_procedural_preview_image(material):
+    # Every procedural layer material draws its own generated preview, which
+    # is updated in place when the parameters change. Copied materials still
+    # reference the preview of their original and get a new one.
+    image = material.node_tree.nodes.get("Basic Map").image
+    if (image is not None) and (image.get(PROCEDURAL_PREVIEW_MATERIAL_KEY) == material):
+        return image
+
+    image = bpy.data.images.new("Procedural Preview", PROCEDURAL_PREVIEW_SIZE, PROCEDURAL_PREVIEW_SIZE, alpha=True)
+    image[PROCEDURAL_PREVIEW_MATERIAL_KEY] = material
+    return image
+
+def update_procedural_preview_image(image, params):
+    from . import imaging
+
+    image.pixels.foreach_set(imaging.create_procedural_preview_pixels(image.size[0], params))
+    image.update()
+
+def get_image_source_file_path(image):
+    # Images loaded from the texture cache keep the path of their source.
+    return image.get(SOURCE_FILE_PATH_KEY, image.filepath)
+
+# (source file path, proxy file path) -> image name, so proxies are found
+# without scanning bpy.data.images.
+proxy_image_names = {}
+
+def load_map_image(file_path):
+    ie3 = bpy.context.scene.ie3
+
+    load_file_path = file_path
+    if ie3.b_use_texture_cache:
+        from . import txcache
+        load_file_path = txcache.get_proxy_file_path(bpy.path.abspath(file_path), int(ie3.viewport_max_texture_size))
+
+    if load_file_path == file_path:
+        return bpy.data.images.load(load_file_path, check_existing=True)
+
+    # Proxies are named by the digest of the source, so sources with the same
+    # content share the proxy file but each gets its own image recording its
+    # source path.
+    image = bpy.data.images.get(proxy_image_names.get((file_path, load_file_path), ""))
+    if (image is not None) and (image.filepath == load_file_path) and (image.get(SOURCE_FILE_PATH_KEY) == file_path):
+        return image
+
+    image = bpy.data.images.load(load_file_path, check_existing=False)
+    image[SOURCE_FILE_PATH_KEY] = file_path
+    proxy_image_names[(file_path, load_file_path)] = image.name
+    return image
+
+def resolve_generated_images():
+    # Images of the store are referenced by path, which may not exist on this
+    # machine or after the store was cleaned. Their files are found again by
+    # key, and generated again if the store does not have them.
+    from . import imagestore
 
     for image in bpy.data.images:
-        if image.filepath == file_path:
-            return image
+        key = image.get(imagestore.STORE_KEY_KEY)
+        if (not key) or image.packed_file or image.library:
+            continue
+        if os.path.isfile(bpy.path.abspath(image.filepath)):
+            continue
 
-    dummy_image = bpy.data.images.load(file_path)
-    dummy_image.pack()
+        if key in DUMMY_IMAGE_OPACITIES:
+            store_file_path = find_dummy_image_file(key, DUMMY_IMAGE_OPACITIES[key])
+        elif key.startswith(OVERLAY_KEY_PREFIX):
+            store_file_path = find_overlay_image_file_with_key(key)
+        else:
+            store_file_path = imagestore.find_file(key)
+        if store_file_path:
+            image.filepath = store_file_path
+            imagestore.image_names[store_file_path] = image.name
+
+def find_uv_tile_layout(uv_layout_mesh, uv_tile_num):
+    from . import imaging, snapping
+
+    uv_layout_arrays = snapping.UvLayoutArrays.from_mesh(uv_layout_mesh)
+    return imaging.find_uv_tile_layout(uv_layout_arrays.vert_coords, uv_layout_arrays.segments, uv_layout_arrays.loop_vert_indices, uv_layout_arrays.loop_starts, uv_layout_arrays.loop_totals, uv_tile_num_to_coord(uv_tile_num))
+
+def get_overlay_key(uv_tile_num, edge_coords, outline_edge_coords):
+    import hashlib
+
+    hasher = hashlib.sha1()
+    hasher.update(edge_coords.tobytes())
+    hasher.update(outline_edge_coords.tobytes())
+    return f"{OVERLAY_KEY_PREFIX}{uv_tile_num}_{hasher.hexdigest()}"
+
+def find_overlay_image_file(uv_layout_mesh, uv_tile_num, key=None):
+    # Returns the key and the store file path of the raster overlay of the
+    # tile, generating the image if the store does not have it. If key is
+    # given and the layout does not match it, returns None.
+    from . import imagestore, imaging
+
+    edge_coords, outline_edge_coords = find_uv_tile_layout(uv_layout_mesh, uv_tile_num)
+    layout_key = get_overlay_key(uv_tile_num, edge_coords, outline_edge_coords)
+    if key and (key != layout_key):
+        return None
 
-    return dummy_image
+    store_file_path = imagestore.find_file(layout_key)
+    if not store_file_path:
+        file_path = os.path.join(get_user_dir_path(), f"Overlay_{uv_tile_num}.png")
+        imaging.write_overlay_image(file_path, OVERLAY_IMAGE_SIZE, edge_coords, outline_edge_coords, OVERLAY_BORDER_WIDTH)
+        store_file_path = imagestore.add_file(file_path, key=layout_key, b_move=True)
+    return layout_key, store_file_path
+
+def find_overlay_image_file_with_key(key):
+    # The layout is looked up in the UvLayout meshes of the editor scenes.
+    from . import imagestore
+
+    store_file_path = imagestore.find_file(key)
+    if store_file_path:
+        return store_file_path
+
+    uv_tile_num = int(key[len(OVERLAY_KEY_PREFIX):].split("_")[0])
+    for scene in bpy.data.scenes:
+        for uv_layout_obj in find_objs_with_type(ObjType.UvLayout, scene):
+            result = find_overlay_image_file(uv_layout_obj.data, uv_tile_num, key)
+            if result is not None:
+                return result[1]
+    return None
+
+def migrate_legacy_data():
+    # Data of layers created by older versions is upgraded once when a file
+    # is opened instead of by the wrappers, which are also used on read
+    # paths.
+    for scene in bpy.data.scenes:
+        for image_obj in find_layer_objs_with_type(LayerObjType.Image, scene):
+            if image_obj.library or image_obj.data.materials[0].library:
+                continue
+            ImageObjWrapper(image_obj).migrate_legacy_maps()
+        for basic_layer_obj in find_layer_objs_with_type(LayerObjType.Basic, scene):
+            if basic_layer_obj.library or basic_layer_obj.data.library:
+                continue
+            BasicLayerObjWrapper(basic_layer_obj).migrate_legacy_material()
+
+@bpy.app.handlers.persistent
+def migrate_legacy_data_handler(*args):
+    with profiling.span("migrate_legacy_data"):
+        migrate_legacy_data()
+
+def migrate_legacy_data_timer():
+    # The file open when the add-on is enabled is migrated once bpy.data can
+    # be written.
+    migrate_legacy_data()
+    return None
+
+def update_procedural_preview_images():
+    material_pointers = set()
+    for layer_obj in find_layer_objs_with_type(LayerObjType.Procedural):
+        material_pointer = layer_obj.data.materials[0].as_pointer()
+        if material_pointer in material_pointers:
+            continue
+        material_pointers.add(material_pointer)
+        ProceduralLayerObjWrapper(layer_obj).update_preview()
+
+@bpy.app.handlers.persistent
+def resolve_generated_images_handler(*args):
+    with profiling.span("resolve_generated_images"):
+        resolve_generated_images()
+        update_procedural_preview_images()
 
 def find_dummy_image_transparent():
-    dummy_image = find_dummy_image_internal("dummy_transparent.png", 0.0)
+    dummy_image = find_dummy_image_internal(DUMMY_IMAGE_TRANSPARENT_FILE_NAME, 0.0)
     return dummy_image
 
 def find_dummy_image_opaque():
-    dummy_image = find_dummy_image_internal("dummy_opaque.png", 1.0)
+    dummy_image = find_dummy_image_internal(DUMMY_IMAGE_OPAQUE_FILE_NAME, 1.0)
     return dummy_image
 
 def find_addon_collection():
@@ -160,6 +426,8 @@ def find_addon_collection():
     return None
 
 def get_camera_location():
+    if not bpy.context.screen:
+        return mathutils.Vector()
     for area in bpy.context.screen.areas:
         if area.type != "VIEW_3D":
             continue
@@ -184,9 +452,11 @@ def set_obj_type(obj, t):
     except:
         pass
 
-def find_objs_with_type(t):
+def find_objs_with_type(t, scene=None):
+    if scene is None:
+        scene = bpy.context.scene
     objs = []
-    for obj in bpy.context.scene.objects:
+    for obj in scene.objects:
         tt = get_obj_type(obj)
         if tt == t:
             objs.append(obj)
@@ -207,22 +477,73 @@ def set_layer_obj_type(obj, t):
     except:
         pass
 
-def find_layer_objs_with_type(t):
+def find_layer_objs_with_type(t, scene=None):
+    if scene is None:
+        scene = bpy.context.scene
     layer_objs = []
-    for layer_obj in bpy.context.scene.objects:
+    for layer_obj in scene.objects:
         tt = get_layer_obj_type(layer_obj)
         if tt == t:
             layer_objs.append(layer_obj)
     return layer_objs
 
+def get_layer_group_obj(obj):
+    group_obj = None
+    try:
+        group_obj = obj.get(LAYER_GROUP_KEY)
+    except:
+        pass
+    # Deleted groups stay referenced until they are purged.
+    if (group_obj is None) or (get_obj_type(group_obj) != ObjType.LayerGroup) or (not group_obj.users_scene):
+        return None
+    return group_obj
+
+def set_layer_group_obj(obj, group_obj):
+    if group_obj is None:
+        obj.pop(LAYER_GROUP_KEY, None)
+    else:
+        obj[LAYER_GROUP_KEY] = group_obj
+
+def find_layer_group_objs(obj):
+    # Groups containing obj, from the outermost.
+    group_objs = []
+    group_obj = get_layer_group_obj(obj)
+    while (group_obj is not None) and (not group_obj in group_objs):
+        group_objs.insert(0, group_obj)
+        group_obj = get_layer_group_obj(group_obj)
+    return group_objs
+
 def find_sorted_layer_objs():
     layer_objs = find_objs_with_type(ObjType.Layer)
     layer_objs.sort(key=lambda o: o.location.z)
     return layer_objs
 
+def group_layer_objs(layer_objs):
+    # Reorders layer_objs so that the layers of every group are next to each
+    # other where the lowest of them is, the same order as the compositor.
+    layers = []
+    group_layers = {}
+    for layer_obj in layer_objs:
+        parent_layers = layers
+        for group_obj in find_layer_group_objs(layer_obj):
+            if not group_obj.name in group_layers:
+                group_layers[group_obj.name] = []
+                parent_layers.append(group_layers[group_obj.name])
+            parent_layers = group_layers[group_obj.name]
+        parent_layers.append(layer_obj)
+
+    def flatten(items):
+        for item in items:
+            if isinstance(item, list):
+                yield from flatten(item)
+            else:
+                yield item
+
+    return list(flatten(layers))
+
 def sort_layer_objs(layer_objs):
     i = 0
-    for layer_obj in layer_objs:
+    for layer_obj in group_layer_objs(layer_objs):
         layer_obj_type = get_layer_obj_type(layer_obj)
         if layer_obj_type == LayerObjType.Overlay:
             layer_obj.location.z = 490.0
@@ -230,61 +551,23 @@ def sort_layer_objs(layer_objs):
             layer_obj.location.z = 0.01 * i
             i += 1
 
-def find_intersection_internal(p0, p1, p2):
-    val = (p1.x - p0.x) * (p2.y - p0.y) - (p1.y - p0.y) * (p2.x - p0.x)
-    return val
-
 def find_intersection(p00, p01, p10, p11):
-    val0 = find_intersection_internal(p00, p01, p10)
-    val1 = find_intersection_internal(p00, p01, p11)
-    val2 = find_intersection_internal(p10, p11, p00)
-    val3 = find_intersection_internal(p10, p11, p01)
-    if (val0 * val1 > 0.0) or (val2 * val3 > 0.0):
-        return None
-
-    det = (p00.x - p01.x) * (p11.y - p10.y) - (p11.x - p10.x) * (p00.y - p01.y)
-    if math.isclose(det, 0.0):
+    from . import geometry
+    point, b_is_found = geometry.find_intersections(p00.xy, p01.xy, p10.xy, p11.xy)
+    if not b_is_found:
         return None
-
-    t = ((p11.y - p10.y) * (p11.x - p01.x) + (p10.x - p11.x) * (p11.y - p01.y)) / det
-    intersection = mathutils.Vector((
-        t * p00.x + (1.0 - t) * p01.x,
-        t * p00.y + (1.0 - t) * p01.y,
-        0.0
-    ))
-    return intersection
+    return mathutils.Vector((point[0], point[1], 0.0))
 
 def find_closest_point(p0, p1, p):
-    diff0 = p - p0
-    diff1 = p1 - p0
-    diff2 = p0 - p1
-    diff3 = p - p1
-
-    closest_point = mathutils.Vector()
-    if diff0.dot(diff1) < 0.0:
-        closest_point = p0
-    elif diff2.dot(diff3) < 0.0:
-        closest_point = p1
-    else:
-        closest_point = p0 + diff1 / diff1.length * diff0.dot(diff1) / diff1.length
-    return closest_point
+    from . import geometry
+    point = geometry.find_closest_points(p0.xy, p1.xy, p.xy)
+    return mathutils.Vector((point[0], point[1], p0.z))
 
 def face_contains_point(vert_coords, point):
-    winding_num = 0
-    for i in range(len(vert_coords)):
-        current_vert_coord = vert_coords[i]
-        next_vert_coord = vert_coords[loop_index(i + 1, len(vert_coords))]
-
-        if (current_vert_coord.y <= point.y) and (next_vert_coord.y > point.y):
-            t = (point.y - current_vert_coord.y) / (next_vert_coord.y - current_vert_coord.y)
-            if point.x < (current_vert_coord.x + (t * (next_vert_coord.x - current_vert_coord.x))):
-                winding_num += 1
-        elif (current_vert_coord.y > point.y) and (next_vert_coord.y <= point.y):
-            t = (point.y - current_vert_coord.y) / (next_vert_coord.y - current_vert_coord.y)
-            if point.x < (current_vert_coord.x + (t * (next_vert_coord.x - current_vert_coord.x))):
-                winding_num -= 1
-
-    return winding_num != 0
+    from . import geometry
+    polygons = [[c.xy for c in vert_coords]]
+    b_are_contained = geometry.polygons_contain_points(polygons, [point.xy])
+    return bool(b_are_contained[0, 0])
 
 def list_to_enum_property_items(l):
     items = []
@@ -324,35 +607,277 @@ def create_plane_obj(size):
 
     return obj
 
+def create_basic_layer_material():
+    # Emits the value of the display map, mixed with full transparency by
+    # the opacity and the instance opacity.
+    material = bpy.data.materials.new("Basic Layer")
+    material.surface_render_method = "BLENDED"
+    material.use_nodes = True
+    material[BASIC_VALUES_KEY] = {}
+
+    node_output = material.node_tree.nodes.get("Material Output")
+    node_bsdf = material.node_tree.nodes.get("Principled BSDF")
+    material.node_tree.nodes.remove(node_bsdf)
+    node_value = material.node_tree.nodes.new("ShaderNodeRGB")
+    node_value.name = "Value"
+    node_value.outputs[0].default_value = (*DEFAULT_BASIC_VALUE, 1.0)
+    node_emission = material.node_tree.nodes.new("ShaderNodeEmission")
+    node_transparent = material.node_tree.nodes.new("ShaderNodeBsdfTransparent")
+    node_mix_shader = material.node_tree.nodes.new("ShaderNodeMixShader")
+    node_math = material.node_tree.nodes.new("ShaderNodeMath")
+    node_math.name = "Opacity"
+    node_math.operation = "MULTIPLY"
+    node_math.inputs[0].default_value = 1.0
+    node_object_info = material.node_tree.nodes.new("ShaderNodeObjectInfo")
+
+    material.node_tree.links.new(node_value.outputs[0], node_emission.inputs[0])
+    material.node_tree.links.new(node_object_info.outputs[2], node_math.inputs[1])
+    material.node_tree.links.new(node_math.outputs[0], node_mix_shader.inputs[0])
+    material.node_tree.links.new(node_transparent.outputs[0], node_mix_shader.inputs[1])
+    material.node_tree.links.new(node_emission.outputs[0], node_mix_shader.inputs[2])
+    material.node_tree.links.new(node_mix_shader.outputs[0], node_output.inputs[0])
+
+    return material
+
 class BasicLayerObjWrapper(object):
+    # Basic layers fill their polygons with a constant value per basic map,
+    # kept in a table on the material with the opacity.
     @classmethod
     def create_obj(cls):
         obj = create_plane_obj(1.0)
         set_obj_type(obj, ObjType.Layer)
         set_layer_obj_type(obj, LayerObjType.Basic)
+        obj.data.materials.append(create_basic_layer_material())
 
         return obj
 
     def __init__(self, obj):
         super(BasicLayerObjWrapper, self).__init__()
         self.obj = obj
+        # Layers created by older versions have no material until
+        # migrate_legacy_data adds one, and read as the defaults.
+        self.__material = None
+        self.__node_value = None
+        self.__node_math = None
+        if self.obj.data.materials:
+            self.__material = self.obj.data.materials[0]
+            self.__node_value = self.__material.node_tree.nodes.get("Value")
+            self.__node_math = self.__material.node_tree.nodes.get("Opacity")
+
+    def migrate_legacy_material(self):
+        if self.__material is not None:
+            return
+        self.__material = create_basic_layer_material()
+        self.obj.data.materials.append(self.__material)
+        self.__node_value = self.__material.node_tree.nodes.get("Value")
+        self.__node_math = self.__material.node_tree.nodes.get("Opacity")
+
+    def get_values(self):
+        if self.__material is None:
+            return {}
+        values = {k: tuple(v) for k, v in self.__material[BASIC_VALUES_KEY].items()}
+        return values
+
+    def get_value(self, map_internal_name):
+        if self.__material is None:
+            return DEFAULT_BASIC_VALUE
+        v = self.__material[BASIC_VALUES_KEY].get(map_internal_name)
+        if v is None:
+            return DEFAULT_BASIC_VALUE
+        return tuple(v)
+
+    def set_value(self, map_internal_name, val):
+        self.__material[BASIC_VALUES_KEY][map_internal_name] = list(val)[:3]
+
+    def set_values(self, values):
+        self.__material[BASIC_VALUES_KEY] = {k: list(v)[:3] for k, v in values.items()}
 
-class ImageObjWrapper(object):
+    def switch_map(self, map_internal_name):
+        if self.__node_value is None:
+            return
+        self.__node_value.outputs[0].default_value = (*self.get_value(map_internal_name), 1.0)
+
+    def get_opacity(self):
+        if self.__node_math is None:
+            return 1.0
+        return self.__node_math.inputs[0].default_value
+
+    def set_opacity(self, val):
+        self.__node_math.inputs[0].default_value = val
+
+class LayerGroupObjWrapper(object):
+    # Groups are empties referenced by their layers and nested groups. A
+    # group is stacked where its lowest layer is.
     @classmethod
     def create_obj(cls):
-        ie3 = bpy.context.scene.ie3
+        obj = bpy.data.objects.new("Group", None)
+        set_obj_type(obj, ObjType.LayerGroup)
+        obj["opacity"] = 1.0
+        obj.id_properties_ui("opacity").update(min=0.0, max=1.0)
+
+        return obj
+
+    def __init__(self, obj):
+        super(LayerGroupObjWrapper, self).__init__()
+        self.obj = obj
+
+    def get_opacity(self):
+        return float(self.obj.get("opacity", 1.0))
+
+    def set_opacity(self, val):
+        self.obj["opacity"] = val
+
+def add_group_opacity_nodes(material):
+    # Multiplies the object alpha, i.e. the instance opacity, by the group
+    # opacity of the object. Objects without the property read 0 and are
+    # drawn as they were.
+    node_tree = material.node_tree
+    if node_tree.nodes.get("Group Opacity") is not None:
+        return
+
+    for link in list(node_tree.links):
+        if (link.from_node.bl_idname != "ShaderNodeObjectInfo") or (link.from_socket.identifier != "Alpha"):
+            continue
+
+        node_attribute = node_tree.nodes.new("ShaderNodeAttribute")
+        node_attribute.name = "Group Transparency"
+        node_attribute.attribute_type = "OBJECT"
+        node_attribute.attribute_name = GROUP_TRANSPARENCY_KEY
+        node_invert = node_tree.nodes.new("ShaderNodeMath")
+        node_invert.operation = "SUBTRACT"
+        node_invert.inputs[0].default_value = 1.0
+        node_math = node_tree.nodes.new("ShaderNodeMath")
+        node_math.name = "Group Opacity"
+        node_math.operation = "MULTIPLY"
+
+        to_socket = link.to_socket
+        node_tree.links.new(node_attribute.outputs[2], node_invert.inputs[1])
+        node_tree.links.new(link.from_socket, node_math.inputs[0])
+        node_tree.links.new(node_invert.outputs[0], node_math.inputs[1])
+        node_tree.links.remove(link)
+        node_tree.links.new(node_math.outputs[0], to_socket)
+        break
+
+def apply_layer_group_opacities(scene=None):
+    # The viewport and the Render backend draw the group opacities with the
+    # layer materials. Called whenever group opacities or memberships change.
+    for layer_obj in find_objs_with_type(ObjType.Layer, scene):
+        if get_layer_obj_type(layer_obj) == LayerObjType.Overlay:
+            continue
+
+        group_opacity = 1.0
+        for group_obj in find_layer_group_objs(layer_obj):
+            group_opacity *= LayerGroupObjWrapper(group_obj).get_opacity()
+
+        if group_opacity >= 1.0:
+            if GROUP_TRANSPARENCY_KEY in layer_obj:
+                del layer_obj[GROUP_TRANSPARENCY_KEY]
+                layer_obj.update_tag()
+            continue
+
+        group_transparency = 1.0 - group_opacity
+        if layer_obj.get(GROUP_TRANSPARENCY_KEY) == group_transparency:
+            continue
+        for material in layer_obj.data.materials:
+            if material is not None:
+                add_group_opacity_nodes(material)
+        layer_obj[GROUP_TRANSPARENCY_KEY] = group_transparency
+        layer_obj.update_tag()
+
+def get_overlay_wire_thickness(resolution):
+    return OVERLAY_WIRE_WIDTH / int(resolution)
+
+def create_vector_overlay_obj(uv_layout_mesh, resolution):
+    # Draws every edge of the UvLayout mesh as a thin quad, so memory does not
+    # depend on the tile count or resolution. A wireframe modifier would skip
+    # the loose edges of the UV tile borders. The quads are as thick as a few
+    # texels of the resolution, and are made thicker or thinner when it
+    # changes.
+    import numpy as np
+
+    thickness = get_overlay_wire_thickness(resolution)
+
+    vert_coords = np.zeros(len(uv_layout_mesh.vertices) * 3, np.float64)
+    uv_layout_mesh.vertices.foreach_get("co", vert_coords)
+    vert_coords = vert_coords.reshape(-1, 3)
+    edge_vert_indices = np.zeros(len(uv_layout_mesh.edges) * 2, np.int64)
+    uv_layout_mesh.edges.foreach_get("vertices", edge_vert_indices)
+    edge_vert_indices = edge_vert_indices.reshape(-1, 2)
+
+    coords0 = vert_coords[edge_vert_indices[:, 0]]
+    coords1 = vert_coords[edge_vert_indices[:, 1]]
+    directions = coords1 - coords0
+    lengths = np.linalg.norm(directions[:, :2], axis=1)
+    offsets = np.zeros_like(directions)
+    offsets[:, 0] = -directions[:, 1]
+    offsets[:, 1] = directions[:, 0]
+    offsets *= (thickness * 0.5 / np.where(lengths > 0.0, lengths, 1.0))[:, np.newaxis]
+
+    quad_coords = np.stack([coords0 - offsets, coords1 - offsets, coords1 + offsets, coords0 + offsets], axis=1)
+    quads = np.arange(len(quad_coords) * 4).reshape(-1, 4)
+    mesh = bpy.data.meshes.new("Overlay")
+    mesh.from_pydata(quad_coords.reshape(-1, 3).tolist(), [], quads.tolist())
+
+    obj = bpy.data.objects.new("Overlay", mesh)
+    set_obj_type(obj, ObjType.Layer)
+    set_layer_obj_type(obj, LayerObjType.Overlay)
+    obj[OVERLAY_WIRE_THICKNESS_KEY] = thickness
+
+    material = bpy.data.materials.new("Overlay")
+    material.surface_render_method = "BLENDED"
+    material.use_nodes = True
+
+    node_output = material.node_tree.nodes.get("Material Output")
+    node_bsdf = material.node_tree.nodes.get("Principled BSDF")
+    material.node_tree.nodes.remove(node_bsdf)
+    node_emission = material.node_tree.nodes.new("ShaderNodeEmission")
+    node_emission.inputs[0].default_value = (1.0, 1.0, 1.0, 1.0)
+    node_transparent = material.node_tree.nodes.new("ShaderNodeBsdfTransparent")
+    node_mix_shader = material.node_tree.nodes.new("ShaderNodeMixShader")
+    node_object_info = material.node_tree.nodes.new("ShaderNodeObjectInfo")
+
+    material.node_tree.links.new(node_object_info.outputs[2], node_mix_shader.inputs[0])
+    material.node_tree.links.new(node_transparent.outputs[0], node_mix_shader.inputs[1])
+    material.node_tree.links.new(node_emission.outputs[0], node_mix_shader.inputs[2])
+    material.node_tree.links.new(node_mix_shader.outputs[0], node_output.inputs[0])
+
+    mesh.materials.append(material)
 
+    return obj
+
+def set_vector_overlay_wire_thickness(overlay_obj, thickness):
+    # Scales the offsets of the quads from their edges.
+    import numpy as np
+
+    previous_thickness = overlay_obj.get(OVERLAY_WIRE_THICKNESS_KEY)
+    if (not previous_thickness) or (previous_thickness == thickness):
+        return
+
+    mesh = overlay_obj.data
+    quad_coords = np.zeros(len(mesh.vertices) * 3, np.float64)
+    mesh.vertices.foreach_get("co", quad_coords)
+    quad_coords = quad_coords.reshape(-1, 4, 3)
+    coords0 = (quad_coords[:, 0] + quad_coords[:, 3]) * 0.5
+    coords1 = (quad_coords[:, 1] + quad_coords[:, 2]) * 0.5
+    offsets = (quad_coords[:, 3] - quad_coords[:, 0]) * (0.5 * thickness / previous_thickness)
+    quad_coords = np.stack([coords0 - offsets, coords1 - offsets, coords1 + offsets, coords0 + offsets], axis=1)
+    mesh.vertices.foreach_set("co", quad_coords.ravel())
+    mesh.update()
+    overlay_obj[OVERLAY_WIRE_THICKNESS_KEY] = thickness
+
+class ImageObjWrapper(object):
+    @classmethod
+    def create_obj(cls):
         obj = create_plane_obj(1.0)
         set_obj_type(obj, ObjType.Layer)
         set_layer_obj_type(obj, LayerObjType.Image)
 
         dummy_image = find_dummy_image_opaque()
-        for map_data in ie3.map_data_list:
-            obj[map_data.internal_name] = dummy_image
 
         material = bpy.data.materials.new("Material")
         material.surface_render_method = "BLENDED"
         material.use_nodes = True
+        material["maps"] = {}
 
         node_output = material.node_tree.nodes.get("Material Output")
         node_bsdf = material.node_tree.nodes.get("Principled BSDF")
@@ -360,6 +885,10 @@ class ImageObjWrapper(object):
         node_math = material.node_tree.nodes.new("ShaderNodeMath")
         node_math.operation = "MULTIPLY"
         node_math.inputs[1].default_value = 1.0
+        node_instance_math = material.node_tree.nodes.new("ShaderNodeMath")
+        node_instance_math.name = "Instance Opacity"
+        node_instance_math.operation = "MULTIPLY"
+        node_object_info = material.node_tree.nodes.new("ShaderNodeObjectInfo")
         node_mix = material.node_tree.nodes.new("ShaderNodeMix")
         node_mix.inputs[0].default_value = 0.0
         node_opacity_map = material.node_tree.nodes.new("ShaderNodeTexImage")
@@ -373,7 +902,9 @@ class ImageObjWrapper(object):
 
         material.node_tree.links.clear()
         material.node_tree.links.new(node_bsdf.outputs[0], node_output.inputs[0])
-        material.node_tree.links.new(node_math.outputs[0], node_bsdf.inputs[4])
+        material.node_tree.links.new(node_instance_math.outputs[0], node_bsdf.inputs[4])
+        material.node_tree.links.new(node_math.outputs[0], node_instance_math.inputs[0])
+        material.node_tree.links.new(node_object_info.outputs[2], node_instance_math.inputs[1])
         material.node_tree.links.new(node_mix.outputs[0], node_math.inputs[0])
         material.node_tree.links.new(node_opacity_map.outputs[1], node_mix.inputs[2])
         material.node_tree.links.new(node_opacity_map.outputs[0], node_mix.inputs[3])
@@ -390,25 +921,129 @@ class ImageObjWrapper(object):
         super(ImageObjWrapper, self).__init__()
         self.obj = obj
         material = self.obj.data.materials[0]
+        self.__material = material
+        self.__default_map = None
         self.__node_math = material.node_tree.nodes.get("Math")
         self.__node_mix = material.node_tree.nodes.get("Mix")
         self.__node_opacity_map = material.node_tree.nodes.get("Opacity Map")
         self.__node_basic_map = material.node_tree.nodes.get("Basic Map")
         self.__node_mapping = material.node_tree.nodes.get("Mapping")
 
+    def __get_map_table(self):
+        # Getters run from draw and timer paths, where ID properties cannot
+        # be written, so layers not migrated yet have no maps until
+        # migrate_legacy_data runs.
+        return self.__material.get("maps", {})
+
+    def __get_writable_map_table(self):
+        if "maps" not in self.__material:
+            self.__material["maps"] = {}
+        return self.__material["maps"]
+
+    def migrate_legacy_maps(self):
+        # Layers created by older versions store one image pointer per map
+        # directly on the object, most of them pointing to the dummy image.
+        if "maps" in self.__material:
+            return
+        dummy_image = self.__get_default_map()
+        maps = {}
+        for key in list(self.obj.keys()):
+            val = self.obj[key]
+            if not isinstance(val, bpy.types.Image):
+                continue
+            if val != dummy_image:
+                maps[key] = val
+            del self.obj[key]
+        self.__material["maps"] = maps
+
+    def __get_default_map(self):
+        if self.__default_map is None:
+            self.__default_map = find_dummy_image_opaque()
+        return self.__default_map
+
+    def get_maps(self):
+        maps = dict(self.__get_map_table().items())
+        return maps
+
+    def get_map(self, map_internal_name):
+        m = self.__get_map_table().get(map_internal_name)
+        if m is None:
+            m = self.__get_default_map()
+        return m
+
+    def get_display_map(self, map_internal_name):
+        # Maps packed into an atlas are drawn from the atlas. Exports by the
+        # compositor read the maps themselves.
+        atlas_maps = self.__material.get(ATLAS_MAPS_KEY)
+        if atlas_maps is not None:
+            m = atlas_maps.get(map_internal_name)
+            if m is not None:
+                return m
+        return self.get_map(map_internal_name)
+
     def update_maps(self, map_file_path_dict):
+        maps = self.__get_writable_map_table()
+        b_is_changed = False
         for map_internal_name, map_file_path in map_file_path_dict.items():
+            m = maps.get(map_internal_name)
             if not map_file_path:
+                if m is not None:
+                    del maps[map_internal_name]
+                    b_is_changed = True
                 continue
-            m = self.obj[map_internal_name]
-            if m.filepath == map_file_path:
+            if (m is not None) and (get_image_source_file_path(m) == map_file_path):
                 continue
-            self.obj[map_internal_name] = bpy.data.images.load(map_file_path)
+            with profiling.span("ImageObjWrapper.load_map"):
+                maps[map_internal_name] = load_map_image(map_file_path)
+            b_is_changed = True
+
+        # The atlas no longer matches the maps until it is built again.
+        if b_is_changed:
+            self.clear_atlas()
 
-        self.__node_opacity_map.image = self.obj[SpecialMapType.Opacity.name]
+        self.__node_opacity_map.image = self.get_display_map(SpecialMapType.Opacity.name)
 
     def switch_map(self, map_internal_name):
-        self.__node_basic_map.image = self.obj[map_internal_name]
+        self.__node_basic_map.image = self.get_display_map(map_internal_name)
+
+    def is_in_atlas(self):
+        return ATLAS_MAPS_KEY in self.__material
+
+    def set_atlas(self, location, scale, atlas_maps):
+        # The mapped UVs are wrapped into [0, 1) and then moved to the
+        # sub-rectangle of the atlas at location with scale, so the mapping
+        # of the layer stays editable.
+        node_tree = self.__material.node_tree
+        node_atlas_mapping = node_tree.nodes.get("Atlas Mapping")
+        if node_atlas_mapping is None:
+            node_fraction = node_tree.nodes.new("ShaderNodeVectorMath")
+            node_fraction.name = "Atlas Fraction"
+            node_fraction.operation = "FRACTION"
+            node_atlas_mapping = node_tree.nodes.new("ShaderNodeMapping")
+            node_atlas_mapping.name = "Atlas Mapping"
+            node_tree.links.new(self.__node_mapping.outputs[0], node_fraction.inputs[0])
+            node_tree.links.new(node_fraction.outputs[0], node_atlas_mapping.inputs[0])
+            node_tree.links.new(node_atlas_mapping.outputs[0], self.__node_opacity_map.inputs[0])
+            node_tree.links.new(node_atlas_mapping.outputs[0], self.__node_basic_map.inputs[0])
+        node_atlas_mapping.inputs[1].default_value = (location[0], location[1], 0.0)
+        node_atlas_mapping.inputs[3].default_value = (scale[0], scale[1], 1.0)
+
+        self.__material[ATLAS_MAPS_KEY] = atlas_maps
+        self.__node_opacity_map.image = self.get_display_map(SpecialMapType.Opacity.name)
+
+    def clear_atlas(self):
+        if not self.is_in_atlas():
+            return
+        del self.__material[ATLAS_MAPS_KEY]
+
+        node_tree = self.__material.node_tree
+        for node_name in ["Atlas Fraction", "Atlas Mapping"]:
+            node = node_tree.nodes.get(node_name)
+            if node is not None:
+                node_tree.nodes.remove(node)
+        node_tree.links.new(self.__node_mapping.outputs[0], self.__node_opacity_map.inputs[0])
+        node_tree.links.new(self.__node_mapping.outputs[0], self.__node_basic_map.inputs[0])
+        self.__node_opacity_map.image = self.get_map(SpecialMapType.Opacity.name)
 
     def get_b_use_grayscale_as_opacity(self):
         return self.__node_mix.inputs[0].default_value > 0.5
@@ -434,38 +1069,232 @@ class ImageObjWrapper(object):
     def set_mapping_scale(self, val):
         self.__node_mapping.inputs[3].default_value = val
 
+    def get_mapping_uv_matrix(self):
+        # Rows of the (2, 3) affine transform of the mapping node in UV space.
+        rotation = mathutils.Euler([math.radians(r) for r in self.get_mapping_rotation()])
+        m = mathutils.Matrix.LocRotScale(self.get_mapping_location(), rotation, self.get_mapping_scale())
+        return [[m[0][0], m[0][1], m[0][3]], [m[1][0], m[1][1], m[1][3]]]
+
+    def get_blend_mode(self):
+        return BlendMode(self.__material.get("blend_mode", BlendMode.Normal.name))
+
+    def set_blend_mode(self, val):
+        blend_mode = BlendMode(val)
+        if ("blend_mode" in self.__material) and (self.get_blend_mode() == blend_mode):
+            return
+        self.__material["blend_mode"] = blend_mode.name
+
+        node_tree = self.__material.node_tree
+        node_output = node_tree.nodes.get("Material Output")
+        if not blend_mode in VIEWPORT_BLEND_MODES:
+            node_tree.links.new(node_tree.nodes.get("Principled BSDF").outputs[0], node_output.inputs[0])
+            return
+
+        # The viewport cannot read the pixels behind a layer, but the
+        # transparent BSDF multiplies them by its color and emission adds to
+        # them: multiply is a tinted transparency, add is emission over full
+        # transparency and screen is emission over the transparency tinted by
+        # the inverted color. The result is mixed with full transparency by
+        # the opacity.
+        node_blend_mix = node_tree.nodes.get("Blend Mix")
+        if node_blend_mix is None:
+            node_instance_math = node_tree.nodes.get("Instance Opacity")
+            node_transparent = node_tree.nodes.new("ShaderNodeBsdfTransparent")
+            node_transparent.name = "Blend Transparent"
+            node_tint = node_tree.nodes.new("ShaderNodeBsdfTransparent")
+            node_tint.name = "Blend Tint"
+            node_invert = node_tree.nodes.new("ShaderNodeInvert")
+            node_invert.name = "Blend Invert"
+            node_emission = node_tree.nodes.new("ShaderNodeEmission")
+            node_emission.name = "Blend Emission"
+            node_add = node_tree.nodes.new("ShaderNodeAddShader")
+            node_add.name = "Blend Add"
+            node_blend_mix = node_tree.nodes.new("ShaderNodeMixShader")
+            node_blend_mix.name = "Blend Mix"
+
+            node_tree.links.new(self.__node_basic_map.outputs[0], node_invert.inputs[1])
+            node_tree.links.new(self.__node_basic_map.outputs[0], node_emission.inputs[0])
+            node_tree.links.new(node_emission.outputs[0], node_add.inputs[0])
+            node_tree.links.new(node_tint.outputs[0], node_add.inputs[1])
+            node_tree.links.new(node_instance_math.outputs[0], node_blend_mix.inputs[0])
+            node_tree.links.new(node_transparent.outputs[0], node_blend_mix.inputs[1])
+
+        node_tint = node_tree.nodes.get("Blend Tint")
+        for link in list(node_tint.inputs[0].links):
+            node_tree.links.remove(link)
+        node_tint.inputs[0].default_value = (1.0, 1.0, 1.0, 1.0)
+        if blend_mode == BlendMode.Multiply:
+            node_tree.links.new(self.__node_basic_map.outputs[0], node_tint.inputs[0])
+            node_tree.links.new(node_tint.outputs[0], node_blend_mix.inputs[2])
+        else:
+            if blend_mode == BlendMode.Screen:
+                node_tree.links.new(node_tree.nodes.get("Blend Invert").outputs[0], node_tint.inputs[0])
+            node_tree.links.new(node_tree.nodes.get("Blend Add").outputs[0], node_blend_mix.inputs[2])
+        node_tree.links.new(node_blend_mix.outputs[0], node_output.inputs[0])
+
     def get_opacity(self):
         return self.__node_math.inputs[1].default_value
 
     def set_opacity(self, val):
         self.__node_math.inputs[1].default_value = val
 
-def get_display_map_name_items(self, context):
-    ie3 = context.scene.ie3
+class ProceduralLayerObjWrapper(ImageObjWrapper):
+    # Procedural layers are drawn in the viewport with a preview of their
+    # parameters as the basic and opacity maps. Exports evaluate the
+    # parameters at the output resolution instead.
+    @classmethod
+    def create_obj(cls):
+        obj = super(ProceduralLayerObjWrapper, cls).create_obj()
+        set_layer_obj_type(obj, LayerObjType.Procedural)
+        cls(obj).set_params({})
 
-    items = []
-    current_basic_map_data_list = ie3.get_current_basic_map_data_list()
-    for basic_map_data in current_basic_map_data_list:
-        display_name = basic_map_data.get_display_name()
-        item = (basic_map_data.internal_name, display_name, "")
-        items.append(item)
+        return obj
 
-    return items
+    def get_params(self):
+        from . import procedural
+
+        params = self.obj.data.materials[0].get(PROCEDURAL_PARAMS_KEY)
+        return procedural.get_params(params.to_dict() if params is not None else {})
+
+    def set_params(self, params):
+        from . import procedural
+
+        params = procedural.get_params(params)
+        material = self.obj.data.materials[0]
+        material[PROCEDURAL_PARAMS_KEY] = params
+
+        preview_image = find_procedural_preview_image(material)
+        update_procedural_preview_image(preview_image, params)
+        material.node_tree.nodes.get("Basic Map").image = preview_image
+        material.node_tree.nodes.get("Opacity Map").image = preview_image
+
+    def update_preview(self):
+        # Generated images are not saved with the file, so the previews are
+        # evaluated again when it is opened.
+        material = self.obj.data.materials[0]
+        update_procedural_preview_image(find_procedural_preview_image(material), self.get_params())
+
+def create_basic_layer_obj_wrappers(basic_layer_objs):
+    basic_layer_obj_wrappers = []
+    material_pointers = set()
+    for basic_layer_obj in basic_layer_objs:
+        basic_layer_obj_wrapper = BasicLayerObjWrapper(basic_layer_obj)
+        material_pointer = basic_layer_obj.data.materials[0].as_pointer()
+        if material_pointer in material_pointers:
+            continue
+        material_pointers.add(material_pointer)
+        basic_layer_obj_wrappers.append(basic_layer_obj_wrapper)
+    return basic_layer_obj_wrappers
+
+def create_image_obj_wrappers(image_objs):
+    # Instances share a single material, so one wrapper per material is
+    # enough to switch maps for all of them.
+    image_obj_wrappers = []
+    material_pointers = set()
+    for image_obj in image_objs:
+        material_pointer = image_obj.data.materials[0].as_pointer()
+        if material_pointer in material_pointers:
+            continue
+        material_pointers.add(material_pointer)
+        image_obj_wrappers.append(ImageObjWrapper(image_obj))
+    return image_obj_wrappers
+
+class MapListModel(object):
+    # Indices into SceneData.map_data_list and derived values used on every
+    # redraw. Indices stay valid until the list changes, and every change
+    # bumps map_list_version.
+    def __init__(self, ie3):
+        super(MapListModel, self).__init__()
+        self.version = map_list_version
+        self.map_data_count = len(ie3.map_data_list)
+        self.basic_map_count = ie3.basic_map_count
+        self.basic_map_indices = []
+        self.special_map_indices = []
+
+        for i, map_data in enumerate(ie3.map_data_list):
+            t = map_data.get_type()
+            if t == MapType.Basic:
+                self.basic_map_indices.append(i)
+            elif t == MapType.Special:
+                self.special_map_indices.append(i)
+
+        self.current_basic_map_indices = self.basic_map_indices[:ie3.basic_map_count]
+        self.current_map_indices = self.current_basic_map_indices + self.special_map_indices
+        self.current_map_types = [MapType.Basic] * len(self.current_basic_map_indices) + [MapType.Special] * len(self.special_map_indices)
+        self.current_map_display_names = [ie3.map_data_list[i].get_display_name() for i in self.current_map_indices]
+
+        # Blender requires the enum item strings to stay referenced while
+        # they are in use, which the cache and replaced_map_list_models take
+        # care of.
+        self.display_map_name_items = []
+        for i in self.current_basic_map_indices:
+            basic_map_data = ie3.map_data_list[i]
+            item = (basic_map_data.internal_name, basic_map_data.get_display_name(), "")
+            self.display_map_name_items.append(item)
+
+map_list_version = 0
+map_list_models = {}
+# Scene pointer -> replaced models. Blender may still use the items returned
+# from them until it calls get_display_map_name_items again.
+replaced_map_list_models = {}
+
+def replace_map_list_model(key, map_list_model):
+    previous_map_list_model = map_list_models.get(key)
+    if previous_map_list_model:
+        replaced_map_list_models.setdefault(key, []).append(previous_map_list_model)
+    if map_list_model:
+        map_list_models[key] = map_list_model
+    else:
+        map_list_models.pop(key, None)
 
+def invalidate_map_list_models():
+    global map_list_version
+    map_list_version += 1
+    for key in list(map_list_models.keys()):
+        replace_map_list_model(key, None)
+
+@bpy.app.handlers.persistent
+def invalidate_map_list_models_handler(*args):
+    invalidate_map_list_models()
+
+@profiling.profiled("get_display_map_name_items")
+def get_display_map_name_items(self, context):
+    map_list_model = self.get_map_list_model()
+    replaced_map_list_models.pop(self.as_pointer(), None)
+    return map_list_model.display_map_name_items
+
+@profiling.profiled("display_map_name_changed")
 def display_map_name_changed(self, context):
     ie3 = context.scene.ie3
 
     image_objs = find_layer_objs_with_type(LayerObjType.Image)
-    image_obj_wrappers = [ImageObjWrapper(o) for o in image_objs]
+    image_obj_wrappers = create_image_obj_wrappers(image_objs)
     for image_obj_wrapper in image_obj_wrappers:
         image_obj_wrapper.switch_map(ie3.display_map_name)
 
+    basic_layer_objs = find_layer_objs_with_type(LayerObjType.Basic)
+    for basic_layer_obj_wrapper in create_basic_layer_obj_wrappers(basic_layer_objs):
+        basic_layer_obj_wrapper.switch_map(ie3.display_map_name)
+
+    if get_layer_obj_type(context.active_object) == LayerObjType.Basic:
+        b_is_initializing_image_obj_properties = ie3.b_is_initializing_image_obj_properties
+        ie3.b_is_initializing_image_obj_properties = True
+        ie3.basic_value = BasicLayerObjWrapper(context.active_object).get_value(ie3.display_map_name)
+        ie3.b_is_initializing_image_obj_properties = b_is_initializing_image_obj_properties
+
+def map_display_name_changed(self, context):
+    invalidate_map_list_models()
+
+@profiling.profiled("basic_map_count_changed")
 def basic_map_count_changed(self, context):
     ie3 = context.scene.ie3
 
+    ie3.ensure_basic_map_data_list(ie3.basic_map_count)
+
     if not ie3.display_map_name:
         ie3.display_map_name = "BasicMap0"
 
+@profiling.profiled("mapping_property_changed")
 def mapping_property_changed(self, context):
     ie3 = context.scene.ie3
 
@@ -478,30 +1307,103 @@ def mapping_property_changed(self, context):
     image_obj_wrapper.mapping_rotation = ie3.mapping_rotation
     image_obj_wrapper.mapping_scale = ie3.mapping_scale
 
+@profiling.profiled("group_opacity_changed")
+def group_opacity_changed(self, context):
+    ie3 = context.scene.ie3
+    if ie3.b_is_initializing_image_obj_properties:
+        return
+
+    if get_obj_type(context.active_object) != ObjType.LayerGroup:
+        return
+
+    LayerGroupObjWrapper(context.active_object).set_opacity(ie3.group_opacity)
+    apply_layer_group_opacities(context.scene)
+
+@profiling.profiled("image_obj_property_changed")
 def image_obj_property_changed(self, context):
     ie3 = context.scene.ie3
     if ie3.b_is_initializing_image_obj_properties:
         return
 
     layer_obj_type = get_layer_obj_type(context.active_object)
-    if layer_obj_type != LayerObjType.Image:
+    if layer_obj_type == LayerObjType.Basic:
+        BasicLayerObjWrapper(context.active_object).set_opacity(ie3.opacity)
+        return
+    if not layer_obj_type in [LayerObjType.Image, LayerObjType.Procedural]:
         return
 
     image_obj_wrapper = ImageObjWrapper(context.active_object)
 
-    map_file_path_dict = {}
-    for map_data in ie3.map_data_list:
-        map_file_path_dict[map_data.internal_name] = map_data.file_path
-    image_obj_wrapper.update_maps(map_file_path_dict)
+    if layer_obj_type == LayerObjType.Image:
+        map_file_path_dict = {}
+        for map_data in ie3.map_data_list:
+            map_file_path_dict[map_data.internal_name] = map_data.file_path
+        image_obj_wrapper.update_maps(map_file_path_dict)
 
     image_obj_wrapper.set_b_use_grayscale_as_opacity(ie3.b_use_grayscale_as_opacity)
     image_obj_wrapper.set_mapping_location(ie3.mapping_location)
     image_obj_wrapper.set_mapping_rotation(ie3.mapping_rotation)
     image_obj_wrapper.set_mapping_scale(ie3.mapping_scale)
     image_obj_wrapper.set_opacity(ie3.opacity)
+    image_obj_wrapper.set_blend_mode(ie3.blend_mode)
+
+    if layer_obj_type == LayerObjType.Image:
+        image_obj_wrapper.switch_map(ie3.display_map_name)
+
+@profiling.profiled("procedural_property_changed")
+def procedural_property_changed(self, context):
+    ie3 = context.scene.ie3
+    if ie3.b_is_initializing_image_obj_properties:
+        return
+
+    layer_obj_type = get_layer_obj_type(context.active_object)
+    if layer_obj_type != LayerObjType.Procedural:
+        return
+
+    ProceduralLayerObjWrapper(context.active_object).set_params(ie3.create_procedural_params())
+
+@profiling.profiled("basic_value_changed")
+def basic_value_changed(self, context):
+    ie3 = context.scene.ie3
+    if ie3.b_is_initializing_image_obj_properties:
+        return
 
-    image_obj_wrapper.switch_map(ie3.display_map_name)
+    layer_obj_type = get_layer_obj_type(context.active_object)
+    if layer_obj_type != LayerObjType.Basic:
+        return
+
+    basic_layer_obj_wrapper = BasicLayerObjWrapper(context.active_object)
+    basic_layer_obj_wrapper.set_value(ie3.display_map_name, ie3.basic_value)
+    basic_layer_obj_wrapper.switch_map(ie3.display_map_name)
+
+@profiling.profiled("watch_source_maps_changed")
+def watch_source_maps_changed(self, context):
+    from . import watcher
+
+    if watcher.find_watching_scenes():
+        watcher.start_watching()
+    else:
+        watcher.stop_watching()
+
+@profiling.profiled("use_texture_cache_changed")
+def use_texture_cache_changed(self, context):
+    ie3 = context.scene.ie3
+
+    if ie3.b_use_texture_cache:
+        return
+
+    # Maps loaded from texture cache proxies switch back to their sources.
+    for image in bpy.data.images:
+        if SOURCE_FILE_PATH_KEY in image:
+            image.filepath = image[SOURCE_FILE_PATH_KEY]
+            del image[SOURCE_FILE_PATH_KEY]
+
+def enable_profiling_changed(self, context):
+    ie3 = context.scene.ie3
 
+    profiling.set_enabled(ie3.b_enable_profiling)
+
+@profiling.profiled("show_overlay_changed")
 def show_overlay_changed(self, context):
     ie3 = context.scene.ie3
 
@@ -509,6 +1411,7 @@ def show_overlay_changed(self, context):
     for overlay_obj in overlay_objs:
         overlay_obj.hide_viewport = not ie3.b_show_overlay
 
+@profiling.profiled("overlay_opacity_changed")
 def overlay_opacity_changed(self, context):
     ie3 = context.scene.ie3
 
@@ -516,9 +1419,16 @@ def overlay_opacity_changed(self, context):
     for overlay_obj in overlay_objs:
         overlay_obj.color = [1.0, 1.0, 1.0, ie3.overlay_opacity]
 
+@profiling.profiled("resolution_changed")
+def resolution_changed(self, context):
+    thickness = get_overlay_wire_thickness(context.scene.ie3.resolution)
+    for overlay_obj in find_layer_objs_with_type(LayerObjType.Overlay):
+        set_vector_overlay_wire_thickness(overlay_obj, thickness)
+
 class UvTileData(bpy.types.PropertyGroup):
     num: bpy.props.IntProperty(name="Num")
     coord: bpy.props.IntVectorProperty(name="Coord")
+    b_is_dirty: bpy.props.BoolProperty(name="Is dirty")
 
 class MapType(StrEnum):
     Basic = "Basic"
@@ -527,7 +1437,7 @@ class MapType(StrEnum):
 class MapData(bpy.types.PropertyGroup):
     type: bpy.props.EnumProperty(name="Type", items=enum_cls_to_enum_property_items(MapType))
     internal_name: bpy.props.StringProperty(name="Internal Name")
-    display_name: bpy.props.StringProperty(name="Display Name")
+    display_name: bpy.props.StringProperty(name="Display Name", update=map_display_name_changed)
     default_name: bpy.props.StringProperty(name="Default Name")
     file_path: bpy.props.StringProperty(name="File Path", update=image_obj_property_changed)
     color_depth: bpy.props.EnumProperty(name="Color Depth", items=list_to_enum_property_items(COLOR_DEPTHS))
@@ -545,39 +1455,159 @@ class MapData(bpy.types.PropertyGroup):
 class SceneData(bpy.types.PropertyGroup):
     b_is_editor_scene: bpy.props.BoolProperty(name="Is editor scene")
     b_is_initializing_image_obj_properties: bpy.props.BoolProperty(name="Is initializing image obj properties")
-    resolution: bpy.props.EnumProperty(name="Resolution", items=list_to_enum_property_items(RESOLUTIONS), default=str(1024))
-    basic_map_count: bpy.props.IntProperty(name="Basic Map Count", min=1, max=BASIC_MAP_COUNT, default=1)
+    resolution: bpy.props.EnumProperty(name="Resolution", items=list_to_enum_property_items(RESOLUTIONS), default=str(1024), update=resolution_changed)
+    preview_resolution: bpy.props.EnumProperty(name="Preview Resolution", items=list_to_enum_property_items(RESOLUTIONS), default=str(512))
+    export_backend: bpy.props.EnumProperty(name="Export Backend", description="Render renders every tile, Compositor composites image layers on the CPU in strips under a memory budget", items=enum_cls_to_enum_property_items(ExportBackend))
+    compositor_memory_budget: bpy.props.IntProperty(name="Memory Budget (MB)", description="Working memory of the compositor for one tile", min=16, default=1024)
+    compositor_cache_size: bpy.props.IntProperty(name="Cache Size (MB)", description="Memory of the compositor for source images", min=16, default=512)
+    pixel_cache_size: bpy.props.IntProperty(name="Pixel Cache Size (MB)", description="Memory of flattened layer groups and procedural layers kept between exports and previews. It adds to the memory budget and the cache size", min=0, default=256)
+    basic_map_count: bpy.props.IntProperty(name="Basic Map Count", min=1, default=1, update=basic_map_count_changed)
     display_map_name: bpy.props.EnumProperty(name="Display Map Name", items=get_display_map_name_items, update=display_map_name_changed)
     mapping_location: bpy.props.FloatVectorProperty(name="Mapping Location", update=image_obj_property_changed)
     mapping_rotation: bpy.props.FloatVectorProperty(name="Mapping Rotation", update=image_obj_property_changed)
     mapping_scale: bpy.props.FloatVectorProperty(name="Mapping Scale", update=image_obj_property_changed)
     opacity: bpy.props.FloatProperty(name="Opacity", min=0.0, max=1.0, update=image_obj_property_changed)
+    group_opacity: bpy.props.FloatProperty(name="Group Opacity", min=0.0, max=1.0, default=1.0, update=group_opacity_changed)
+    blend_mode: bpy.props.EnumProperty(name="Blend Mode", description="Multiply, Screen and Add are drawn exactly in the viewport, the others are drawn as Normal and exported exactly by the Compositor backend", items=enum_cls_to_enum_property_items(BlendMode), update=image_obj_property_changed)
+    overlay_mode: bpy.props.EnumProperty(name="Overlay Mode", description="Raster draws tile images exported from the UV layout, Vector draws the UV layout mesh edges", items=enum_cls_to_enum_property_items(OverlayMode))
     b_show_overlay: bpy.props.BoolProperty(name="Show overlay", default=True, update=show_overlay_changed)
     overlay_opacity: bpy.props.FloatProperty(name="Overlay Opacity", min=0.0, max=1.0, default=0.5, update=overlay_opacity_changed)
     b_use_grayscale_as_opacity: bpy.props.BoolProperty(name="Use grayscale as opacity", update=image_obj_property_changed)
+    b_enable_profiling: bpy.props.BoolProperty(name="Enable profiling", update=enable_profiling_changed)
+    b_watch_source_maps: bpy.props.BoolProperty(name="Watch source maps", description="Reload map images edited in external tools", update=watch_source_maps_changed)
+    b_use_texture_cache: bpy.props.BoolProperty(name="Use texture cache", description="Convert large source maps to mip-mapped tiled textures. The viewport loads a downsampled level, the compositor reads the levels it needs and renders load the sources", update=use_texture_cache_changed)
+    viewport_max_texture_size: bpy.props.EnumProperty(name="Viewport Max Texture Size", description="Largest map size loaded in the viewport when the texture cache is used", items=list_to_enum_property_items(RESOLUTIONS), default=str(4096))
+    procedural_kind: bpy.props.EnumProperty(name="Kind", items=enum_cls_to_enum_property_items(ProceduralKind), update=procedural_property_changed)
+    procedural_color_a: bpy.props.FloatVectorProperty(name="Color A", subtype="COLOR", size=4, min=0.0, max=1.0, default=(1.0, 1.0, 1.0, 1.0), update=procedural_property_changed)
+    procedural_color_b: bpy.props.FloatVectorProperty(name="Color B", subtype="COLOR", size=4, min=0.0, max=1.0, default=(0.0, 0.0, 0.0, 1.0), update=procedural_property_changed)
+    procedural_angle: bpy.props.FloatProperty(name="Angle", update=procedural_property_changed)
+    procedural_scale: bpy.props.FloatProperty(name="Scale", min=0.01, default=8.0, update=procedural_property_changed)
+    procedural_octaves: bpy.props.IntProperty(name="Octaves", min=1, max=8, default=4, update=procedural_property_changed)
+    procedural_seed: bpy.props.IntProperty(name="Seed", update=procedural_property_changed)
+    procedural_width: bpy.props.FloatProperty(name="Width", min=0.0, default=0.05, update=procedural_property_changed)
+    basic_value: bpy.props.FloatVectorProperty(name="Value", description="Value of the display map filled in the polygons of the basic layer", subtype="COLOR", size=3, min=0.0, max=1.0, update=basic_value_changed)
+    atlas_size: bpy.props.EnumProperty(name="Atlas Size", items=list_to_enum_property_items(RESOLUTIONS), default=str(4096))
+    atlas_max_source_size: bpy.props.IntProperty(name="Atlas Max Source Size", description="Largest width and height of the 8 bit maps packed into atlases", min=1, default=512)
     uv_tile_data_list: bpy.props.CollectionProperty(type=UvTileData, name="UV Tile Data List")
     map_data_list: bpy.props.CollectionProperty(type=MapData, name="Map Data List")
     map_file_name: bpy.props.StringProperty(name="Map File Name")
 
+    def create_procedural_params(self):
+        params = {
+            "kind": self.procedural_kind,
+            "color_a": list(self.procedural_color_a),
+            "color_b": list(self.procedural_color_b),
+            "angle": self.procedural_angle,
+            "scale": self.procedural_scale,
+            "octaves": self.procedural_octaves,
+            "seed": self.procedural_seed,
+            "width": self.procedural_width,
+        }
+        return params
+
+    def apply_procedural_params(self, params):
+        self.procedural_kind = params["kind"]
+        self.procedural_color_a = params["color_a"]
+        self.procedural_color_b = params["color_b"]
+        self.procedural_angle = params["angle"]
+        self.procedural_scale = params["scale"]
+        self.procedural_octaves = params["octaves"]
+        self.procedural_seed = params["seed"]
+        self.procedural_width = params["width"]
+
+    def ensure_basic_map_data_list(self, count):
+        basic_map_data_list = self.get_basic_map_data_list()
+        for i in range(len(basic_map_data_list), count):
+            map_data = self.map_data_list.add()
+            map_data.type = MapType.Basic.name
+            map_data.internal_name = f"BasicMap{i}"
+            map_data.default_name = f"Map{i + 1}"
+        invalidate_map_list_models()
+
+    def ensure_special_map_data_list(self):
+        special_map_names = [d.internal_name for d in self.get_special_map_data_list()]
+        for special_map_type in SpecialMapType:
+            if special_map_type.name in special_map_names:
+                continue
+            map_data = self.map_data_list.add()
+            map_data.type = MapType.Special.name
+            map_data.internal_name = special_map_type.name
+            map_data.default_name = special_map_type.name
+        invalidate_map_list_models()
+
+    def get_map_list_model(self):
+        # The counts are compared as well in case a new scene reuses the
+        # address of a removed one.
+        key = self.as_pointer()
+        map_list_model = map_list_models.get(key)
+        if (not map_list_model) or (map_list_model.version != map_list_version) or (map_list_model.map_data_count != len(self.map_data_list)) or (map_list_model.basic_map_count != self.basic_map_count):
+            map_list_model = MapListModel(self)
+            replace_map_list_model(key, map_list_model)
+        return map_list_model
+
     def get_basic_map_data_list(self):
-        basic_map_data_list = [d for d in self.map_data_list if d.get_type() == MapType.Basic]
+        map_list_model = self.get_map_list_model()
+        basic_map_data_list = [self.map_data_list[i] for i in map_list_model.basic_map_indices]
         return basic_map_data_list
 
     def get_special_map_data_list(self):
-        special_map_data_list = [d for d in self.map_data_list if d.get_type() == MapType.Special]
+        map_list_model = self.get_map_list_model()
+        special_map_data_list = [self.map_data_list[i] for i in map_list_model.special_map_indices]
         return special_map_data_list
 
     def get_current_basic_map_data_list(self):
-        basic_map_data_list = self.get_basic_map_data_list()
-        current_basic_map_data_list = basic_map_data_list[:self.basic_map_count]
+        map_list_model = self.get_map_list_model()
+        current_basic_map_data_list = [self.map_data_list[i] for i in map_list_model.current_basic_map_indices]
         return current_basic_map_data_list
 
     def get_current_map_data_list(self):
-        current_basic_map_data_list = self.get_current_basic_map_data_list()
-        special_map_data_list = self.get_special_map_data_list()
-        current_map_data_list = list(current_basic_map_data_list) + list(special_map_data_list)
+        map_list_model = self.get_map_list_model()
+        current_map_data_list = [self.map_data_list[i] for i in map_list_model.current_map_indices]
         return current_map_data_list
 
+    def create_scene_setting_group(self):
+        scene_setting_group = SceneSettingGroup()
+        scene_setting_group.map_file_name = self.map_file_name
+        scene_setting_group.resolution = self.resolution
+        scene_setting_group.basic_map_count = self.basic_map_count
+
+        for map_data in self.map_data_list:
+            map_setting_group = MapSettingGroup()
+            map_setting_group.internal_name = map_data.internal_name
+            map_setting_group.file_name_keywords = map_data.file_name_keywords
+            t = map_data.get_type()
+            if t == MapType.Basic:
+                map_setting_group.display_name = map_data.display_name
+                map_setting_group.color_depth = map_data.color_depth
+            elif t == MapType.Special:
+                pass
+            scene_setting_group.map_setting_groups.append(map_setting_group)
+
+        return scene_setting_group
+
+    def apply_scene_setting_group(self, scene_setting_group):
+        self.map_file_name = scene_setting_group.map_file_name
+        self.resolution = scene_setting_group.resolution
+        self.basic_map_count = scene_setting_group.basic_map_count
+
+        special_map_names = [t.name for t in SpecialMapType]
+        basic_map_setting_groups = [g for g in scene_setting_group.map_setting_groups if not g.internal_name in special_map_names]
+        self.ensure_basic_map_data_list(len(basic_map_setting_groups))
+
+        for map_setting_group in scene_setting_group.map_setting_groups:
+            for map_data in self.map_data_list:
+                if map_data.internal_name != map_setting_group.internal_name:
+                    continue
+
+                map_data.file_name_keywords = map_setting_group.file_name_keywords
+
+                t = map_data.get_type()
+                if t == MapType.Basic:
+                    map_data.display_name = map_setting_group.display_name
+                    map_data.color_depth = map_setting_group.color_depth
+                elif t == MapType.Special:
+                    pass
+
 class MapSettingGroup(dobj.Dobj):
     def __init__(self):
         self.internal_name = ""
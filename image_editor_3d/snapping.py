@@ -0,0 +1,92 @@
+import numpy as np
+
+from . import geometry
+
+
+# Snap target searches of the snap operators. This module is imported on
+# first use so that registering the add-on does not load NumPy.
+
+class UvLayoutArrays(object):
+    def __init__(self, vert_coords, edge_vert_indices, loop_vert_indices, loop_starts, loop_totals):
+        super(UvLayoutArrays, self).__init__()
+        self.vert_coords = np.asarray(vert_coords, np.float64).reshape(-1, 2)
+        self.segments = self.vert_coords[np.asarray(edge_vert_indices, np.int64).reshape(-1, 2)]
+        self.loop_vert_indices = np.asarray(loop_vert_indices, np.int64)
+        self.loop_starts = np.asarray(loop_starts, np.int64)
+        self.loop_totals = np.asarray(loop_totals, np.int64)
+        self.polygons = geometry.create_padded_polygons(self.vert_coords, self.loop_vert_indices, self.loop_starts, self.loop_totals)
+
+    @classmethod
+    def from_mesh(cls, mesh):
+        vert_coords = np.zeros(len(mesh.vertices) * 3, np.float64)
+        mesh.vertices.foreach_get("co", vert_coords)
+        edge_vert_indices = np.zeros(len(mesh.edges) * 2, np.int64)
+        mesh.edges.foreach_get("vertices", edge_vert_indices)
+        loop_vert_indices = np.zeros(len(mesh.loops), np.int64)
+        mesh.loops.foreach_get("vertex_index", loop_vert_indices)
+        loop_starts = np.zeros(len(mesh.polygons), np.int64)
+        mesh.polygons.foreach_get("loop_start", loop_starts)
+        loop_totals = np.zeros(len(mesh.polygons), np.int64)
+        mesh.polygons.foreach_get("loop_total", loop_totals)
+        return cls(vert_coords.reshape(-1, 3)[:, :2], edge_vert_indices, loop_vert_indices, loop_starts, loop_totals)
+
+    def get_face_vert_coords(self):
+        return self.vert_coords[np.unique(self.loop_vert_indices)]
+
+def normalize(v):
+    length = np.linalg.norm(v)
+    if length == 0.0:
+        return v
+    return v / length
+
+def find_closest_uv_vert_targets(uv_layout_arrays, points):
+    # Snaps to the closest vert of the faces containing each point, offset
+    # along the bisector of the vert pointing into the face. Points outside
+    # every face snap to the closest face vert without an offset.
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    target_coords = np.zeros((len(points), 2), np.float64)
+    offset_directions = np.zeros((len(points), 2), np.float64)
+    b_are_found = np.zeros(len(points), bool)
+
+    face_indices, vert_indices = geometry.find_closest_contained_vert_indices(uv_layout_arrays.polygons, points)
+    face_vert_coords = uv_layout_arrays.get_face_vert_coords()
+    closest_vert_indices = geometry.find_closest_vert_indices(points, face_vert_coords)
+
+    for i in range(len(points)):
+        face_index = face_indices[i]
+        if face_index >= 0:
+            j = vert_indices[i]
+            loop_total = uv_layout_arrays.loop_totals[face_index]
+            uv_vert_coords = uv_layout_arrays.polygons[face_index, :loop_total]
+
+            uv_vert_coord = uv_vert_coords[j]
+            prev_vert_coord = uv_vert_coords[geometry.loop_index(j - 1, loop_total)]
+            next_vert_coord = uv_vert_coords[geometry.loop_index(j + 1, loop_total)]
+            edge0 = normalize(prev_vert_coord - uv_vert_coord)
+            edge1 = normalize(next_vert_coord - uv_vert_coord)
+            offset_direction = normalize(edge0 + edge1)
+            offset_point = uv_vert_coord + offset_direction * 0.001
+            if not geometry.polygons_contain_points(uv_layout_arrays.polygons[face_index:face_index + 1], [offset_point])[0, 0]:
+                offset_direction = -offset_direction
+
+            target_coords[i] = uv_vert_coord
+            offset_directions[i] = offset_direction
+            b_are_found[i] = True
+        elif closest_vert_indices[i] >= 0:
+            target_coords[i] = face_vert_coords[closest_vert_indices[i]]
+            b_are_found[i] = True
+
+    return target_coords, offset_directions, b_are_found
+
+def find_uv_edge_targets(uv_layout_arrays, points, direction):
+    # Casts a ray from each point and snaps to the first uv edge it hits.
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    direction = np.asarray(direction, np.float64)
+    rays = np.stack([points + direction * 0.001, points + direction * 1000.0], axis=1)
+    target_coords, edge_indices = geometry.find_first_intersections(rays, uv_layout_arrays.segments)
+    return target_coords, edge_indices >= 0
+
+def find_closest_uv_edge_targets(uv_layout_arrays, points):
+    points = np.asarray(points, np.float64).reshape(-1, 2)
+    target_coords, edge_indices = geometry.find_closest_points_on_segments(points, uv_layout_arrays.segments)
+    return target_coords, edge_indices >= 0
@@ -0,0 +1,528 @@
+import json
+import os
+
+from . import dobj, error, layertypes
+
+
+# Snapshot of the layer stack of an editor scene, readable without opening
+# the .blend file, e.g. by export workers.
+#
+# A snapshot is chunked JSON: one compact JSON object per line, a header,
+# the layers from bottom to top, and a footer with the byte offset of every
+# layer and the layers overlapping every UDIM tile. The last line is the
+# byte offset of the footer padded to a fixed width, so a reader can seek to
+# the footer and load only the layers it needs. Layers are written and read
+# one at a time, so memory does not grow with the stack.
+#
+# Reading and writing depend only on dobj, and compositor layers are created
+# from snapshots without Blender. The functions creating snapshots from
+# scenes and layer objects from snapshots import Blender modules on use.
+
+SNAPSHOT_FORMAT = "ie3_snapshot"
+# Bumped whenever fields are added, so older readers reject snapshots they
+# would read without the new fields. Fields missing in older snapshots are
+# read with their defaults.
+# 1: Initial version.
+# 2: blend_mode, layer_group_names, procedural_params and basic_values of
+#    layers, and layer_groups of the header.
+SNAPSHOT_VERSION = 2
+SNAPSHOT_FILE_EXT = ".ie3snap"
+TRAILER_DIGIT_COUNT = 20
+
+class LayerGroupSnapshot(dobj.Dobj):
+    def __init__(self):
+        self.name = ""
+        # Name of the group containing this group, empty at the top level.
+        self.parent_name = ""
+        self.opacity = 1.0
+        self.b_hide_render = False
+
+    def to_dict(self):
+        d = {
+            "name": self.name,
+            "parent_name": self.parent_name,
+            "opacity": self.opacity,
+            "b_hide_render": self.b_hide_render,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.name = d["name"]
+        instance.parent_name = d["parent_name"]
+        instance.opacity = d["opacity"]
+        instance.b_hide_render = d["b_hide_render"]
+        return instance
+
+class SnapshotHeader(dobj.Dobj):
+    def __init__(self):
+        self.format = SNAPSHOT_FORMAT
+        self.version = SNAPSHOT_VERSION
+        # SceneSettingGroup as a dict, so that reading does not import Blender
+        # modules.
+        self.scene_setting_group = {}
+        # Map used by image layers for maps they do not have.
+        self.default_map_file_path = ""
+        self.layer_groups = []
+
+    def to_dict(self):
+        d = {
+            "format": self.format,
+            "version": self.version,
+            "scene_setting_group": self.scene_setting_group,
+            "default_map_file_path": self.default_map_file_path,
+            "layer_groups": dobj.dobjs_to_dicts(self.layer_groups),
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.format = d["format"]
+        instance.version = d["version"]
+        instance.scene_setting_group = d["scene_setting_group"]
+        instance.default_map_file_path = d["default_map_file_path"]
+        instance.layer_groups = dobj.dicts_to_dobjs(d.get("layer_groups", []), LayerGroupSnapshot)
+        return instance
+
+class LayerSnapshot(dobj.Dobj):
+    def __init__(self):
+        self.name = ""
+        self.layer_obj_type = ""
+        # Layers with the same mesh name are instances of each other.
+        self.mesh_name = ""
+        self.b_hide_render = False
+        # Rows of the 4x4 world matrix.
+        self.matrix_world = []
+        # Flat arrays of the mesh: xyz per vert, uv per loop and three loop
+        # indices per triangle.
+        self.vert_coords = []
+        self.loop_vert_indices = []
+        self.loop_totals = []
+        self.loop_uvs = []
+        self.triangle_loop_indices = []
+        self.uv_tile_nums = []
+        self.instance_opacity = 1.0
+        # Image layers only. maps and map_colorspaces are keyed by map internal
+        # name.
+        self.maps = {}
+        self.map_colorspaces = {}
+        self.b_use_grayscale_as_opacity = False
+        self.mapping_location = [0.0, 0.0, 0.0]
+        self.mapping_rotation = [0.0, 0.0, 0.0]
+        self.mapping_scale = [1.0, 1.0, 1.0]
+        # Rows of the (2, 3) affine transform of the mapping node in UV space.
+        self.mapping_matrix = [[1.0, 0.0, 0.0], [0.0, 1.0, 0.0]]
+        self.opacity = 1.0
+        self.blend_mode = layertypes.BlendMode.Normal.name
+        # Names of the groups containing the layer, from the outermost.
+        self.layer_group_names = []
+        # Procedural layers only.
+        self.procedural_params = {}
+        # Basic layers only. Linear RGB keyed by map internal name.
+        self.basic_values = {}
+
+    def to_dict(self):
+        d = {
+            "name": self.name,
+            "layer_obj_type": self.layer_obj_type,
+            "mesh_name": self.mesh_name,
+            "b_hide_render": self.b_hide_render,
+            "matrix_world": self.matrix_world,
+            "vert_coords": self.vert_coords,
+            "loop_vert_indices": self.loop_vert_indices,
+            "loop_totals": self.loop_totals,
+            "loop_uvs": self.loop_uvs,
+            "triangle_loop_indices": self.triangle_loop_indices,
+            "uv_tile_nums": self.uv_tile_nums,
+            "instance_opacity": self.instance_opacity,
+            "maps": self.maps,
+            "map_colorspaces": self.map_colorspaces,
+            "b_use_grayscale_as_opacity": self.b_use_grayscale_as_opacity,
+            "mapping_location": self.mapping_location,
+            "mapping_rotation": self.mapping_rotation,
+            "mapping_scale": self.mapping_scale,
+            "mapping_matrix": self.mapping_matrix,
+            "opacity": self.opacity,
+            "blend_mode": self.blend_mode,
+            "layer_group_names": self.layer_group_names,
+            "procedural_params": self.procedural_params,
+            "basic_values": self.basic_values,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.name = d["name"]
+        instance.layer_obj_type = d["layer_obj_type"]
+        instance.mesh_name = d["mesh_name"]
+        instance.b_hide_render = d["b_hide_render"]
+        instance.matrix_world = d["matrix_world"]
+        instance.vert_coords = d["vert_coords"]
+        instance.loop_vert_indices = d["loop_vert_indices"]
+        instance.loop_totals = d["loop_totals"]
+        instance.loop_uvs = d["loop_uvs"]
+        instance.triangle_loop_indices = d["triangle_loop_indices"]
+        instance.uv_tile_nums = d["uv_tile_nums"]
+        instance.instance_opacity = d["instance_opacity"]
+        instance.maps = d["maps"]
+        instance.map_colorspaces = d["map_colorspaces"]
+        instance.b_use_grayscale_as_opacity = d["b_use_grayscale_as_opacity"]
+        instance.mapping_location = d["mapping_location"]
+        instance.mapping_rotation = d["mapping_rotation"]
+        instance.mapping_scale = d["mapping_scale"]
+        instance.mapping_matrix = d["mapping_matrix"]
+        instance.opacity = d["opacity"]
+        instance.blend_mode = d.get("blend_mode", layertypes.BlendMode.Normal.name)
+        instance.layer_group_names = d.get("layer_group_names", [])
+        instance.procedural_params = d.get("procedural_params", {})
+        instance.basic_values = d.get("basic_values", {})
+        return instance
+
+class SnapshotFooter(dobj.Dobj):
+    def __init__(self):
+        self.layer_offsets = []
+        # UDIM tile number (as a string) -> layer indices.
+        self.uv_tile_layer_indices = {}
+
+    def to_dict(self):
+        d = {
+            "layer_offsets": self.layer_offsets,
+            "uv_tile_layer_indices": self.uv_tile_layer_indices,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.layer_offsets = d["layer_offsets"]
+        instance.uv_tile_layer_indices = d["uv_tile_layer_indices"]
+        return instance
+
+class Snapshot(object):
+    def __init__(self):
+        super(Snapshot, self).__init__()
+        self.header = SnapshotHeader()
+        self.layers = []
+
+def encode_chunk(chunk_type, dobj_):
+    s = json.dumps({"chunk": chunk_type, "data": dobj_.to_dict()}, separators=(",", ":"))
+    return (s + "\n").encode("utf-8")
+
+def decode_chunk(line, chunk_type, cls):
+    d = json.loads(line)
+    if d.get("chunk") != chunk_type:
+        raise ValueError(f"Expected a {chunk_type} chunk.")
+    return cls.from_dict(d["data"])
+
+def write_snapshot(file_path, header, layer_snapshots):
+    # layer_snapshots may be a generator, which is consumed one layer at a
+    # time.
+    temp_file_path = f"{file_path}.tmp"
+    try:
+        footer = SnapshotFooter()
+        with open(temp_file_path, "wb") as file:
+            file.write(encode_chunk("header", header))
+            for layer_snapshot in layer_snapshots:
+                layer_index = len(footer.layer_offsets)
+                footer.layer_offsets.append(file.tell())
+                file.write(encode_chunk("layer", layer_snapshot))
+                for uv_tile_num in layer_snapshot.uv_tile_nums:
+                    footer.uv_tile_layer_indices.setdefault(str(uv_tile_num), []).append(layer_index)
+            footer_offset = file.tell()
+            file.write(encode_chunk("footer", footer))
+            file.write(f"{footer_offset:0{TRAILER_DIGIT_COUNT}d}\n".encode("utf-8"))
+        os.replace(temp_file_path, file_path)
+    except:
+        if os.path.isfile(temp_file_path):
+            os.remove(temp_file_path)
+        return error.Error("An error occurred while writing the snapshot.")
+
+    return None
+
+def read_header_chunk(file):
+    header = decode_chunk(file.readline(), "header", SnapshotHeader)
+    if header.format != SNAPSHOT_FORMAT:
+        raise ValueError("The file is not a snapshot.")
+    if header.version > SNAPSHOT_VERSION:
+        raise ValueError(f"The snapshot version {header.version} is not supported.")
+    return header
+
+def read_footer_chunk(file):
+    file.seek(-(TRAILER_DIGIT_COUNT + 1), os.SEEK_END)
+    footer_offset = int(file.read(TRAILER_DIGIT_COUNT))
+    file.seek(footer_offset)
+    footer = decode_chunk(file.readline(), "footer", SnapshotFooter)
+    return footer
+
+def iterate_layer_snapshots(file_path, uv_tile_nums=None):
+    # Yields the layers from bottom to top. If uv_tile_nums is given, only
+    # the layers overlapping the tiles are read.
+    with open(file_path, "rb") as file:
+        read_header_chunk(file)
+
+        if uv_tile_nums is None:
+            while True:
+                line = file.readline()
+                if (not line) or line.startswith(b"{\"chunk\":\"footer\""):
+                    break
+                yield decode_chunk(line, "layer", LayerSnapshot)
+            return
+
+        footer = read_footer_chunk(file)
+        layer_indices = set()
+        for uv_tile_num in uv_tile_nums:
+            layer_indices.update(footer.uv_tile_layer_indices.get(str(uv_tile_num), []))
+        for layer_index in sorted(layer_indices):
+            file.seek(footer.layer_offsets[layer_index])
+            yield decode_chunk(file.readline(), "layer", LayerSnapshot)
+
+def read_snapshot(file_path, uv_tile_nums=None):
+    try:
+        snapshot = Snapshot()
+        with open(file_path, "rb") as file:
+            snapshot.header = read_header_chunk(file)
+        snapshot.layers = list(iterate_layer_snapshots(file_path, uv_tile_nums))
+        return snapshot, None
+    except:
+        return None, error.Error("An error occurred while reading the snapshot.")
+
+def create_layer_snapshot(layer_obj):
+    from . import properties
+
+    layer_snapshot = LayerSnapshot()
+    layer_snapshot.name = layer_obj.name
+    layer_snapshot.layer_obj_type = properties.get_layer_obj_type(layer_obj).name
+    layer_snapshot.b_hide_render = layer_obj.hide_render
+    layer_snapshot.matrix_world = [list(row) for row in layer_obj.matrix_world]
+    layer_snapshot.instance_opacity = layer_obj.color[3]
+    layer_snapshot.layer_group_names = [o.name for o in properties.find_layer_group_objs(layer_obj)]
+
+    mesh = layer_obj.data
+    mesh.calc_loop_triangles()
+    layer_snapshot.mesh_name = mesh.name
+    layer_snapshot.vert_coords = [0.0] * (len(mesh.vertices) * 3)
+    mesh.vertices.foreach_get("co", layer_snapshot.vert_coords)
+    layer_snapshot.loop_vert_indices = [0] * len(mesh.loops)
+    mesh.loops.foreach_get("vertex_index", layer_snapshot.loop_vert_indices)
+    layer_snapshot.loop_totals = [0] * len(mesh.polygons)
+    mesh.polygons.foreach_get("loop_total", layer_snapshot.loop_totals)
+    layer_snapshot.loop_uvs = [0.0] * (len(mesh.loops) * 2)
+    if mesh.uv_layers.active:
+        mesh.uv_layers.active.data.foreach_get("uv", layer_snapshot.loop_uvs)
+    layer_snapshot.triangle_loop_indices = [0] * (len(mesh.loop_triangles) * 3)
+    mesh.loop_triangles.foreach_get("loops", layer_snapshot.triangle_loop_indices)
+
+    for uv_tile_coord in properties.find_uv_tile_coords_overlapping_obj(layer_obj):
+        if (0 <= uv_tile_coord[0] < 10) and (0 <= uv_tile_coord[1]):
+            layer_snapshot.uv_tile_nums.append(properties.uv_tile_coord_to_num(uv_tile_coord))
+
+    layer_obj_type = properties.get_layer_obj_type(layer_obj)
+    if layer_obj_type in [properties.LayerObjType.Image, properties.LayerObjType.Procedural]:
+        import bpy
+
+        image_obj_wrapper = properties.ImageObjWrapper(layer_obj)
+        if layer_obj_type == properties.LayerObjType.Procedural:
+            layer_snapshot.procedural_params = properties.ProceduralLayerObjWrapper(layer_obj).get_params()
+        else:
+            for map_internal_name, image in image_obj_wrapper.get_maps().items():
+                source_file_path = properties.get_image_source_file_path(image)
+                layer_snapshot.maps[map_internal_name] = bpy.path.abspath(source_file_path, library=image.library)
+                layer_snapshot.map_colorspaces[map_internal_name] = image.colorspace_settings.name
+        layer_snapshot.b_use_grayscale_as_opacity = image_obj_wrapper.get_b_use_grayscale_as_opacity()
+        layer_snapshot.mapping_location = list(image_obj_wrapper.get_mapping_location())
+        layer_snapshot.mapping_rotation = list(image_obj_wrapper.get_mapping_rotation())
+        layer_snapshot.mapping_scale = list(image_obj_wrapper.get_mapping_scale())
+        layer_snapshot.mapping_matrix = image_obj_wrapper.get_mapping_uv_matrix()
+        layer_snapshot.opacity = image_obj_wrapper.get_opacity()
+        layer_snapshot.blend_mode = image_obj_wrapper.get_blend_mode().name
+    elif layer_obj_type == properties.LayerObjType.Basic:
+        basic_layer_obj_wrapper = properties.BasicLayerObjWrapper(layer_obj)
+        layer_snapshot.basic_values = {k: list(v) for k, v in basic_layer_obj_wrapper.get_values().items()}
+        layer_snapshot.opacity = basic_layer_obj_wrapper.get_opacity()
+
+    return layer_snapshot
+
+def create_layer_snapshots(scene):
+    from . import properties
+
+    layer_objs = properties.find_objs_with_type(properties.ObjType.Layer, scene)
+    layer_objs.sort(key=lambda o: o.location.z)
+    for layer_obj in layer_objs:
+        layer_obj_type = properties.get_layer_obj_type(layer_obj)
+        if layer_obj_type in layertypes.COMPOSITED_LAYER_OBJ_TYPES:
+            yield create_layer_snapshot(layer_obj)
+
+def create_snapshot_header(scene):
+    from . import properties
+
+    header = SnapshotHeader()
+    header.scene_setting_group = scene.ie3.create_scene_setting_group().to_dict()
+    header.default_map_file_path = properties.find_dummy_image_opaque().filepath
+    for group_obj in properties.find_objs_with_type(properties.ObjType.LayerGroup, scene):
+        layer_group_snapshot = LayerGroupSnapshot()
+        layer_group_snapshot.name = group_obj.name
+        parent_group_obj = properties.get_layer_group_obj(group_obj)
+        if parent_group_obj is not None:
+            layer_group_snapshot.parent_name = parent_group_obj.name
+        layer_group_snapshot.opacity = properties.LayerGroupObjWrapper(group_obj).get_opacity()
+        layer_group_snapshot.b_hide_render = group_obj.hide_render
+        header.layer_groups.append(layer_group_snapshot)
+    return header
+
+def write_scene_snapshot(scene, file_path):
+    return write_snapshot(file_path, create_snapshot_header(scene), create_layer_snapshots(scene))
+
+def create_layer_group_objs(header):
+    # Returns the created groups by their names in the snapshot.
+    from . import properties
+
+    group_objs = {}
+    for layer_group_snapshot in header.layer_groups:
+        group_obj = properties.LayerGroupObjWrapper.create_obj()
+        group_obj.name = layer_group_snapshot.name
+        group_obj.hide_render = layer_group_snapshot.b_hide_render
+        properties.LayerGroupObjWrapper(group_obj).set_opacity(layer_group_snapshot.opacity)
+        group_objs[layer_group_snapshot.name] = group_obj
+    for layer_group_snapshot in header.layer_groups:
+        properties.set_layer_group_obj(group_objs[layer_group_snapshot.name], group_objs.get(layer_group_snapshot.parent_name))
+    return group_objs
+
+def create_layer_obj(layer_snapshot, mesh_objs, group_objs=None):
+    # mesh_objs maps the mesh names in the snapshot to created objects, so
+    # instances share their mesh and material again. group_objs maps the
+    # group names in the snapshot to created groups.
+    import bpy
+    import mathutils
+
+    from . import properties
+
+    layer_obj_type = properties.LayerObjType(layer_snapshot.layer_obj_type)
+    mesh_obj = mesh_objs.get(layer_snapshot.mesh_name)
+    if mesh_obj is not None:
+        layer_obj = mesh_obj.copy()
+    else:
+        if layer_obj_type == properties.LayerObjType.Image:
+            layer_obj = properties.ImageObjWrapper.create_obj()
+        elif layer_obj_type == properties.LayerObjType.Procedural:
+            layer_obj = properties.ProceduralLayerObjWrapper.create_obj()
+        else:
+            layer_obj = properties.BasicLayerObjWrapper.create_obj()
+        mesh_objs[layer_snapshot.mesh_name] = layer_obj
+
+        verts = [layer_snapshot.vert_coords[i:i + 3] for i in range(0, len(layer_snapshot.vert_coords), 3)]
+        faces = []
+        loop_start = 0
+        for loop_total in layer_snapshot.loop_totals:
+            faces.append(layer_snapshot.loop_vert_indices[loop_start:loop_start + loop_total])
+            loop_start += loop_total
+        mesh = layer_obj.data
+        mesh.clear_geometry()
+        mesh.from_pydata(verts, [], faces)
+        uv_layer = mesh.uv_layers.active or mesh.uv_layers.new()
+        uv_layer.data.foreach_set("uv", layer_snapshot.loop_uvs)
+        mesh.update()
+
+        if layer_obj_type in [properties.LayerObjType.Image, properties.LayerObjType.Procedural]:
+            image_obj_wrapper = properties.ImageObjWrapper(layer_obj)
+            if layer_obj_type == properties.LayerObjType.Procedural:
+                properties.ProceduralLayerObjWrapper(layer_obj).set_params(layer_snapshot.procedural_params)
+            else:
+                map_file_path_dict = {}
+                for map_internal_name, file_path in layer_snapshot.maps.items():
+                    if os.path.isfile(file_path):
+                        map_file_path_dict[map_internal_name] = file_path
+                image_obj_wrapper.update_maps(map_file_path_dict)
+                image_obj_wrapper.switch_map(bpy.context.scene.ie3.display_map_name)
+            image_obj_wrapper.set_b_use_grayscale_as_opacity(layer_snapshot.b_use_grayscale_as_opacity)
+            image_obj_wrapper.set_mapping_location(layer_snapshot.mapping_location)
+            image_obj_wrapper.set_mapping_rotation(layer_snapshot.mapping_rotation)
+            image_obj_wrapper.set_mapping_scale(layer_snapshot.mapping_scale)
+            image_obj_wrapper.set_opacity(layer_snapshot.opacity)
+            image_obj_wrapper.set_blend_mode(layer_snapshot.blend_mode)
+        elif layer_obj_type == properties.LayerObjType.Basic:
+            basic_layer_obj_wrapper = properties.BasicLayerObjWrapper(layer_obj)
+            basic_layer_obj_wrapper.set_values(layer_snapshot.basic_values)
+            basic_layer_obj_wrapper.set_opacity(layer_snapshot.opacity)
+            basic_layer_obj_wrapper.switch_map(bpy.context.scene.ie3.display_map_name)
+
+    layer_obj.name = layer_snapshot.name
+    layer_obj.matrix_world = mathutils.Matrix(layer_snapshot.matrix_world)
+    layer_obj.hide_render = layer_snapshot.b_hide_render
+    layer_obj.color[3] = layer_snapshot.instance_opacity
+    if group_objs and layer_snapshot.layer_group_names:
+        properties.set_layer_group_obj(layer_obj, group_objs.get(layer_snapshot.layer_group_names[-1]))
+
+    return layer_obj
+
+def create_compositor_layers(snapshot, map_internal_name, b_use_texture_cache=False):
+    import numpy as np
+
+    from . import compositor
+
+    image_sources = {}
+    def get_image_source(layer_snapshot, internal_name):
+        file_path = layer_snapshot.maps.get(internal_name, snapshot.header.default_map_file_path)
+        b_is_srgb = layer_snapshot.map_colorspaces.get(internal_name, "sRGB") == "sRGB"
+        key = (file_path, b_is_srgb)
+        if not key in image_sources:
+            if b_use_texture_cache:
+                from . import txcache
+                file_path = txcache.get_tx_file_path(file_path)
+            image_sources[key] = compositor.ImageSource(file_path=file_path, b_is_srgb=b_is_srgb)
+        return image_sources[key]
+
+    layer_group_snapshots = {g.name: g for g in snapshot.header.layer_groups}
+    groups = {}
+    def get_groups(group_snapshots):
+        for group_snapshot in group_snapshots:
+            if not group_snapshot.name in groups:
+                group = compositor.LayerGroup()
+                group.opacity = group_snapshot.opacity
+                groups[group_snapshot.name] = group
+        return [groups[g.name] for g in group_snapshots]
+
+    entries = []
+    for layer_snapshot in snapshot.layers:
+        if layer_snapshot.b_hide_render:
+            continue
+        group_snapshots = [layer_group_snapshots[n] for n in layer_snapshot.layer_group_names if n in layer_group_snapshots]
+        if any(g.b_hide_render for g in group_snapshots):
+            continue
+        if not layer_snapshot.layer_obj_type in layertypes.COMPOSITED_LAYER_OBJ_TYPES:
+            continue
+
+        matrix_world = np.array(layer_snapshot.matrix_world, np.float64)
+        vert_coords = np.array(layer_snapshot.vert_coords, np.float64).reshape(-1, 3)
+        world_coords = vert_coords @ matrix_world[:3, :3].T + matrix_world[:3, 3]
+        loop_vert_indices = np.array(layer_snapshot.loop_vert_indices, np.int64)
+
+        if layer_snapshot.layer_obj_type == layertypes.LayerObjType.Basic.name:
+            layer = compositor.BasicLayer()
+            layer.edge_coords = compositor.create_outline_edges(world_coords[:, :2], loop_vert_indices, layer_snapshot.loop_totals)
+            layer.color = np.array(layer_snapshot.basic_values.get(map_internal_name, layertypes.DEFAULT_BASIC_VALUE), np.float32)
+            layer.opacity = layer_snapshot.opacity * layer_snapshot.instance_opacity
+            entries.append((get_groups(group_snapshots), layer))
+            continue
+
+        triangle_loop_indices = np.array(layer_snapshot.triangle_loop_indices, np.int64).reshape(-1, 3)
+
+        layer = compositor.Layer()
+        layer.triangle_coords = world_coords[loop_vert_indices[triangle_loop_indices]][:, :, :2]
+        layer.triangle_uvs = np.array(layer_snapshot.loop_uvs, np.float64).reshape(-1, 2)[triangle_loop_indices]
+        layer.mapping_matrix = np.array(layer_snapshot.mapping_matrix, np.float64)
+        if layer_snapshot.layer_obj_type == layertypes.LayerObjType.Procedural.name:
+            layer.basic_map_source = compositor.ProceduralSource(layer_snapshot.procedural_params)
+            layer.opacity_map_source = layer.basic_map_source
+        else:
+            layer.basic_map_source = get_image_source(layer_snapshot, map_internal_name)
+            layer.opacity_map_source = get_image_source(layer_snapshot, layertypes.SpecialMapType.Opacity.name)
+            layer.b_use_grayscale_as_opacity = layer_snapshot.b_use_grayscale_as_opacity
+        layer.opacity = layer_snapshot.opacity * layer_snapshot.instance_opacity
+        layer.blend_mode = layer_snapshot.blend_mode
+
+        entries.append((get_groups(group_snapshots), layer))
+
+    return compositor.group_layers(entries)
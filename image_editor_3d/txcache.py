@@ -0,0 +1,174 @@
+import hashlib
+import os
+
+import OpenImageIO as oiio
+
+from . import dobj, properties
+
+
+# Cache of source maps converted to tiled, mip-mapped textures. Textures are
+# keyed by the digest of the source content, and the index maps source paths
+# to digests by size and modification time, so unchanged sources are never
+# hashed twice.
+#
+# The compositor reads the textures through its image cache, which only
+# decodes the levels and tiles in use. The viewport loads a level extracted
+# from a texture (a proxy) instead of the full resolution source.
+
+TX_CACHE_DIR_NAME = "tx_cache"
+INDEX_FILE_NAME = "index.json"
+TILE_SIZE = 64
+
+class TxCacheEntry(dobj.Dobj):
+    def __init__(self):
+        self.file_size = 0
+        self.mtime_ns = 0
+        self.digest = ""
+
+    def to_dict(self):
+        d = {
+            "file_size": self.file_size,
+            "mtime_ns": self.mtime_ns,
+            "digest": self.digest,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.file_size = d["file_size"]
+        instance.mtime_ns = d["mtime_ns"]
+        instance.digest = d["digest"]
+        return instance
+
+class TxCacheIndex(dobj.Dobj):
+    def __init__(self):
+        self.entries = {}
+
+    def to_dict(self):
+        d = {
+            "entries": dobj.dobj_dict_to_dict_dict(self.entries),
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.entries = dobj.dict_dict_to_dobj_dict(d["entries"], TxCacheEntry)
+        return instance
+
+index = None
+
+def get_cache_dir_path():
+    cache_dir_path = os.path.join(properties.get_user_dir_path(), TX_CACHE_DIR_NAME)
+    os.makedirs(cache_dir_path, exist_ok=True)
+    return cache_dir_path
+
+def get_index():
+    global index
+    if index is None:
+        index_file_path = os.path.join(get_cache_dir_path(), INDEX_FILE_NAME)
+        index = TxCacheIndex()
+        if os.path.isfile(index_file_path):
+            loaded_index, e = dobj.read_dobj(index_file_path, TxCacheIndex)
+            if not e:
+                index = loaded_index
+    return index
+
+def find_digest(file_path):
+    file_path = os.path.abspath(file_path)
+    st = os.stat(file_path)
+
+    entries = get_index().entries
+    entry = entries.get(file_path)
+    if entry and (entry.file_size == st.st_size) and (entry.mtime_ns == st.st_mtime_ns):
+        return entry.digest
+
+    with open(file_path, "rb") as file:
+        digest = hashlib.file_digest(file, "sha1").hexdigest()
+
+    entry = TxCacheEntry()
+    entry.file_size = st.st_size
+    entry.mtime_ns = st.st_mtime_ns
+    entry.digest = digest
+    entries[file_path] = entry
+    dobj.write_dobj(get_index(), os.path.join(get_cache_dir_path(), INDEX_FILE_NAME))
+
+    return digest
+
+def get_tx_file_path(file_path):
+    # Returns the source itself if it cannot be converted.
+    try:
+        digest = find_digest(file_path)
+    except OSError:
+        return file_path
+
+    tx_file_path = os.path.join(get_cache_dir_path(), f"{digest}.tx")
+    if os.path.isfile(tx_file_path):
+        return tx_file_path
+
+    config = oiio.ImageSpec()
+    config.tile_width = TILE_SIZE
+    config.tile_height = TILE_SIZE
+    config.attribute("compression", "zip")
+    temp_file_path = os.path.join(get_cache_dir_path(), f".{digest}.tmp.tx")
+    # Sources are read with straight alpha, so the textures are not
+    # premultiplied, the same as the sources read by the compositor.
+    input_config = oiio.ImageSpec()
+    input_config.attribute("oiio:UnassociatedAlpha", 1)
+    image_buf = oiio.ImageBuf(file_path, 0, 0, input_config)
+    if not oiio.ImageBufAlgo.make_texture(oiio.MakeTxTexture, image_buf, temp_file_path, config):
+        if os.path.isfile(temp_file_path):
+            os.remove(temp_file_path)
+        return file_path
+    os.replace(temp_file_path, tx_file_path)
+
+    return tx_file_path
+
+def get_mip_sizes(file_path):
+    mip_sizes = []
+    image_input = oiio.ImageInput.open(file_path)
+    if not image_input:
+        return mip_sizes
+    try:
+        while True:
+            spec = image_input.spec_dimensions(0, len(mip_sizes))
+            if spec.width <= 0:
+                break
+            mip_sizes.append((spec.width, spec.height))
+    finally:
+        image_input.close()
+    return mip_sizes
+
+def get_proxy_file_path(file_path, max_size):
+    # Returns the source itself if it is small enough or cannot be converted.
+    source_mip_sizes = get_mip_sizes(file_path)
+    if (not source_mip_sizes) or (max(source_mip_sizes[0]) <= max_size):
+        return file_path
+
+    tx_file_path = get_tx_file_path(file_path)
+    if tx_file_path == file_path:
+        return file_path
+
+    mip_sizes = get_mip_sizes(tx_file_path)
+    miplevel = len(mip_sizes) - 1
+    for i, mip_size in enumerate(mip_sizes):
+        if max(mip_size) <= max_size:
+            miplevel = i
+            break
+
+    image_buf = oiio.ImageBuf(tx_file_path, 0, miplevel)
+    ext = ".exr" if image_buf.spec().format.basetype in [oiio.FLOAT, oiio.HALF] else ".png"
+    digest = os.path.splitext(os.path.basename(tx_file_path))[0]
+    proxy_file_path = os.path.join(get_cache_dir_path(), f"{digest}_{miplevel}{ext}")
+    if os.path.isfile(proxy_file_path):
+        return proxy_file_path
+
+    temp_file_path = os.path.join(get_cache_dir_path(), f".{digest}_{miplevel}.tmp{ext}")
+    if not image_buf.write(temp_file_path):
+        if os.path.isfile(temp_file_path):
+            os.remove(temp_file_path)
+        return file_path
+    os.replace(temp_file_path, proxy_file_path)
+
+    return proxy_file_path
@@ -0,0 +1,191 @@
+import os
+import threading
+import time
+
+import bpy
+
+from . import properties
+
+
+STAT_BATCH_SIZE = 256
+STAT_BATCH_INTERVAL = 0.01
+MIN_POLL_INTERVAL = 1.0
+MAX_POLL_INTERVAL = 16.0
+TIMER_INTERVAL = 1.0
+# Layers and maps are scanned again at this interval even if no file changed,
+# so that maps added since the last scan are watched.
+RESCAN_INTERVAL = 16.0
+
+class SourceMapWatcher(object):
+    def __init__(self):
+        super(SourceMapWatcher, self).__init__()
+        self.__lock = threading.Lock()
+        self.__stop_event = threading.Event()
+        self.__thread = None
+        self.__file_paths = []
+        self.__changed_file_paths = set()
+
+    def is_running(self):
+        return (self.__thread is not None) and self.__thread.is_alive()
+
+    def start(self):
+        if self.is_running():
+            return
+        self.__stop_event.clear()
+        self.__thread = threading.Thread(target=self.__run, name="ie3_source_map_watcher", daemon=True)
+        self.__thread.start()
+
+    def stop(self):
+        if not self.is_running():
+            return
+        self.__stop_event.set()
+        self.__thread.join()
+        self.__thread = None
+        with self.__lock:
+            self.__changed_file_paths.clear()
+
+    def set_file_paths(self, file_paths):
+        with self.__lock:
+            self.__file_paths = list(file_paths)
+
+    def pop_changed_file_paths(self):
+        with self.__lock:
+            changed_file_paths = self.__changed_file_paths
+            self.__changed_file_paths = set()
+        return changed_file_paths
+
+    def __run(self):
+        # Stats are only touched by this thread. Files are polled in small
+        # batches so thousands of paths never cause a burst of I/O, and the
+        # poll interval backs off while nothing changes.
+        stats = {}
+        poll_interval = MIN_POLL_INTERVAL
+        while not self.__stop_event.is_set():
+            with self.__lock:
+                file_paths = self.__file_paths
+
+            changed_file_paths = set()
+            for i in range(0, len(file_paths), STAT_BATCH_SIZE):
+                for file_path in file_paths[i:i + STAT_BATCH_SIZE]:
+                    stat = None
+                    try:
+                        st = os.stat(file_path)
+                        stat = (st.st_mtime_ns, st.st_size)
+                    except OSError:
+                        pass
+
+                    if not file_path in stats:
+                        stats[file_path] = stat
+                        continue
+                    if stats[file_path] != stat:
+                        stats[file_path] = stat
+                        changed_file_paths.add(file_path)
+
+                if self.__stop_event.wait(STAT_BATCH_INTERVAL):
+                    return
+
+            if len(stats) > len(file_paths):
+                watched_file_paths = set(file_paths)
+                stats = {k: v for k, v in stats.items() if k in watched_file_paths}
+
+            if changed_file_paths:
+                with self.__lock:
+                    self.__changed_file_paths.update(changed_file_paths)
+                poll_interval = MIN_POLL_INTERVAL
+            else:
+                poll_interval = min(poll_interval * 2.0, MAX_POLL_INTERVAL)
+
+            self.__stop_event.wait(poll_interval)
+
+watcher = SourceMapWatcher()
+
+def mark_uv_tiles_dirty(ie3, objs):
+    uv_tile_coords = set()
+    for obj in objs:
+        for uv_tile_coord in properties.find_uv_tile_coords_overlapping_obj(obj):
+            uv_tile_coords.add(tuple(uv_tile_coord))
+
+    for uv_tile_data in ie3.uv_tile_data_list:
+        if (uv_tile_data.coord[0], uv_tile_data.coord[1]) in uv_tile_coords:
+            uv_tile_data.b_is_dirty = True
+
+def find_watching_scenes():
+    return [s for s in bpy.data.scenes if s.ie3.b_is_editor_scene and s.ie3.b_watch_source_maps]
+
+last_scan_time = None
+
+def watch_source_maps():
+    global last_scan_time
+
+    if not watcher.is_running():
+        return None
+
+    scenes = find_watching_scenes()
+    if not scenes:
+        watcher.stop()
+        return None
+
+    changed_file_paths = watcher.pop_changed_file_paths()
+    if (not changed_file_paths) and (last_scan_time is not None) and (time.monotonic() - last_scan_time < RESCAN_INTERVAL):
+        return TIMER_INTERVAL
+    last_scan_time = time.monotonic()
+
+    file_paths = set()
+    changed_images = {}
+    for scene in scenes:
+        ie3 = scene.ie3
+        maps_by_material = {}
+        changed_objs = []
+        image_objs = properties.find_layer_objs_with_type(properties.LayerObjType.Image, scene)
+        for image_obj in image_objs:
+            material_pointer = image_obj.data.materials[0].as_pointer()
+            if not material_pointer in maps_by_material:
+                image_obj_wrapper = properties.ImageObjWrapper(image_obj)
+                maps_by_material[material_pointer] = list(image_obj_wrapper.get_maps().values())
+
+            b_is_changed = False
+            for m in maps_by_material[material_pointer]:
+                file_path = bpy.path.abspath(properties.get_image_source_file_path(m))
+                file_paths.add(file_path)
+                if file_path in changed_file_paths:
+                    changed_images.setdefault(m, ie3)
+                    b_is_changed = True
+
+            if b_is_changed:
+                changed_objs.append(image_obj)
+
+        mark_uv_tiles_dirty(ie3, changed_objs)
+
+    for image, ie3 in changed_images.items():
+        if properties.SOURCE_FILE_PATH_KEY in image:
+            # Texture cache proxies are extracted again from the new source.
+            from . import txcache
+            source_file_path = bpy.path.abspath(image[properties.SOURCE_FILE_PATH_KEY])
+            image.filepath = txcache.get_proxy_file_path(source_file_path, int(ie3.viewport_max_texture_size))
+        else:
+            image.reload()
+
+    watcher.set_file_paths(sorted(file_paths))
+
+    return TIMER_INTERVAL
+
+def start_watching():
+    global last_scan_time
+    last_scan_time = None
+    watcher.start()
+    if not bpy.app.timers.is_registered(watch_source_maps):
+        bpy.app.timers.register(watch_source_maps, first_interval=0.0, persistent=True)
+
+def stop_watching():
+    watcher.stop()
+    if bpy.app.timers.is_registered(watch_source_maps):
+        bpy.app.timers.unregister(watch_source_maps)
+
+@bpy.app.handlers.persistent
+def watch_source_maps_handler(*args):
+    # The watcher is not saved with the file, so it is started again for
+    # the scenes of the opened file.
+    if find_watching_scenes():
+        start_watching()
+    else:
+        stop_watching()
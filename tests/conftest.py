@@ -0,0 +1,14 @@
+import os
+import sys
+import types
+
+
+# The package __init__ registers the add-on and needs bpy, so the package is
+# created without it. Modules that only depend on NumPy and OpenImageIO can
+# then be imported as usual, e.g. "from image_editor_3d import geometry".
+PACKAGE_DIR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "image_editor_3d")
+
+if "image_editor_3d" not in sys.modules:
+    package = types.ModuleType("image_editor_3d")
+    package.__path__ = [PACKAGE_DIR_PATH]
+    sys.modules["image_editor_3d"] = package
@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+
+from image_editor_3d import blending
+
+
+def soft_light_d(cb):
+    return np.where(cb <= 0.25, ((16.0 * cb - 12.0) * cb + 4.0) * cb, np.sqrt(cb))
+
+# Straight W3C blend functions B(cb, cs).
+REFERENCES = {
+    "Multiply": lambda cb, cs: cb * cs,
+    "Screen": lambda cb, cs: cb + cs - cb * cs,
+    "Overlay": lambda cb, cs: np.where(cb <= 0.5, 2.0 * cs * cb, 1.0 - 2.0 * (1.0 - cs) * (1.0 - cb)),
+    "HardLight": lambda cb, cs: np.where(cs <= 0.5, 2.0 * cb * cs, 1.0 - 2.0 * (1.0 - cb) * (1.0 - cs)),
+    "SoftLight": lambda cb, cs: np.where(cs <= 0.5, cb - (1.0 - 2.0 * cs) * cb * (1.0 - cb), cb + (2.0 * cs - 1.0) * (soft_light_d(cb) - cb)),
+    "Add": lambda cb, cs: cb + cs,
+    "Subtract": lambda cb, cs: np.maximum(cb - cs, 0.0),
+    "Darken": np.minimum,
+    "Lighten": np.maximum,
+    "Difference": lambda cb, cs: np.abs(cb - cs),
+}
+
+def blend_reference(dst, colors, alphas, blend_mode):
+    dst = dst.astype(np.float64)
+    dst_alphas = dst[:, 3:]
+    if blend_mode == "Normal":
+        mixed = colors
+    else:
+        cb = dst[:, :3] / np.maximum(dst_alphas, blending.EPSILON)
+        mixed = colors + dst_alphas * (REFERENCES[blend_mode](cb, colors) - colors)
+    result = np.empty_like(dst)
+    result[:, :3] = dst[:, :3] * (1.0 - alphas) + mixed * alphas
+    result[:, 3:] = dst_alphas * (1.0 - alphas) + alphas
+    return result
+
+@pytest.mark.parametrize("blend_mode", list(blending.KERNELS))
+def test_blend(blend_mode, monkeypatch):
+    # Small chunks, so the last chunk is partial.
+    monkeypatch.setattr(blending, "MAX_CHUNK_PIXEL_COUNT", 64)
+    rng = np.random.default_rng(0)
+    dst = rng.random((1000, 4)).astype(np.float32)
+    dst[:, :3] *= dst[:, 3:]
+    colors = rng.random((1000, 3)).astype(np.float32)
+    alphas = rng.random((1000, 1)).astype(np.float32)
+
+    expected = blend_reference(dst, colors, alphas, blend_mode)
+    blending.blend(dst, colors, alphas, blend_mode)
+    np.testing.assert_allclose(dst, expected, atol=1e-5)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from image_editor_3d import compositor
+
+
+def create_layer(triangle_coords, opacity):
+    layer = compositor.Layer()
+    layer.triangle_coords = np.asarray(triangle_coords, np.float64)
+    # The UVs follow the coords within the tile.
+    layer.triangle_uvs = layer.triangle_coords.copy()
+    source = compositor.ImageSource(pixels=np.ones((4, 4, 4), np.float32), b_is_srgb=False)
+    layer.basic_map_source = source
+    layer.opacity_map_source = source
+    layer.opacity = opacity
+    return layer
+
+def composite_alphas(layer, resolution):
+    c = compositor.Compositor(2 ** 24, 2 ** 24)
+    try:
+        pixels = c.composite_pixels([layer], [0, 0], resolution)
+    finally:
+        c.close()
+    return pixels[..., 3]
+
+@pytest.mark.parametrize("triangle_coords", [
+    # Split along either diagonal, in both windings.
+    [[(0.0, 0.0), (1.0, 0.0), (1.0, 1.0)], [(0.0, 0.0), (1.0, 1.0), (0.0, 1.0)]],
+    [[(0.0, 0.0), (1.0, 0.0), (0.0, 1.0)], [(1.0, 0.0), (1.0, 1.0), (0.0, 1.0)]],
+    [[(0.0, 0.0), (1.0, 1.0), (1.0, 0.0)], [(0.0, 0.0), (0.0, 1.0), (1.0, 1.0)]],
+    # A fan around a vert at a pixel center.
+    [[(0.5625, 0.4375), (0.0, 0.0), (1.0, 0.0)], [(0.5625, 0.4375), (1.0, 0.0), (1.0, 1.0)],
+     [(0.5625, 0.4375), (1.0, 1.0), (0.0, 1.0)], [(0.5625, 0.4375), (0.0, 1.0), (0.0, 0.0)]],
+])
+def test_composite_layer_covers_shared_edges_once(triangle_coords):
+    alphas = composite_alphas(create_layer(triangle_coords, 0.5), 8)
+    np.testing.assert_allclose(alphas, 0.5, atol=1e-6)
+
+def test_composite_layer_leaves_outside_pixels():
+    alphas = composite_alphas(create_layer([[(0.0, 0.0), (0.5, 0.0), (0.5, 1.0)], [(0.0, 0.0), (0.5, 1.0), (0.0, 1.0)]], 0.5), 8)
+    np.testing.assert_allclose(alphas[:, :4], 0.5, atol=1e-6)
+    np.testing.assert_allclose(alphas[:, 4:], 0.0, atol=1e-6)
+
+def test_create_outline_edges_removes_shared_edges():
+    # Two quads sharing the edge (1, 4).
+    coords = [(0.0, 0.0), (1.0, 0.0), (2.0, 0.0), (0.0, 1.0), (1.0, 1.0), (2.0, 1.0)]
+    edges = compositor.create_outline_edges(coords, [0, 1, 4, 3, 1, 2, 5, 4], [4, 4])
+
+    assert edges.shape == (6, 2, 2)
+    assert not any(np.allclose(e, [(1.0, 0.0), (1.0, 1.0)]) for e in edges)
+
+def test_create_outline_edges_without_polygons():
+    assert compositor.create_outline_edges([(0.0, 0.0)], [], []).shape == (0, 2, 2)
+
+def test_fill_even_odd_fills_pixel_centers_inside():
+    edges = np.array([[(0.5, 0.5), (4.5, 0.5)], [(4.5, 0.5), (4.5, 2.5)], [(4.5, 2.5), (0.5, 2.5)], [(0.5, 2.5), (0.5, 0.5)]])
+    mask = compositor.fill_even_odd(edges, 6, 4)
+
+    expected = np.zeros((4, 6), bool)
+    expected[1:3, 1:5] = True
+    np.testing.assert_array_equal(mask, expected)
+
+def test_fill_even_odd_leaves_holes_and_clips():
+    def square(x0, y0, x1, y1):
+        return [[(x0, y0), (x1, y0)], [(x1, y0), (x1, y1)], [(x1, y1), (x0, y1)], [(x0, y1), (x0, y0)]]
+
+    # A square with a hole, partly outside the image.
+    edges = np.array(square(-2.5, -2.5, 5.5, 5.5) + square(1.5, 1.5, 3.5, 3.5))
+    mask = compositor.fill_even_odd(edges, 5, 5)
+
+    expected = np.ones((5, 5), bool)
+    expected[2:4, 2:4] = False
+    np.testing.assert_array_equal(mask, expected)
+
+def test_fill_even_odd_shares_edges_between_polygons():
+    # Triangles sharing a diagonal through pixel centers fill each pixel once.
+    coords = [(-0.5, -0.5), (3.5, -0.5), (3.5, 3.5), (-0.5, 3.5)]
+    edges = compositor.create_outline_edges(coords, [0, 1, 2, 0, 2, 3], [3, 3])
+    mask = compositor.fill_even_odd(edges, 4, 4)
+
+    np.testing.assert_array_equal(mask, np.ones((4, 4), bool))
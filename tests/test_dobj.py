@@ -0,0 +1,50 @@
+import os
+
+from image_editor_3d import dobj
+
+
+class Record(dobj.Dobj):
+    def __init__(self):
+        self.value = 0
+
+    def to_dict(self):
+        d = {
+            "value": self.value,
+        }
+        return d
+
+    @classmethod
+    def from_dict(cls, d):
+        instance = cls()
+        instance.value = d["value"]
+        return instance
+
+class UnserializableRecord(Record):
+    def to_dict(self):
+        return {"value": object()}
+
+def create_record(value):
+    record = Record()
+    record.value = value
+    return record
+
+def test_write_dobj_removes_temp_file_on_failure(tmp_path):
+    file_path = str(tmp_path / "record.json")
+    assert dobj.write_dobj(create_record(1), file_path) is None
+
+    e = dobj.write_dobj(UnserializableRecord(), file_path)
+    assert e
+    assert not os.path.exists(f"{file_path}.tmp")
+    record, e = dobj.read_dobj(file_path, Record)
+    assert (not e) and (record.value == 1)
+
+def test_append_dobj_stops_at_cut_off_line(tmp_path):
+    file_path = str(tmp_path / "records.journal")
+    for value in range(3):
+        assert dobj.append_dobj(create_record(value), file_path) is None
+    with open(file_path, "a", encoding="utf-8") as file:
+        file.write("{\"value\": ")
+
+    records, e = dobj.read_dobj_lines(file_path, Record)
+    assert not e
+    assert [r.value for r in records] == [0, 1, 2]
@@ -0,0 +1,136 @@
+import numpy as np
+
+from image_editor_3d import geometry, snapping
+
+
+SQUARE = [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0), (0.0, 1.0)]
+# A U shape open at the top. (1.5, 1.5) lies in the notch.
+CONCAVE = [(0.0, 0.0), (3.0, 0.0), (3.0, 3.0), (2.0, 3.0), (2.0, 1.0), (1.0, 1.0), (1.0, 3.0), (0.0, 3.0)]
+
+def create_layout(polygons):
+    vert_coords = []
+    loop_vert_indices = []
+    loop_starts = []
+    loop_totals = []
+    edge_vert_indices = []
+    for polygon in polygons:
+        start = len(vert_coords)
+        loop_starts.append(len(loop_vert_indices))
+        loop_totals.append(len(polygon))
+        for i, coord in enumerate(polygon):
+            vert_coords.append(coord)
+            loop_vert_indices.append(start + i)
+            edge_vert_indices.append((start + i, start + (i + 1) % len(polygon)))
+    return snapping.UvLayoutArrays(vert_coords, edge_vert_indices, loop_vert_indices, loop_starts, loop_totals)
+
+def test_find_intersections():
+    point, b_is_found = geometry.find_intersections((0.0, 0.0), (2.0, 2.0), (0.0, 2.0), (2.0, 0.0))
+    assert b_is_found
+    np.testing.assert_allclose(point, (1.0, 1.0))
+
+    _, b_is_found = geometry.find_intersections((0.0, 0.0), (1.0, 0.0), (0.0, 1.0), (1.0, 1.0))
+    assert not b_is_found
+
+    _, b_is_found = geometry.find_intersections((0.0, 0.0), (1.0, 1.0), (2.0, 0.0), (3.0, -1.0))
+    assert not b_is_found
+
+def test_find_first_intersections():
+    segments0 = [((-1.0, 0.5), (5.0, 0.5)), ((-1.0, 5.0), (5.0, 5.0))]
+    segments1 = [((3.0, 0.0), (3.0, 1.0)), ((1.0, 0.0), (1.0, 1.0)), ((2.0, 0.0), (2.0, 1.0))]
+    points, indices = geometry.find_first_intersections(segments0, segments1)
+    np.testing.assert_array_equal(indices, [1, -1])
+    np.testing.assert_allclose(points[0], (1.0, 0.5))
+
+def test_find_closest_points():
+    points = geometry.find_closest_points([(0.0, 0.0)] * 3, [(2.0, 0.0)] * 3, [(1.0, 1.0), (-1.0, 1.0), (3.0, -1.0)])
+    np.testing.assert_allclose(points, [(1.0, 0.0), (0.0, 0.0), (2.0, 0.0)])
+
+    # Degenerate segments return their start point.
+    points = geometry.find_closest_points((1.0, 1.0), (1.0, 1.0), (3.0, 2.0))
+    np.testing.assert_allclose(points, (1.0, 1.0))
+
+def test_find_closest_points_on_segments():
+    segments = [((0.0, 0.0), (1.0, 0.0)), ((0.0, 2.0), (1.0, 2.0))]
+    points, indices = geometry.find_closest_points_on_segments([(0.5, 0.4), (0.5, 1.6), (-1.0, 3.0)], segments)
+    np.testing.assert_array_equal(indices, [0, 1, 1])
+    np.testing.assert_allclose(points, [(0.5, 0.0), (0.5, 2.0), (0.0, 2.0)])
+
+def test_find_closest_vert_indices():
+    indices = geometry.find_closest_vert_indices([(0.1, 0.1), (0.9, 0.8)], SQUARE)
+    np.testing.assert_array_equal(indices, [0, 2])
+
+def test_winding_nums_of_concave_polygon():
+    points = [(0.5, 2.0), (1.5, 2.0), (1.5, 0.5), (2.5, 2.5), (4.0, 1.0)]
+    winding_nums = geometry.find_winding_nums([CONCAVE], points)
+    assert winding_nums.shape == (5, 1)
+    np.testing.assert_array_equal(winding_nums[:, 0] != 0, [True, False, True, True, False])
+
+def test_winding_nums_of_padded_polygons():
+    # The square is padded with its first vert to the length of the concave
+    # polygon.
+    polygons = geometry.create_padded_polygons(SQUARE + CONCAVE, list(range(12)), [0, 4], [4, 8])
+    assert polygons.shape == (2, 8, 2)
+    np.testing.assert_array_equal(polygons[0, 4:], [SQUARE[0]] * 4)
+
+    points = [(0.5, 0.5), (1.5, 2.0), (2.5, 2.5)]
+    b_are_contained = geometry.polygons_contain_points(polygons, points)
+    np.testing.assert_array_equal(b_are_contained, [[True, True], [False, False], [False, True]])
+
+    # Clockwise polygons wind the other way.
+    winding_nums = geometry.find_winding_nums([SQUARE[::-1]], [(0.5, 0.5)])
+    assert abs(winding_nums[0, 0]) == 1
+
+def test_find_closest_contained_vert_indices():
+    polygons = geometry.create_padded_polygons(SQUARE + CONCAVE, list(range(12)), [0, 4], [4, 8])
+    points = [(0.9, 0.8), (2.2, 2.8), (1.5, 2.0), (5.0, 5.0)]
+    polygon_indices, vert_indices = geometry.find_closest_contained_vert_indices(polygons, points)
+    np.testing.assert_array_equal(polygon_indices, [0, 1, -1, -1])
+    np.testing.assert_array_equal(vert_indices, [2, 3, -1, -1])
+
+def test_find_closest_contained_vert_indices_in_chunks(monkeypatch):
+    monkeypatch.setattr(geometry, "MAX_CHUNK_ELEMENT_COUNT", 8)
+    rng = np.random.default_rng(0)
+    polygons = geometry.create_padded_polygons(SQUARE + CONCAVE, list(range(12)), [0, 4], [4, 8])
+    points = rng.uniform(-0.5, 3.5, (100, 2))
+    polygon_indices, vert_indices = geometry.find_closest_contained_vert_indices(polygons, points)
+
+    b_are_contained = geometry.polygons_contain_points(polygons, points)
+    for i, point in enumerate(points):
+        if not b_are_contained[i].any():
+            assert polygon_indices[i] == -1
+            continue
+        distances = np.where(b_are_contained[i][:, np.newaxis], np.linalg.norm(polygons - point, axis=-1), np.inf)
+        assert distances[polygon_indices[i], vert_indices[i]] == distances.min()
+
+def test_find_closest_uv_vert_targets():
+    # Two squares side by side sharing no verts.
+    layout = create_layout([SQUARE, [(x + 2.0, y) for x, y in SQUARE]])
+    target_coords, offset_directions, b_are_found = snapping.find_closest_uv_vert_targets(layout, [(0.9, 0.8), (2.1, 0.1), (1.4, 0.5)])
+    np.testing.assert_array_equal(b_are_found, [True, True, True])
+    np.testing.assert_allclose(target_coords, [(1.0, 1.0), (2.0, 0.0), (1.0, 0.0)])
+
+    # Offsets point into the face along the bisector, and there is none
+    # outside every face.
+    np.testing.assert_allclose(offset_directions[0], np.array([-1.0, -1.0]) / np.sqrt(2.0))
+    np.testing.assert_allclose(offset_directions[1], np.array([1.0, 1.0]) / np.sqrt(2.0))
+    np.testing.assert_allclose(offset_directions[2], (0.0, 0.0))
+
+def test_find_closest_uv_vert_targets_on_concave_face():
+    layout = create_layout([CONCAVE])
+    target_coords, offset_directions, b_are_found = snapping.find_closest_uv_vert_targets(layout, [(1.2, 0.8)])
+    assert b_are_found[0]
+    np.testing.assert_allclose(target_coords[0], (1.0, 1.0))
+    # The reflex vert is offset away from the notch, into the face.
+    assert geometry.polygons_contain_points([CONCAVE], [target_coords[0] + offset_directions[0] * 0.01])[0, 0]
+
+def test_find_uv_edge_targets():
+    layout = create_layout([SQUARE])
+    target_coords, b_are_found = snapping.find_uv_edge_targets(layout, [(0.5, 0.5), (0.5, 2.0)], (1.0, 0.0))
+    np.testing.assert_array_equal(b_are_found, [True, False])
+    np.testing.assert_allclose(target_coords[0], (1.0, 0.5))
+
+def test_find_closest_uv_edge_targets():
+    layout = create_layout([SQUARE])
+    target_coords, b_are_found = snapping.find_closest_uv_edge_targets(layout, [(0.5, 0.1), (2.0, 0.5)])
+    np.testing.assert_array_equal(b_are_found, [True, True])
+    np.testing.assert_allclose(target_coords, [(0.5, 0.0), (1.0, 0.5)])
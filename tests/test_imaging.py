@@ -0,0 +1,73 @@
+import numpy as np
+import OpenImageIO as oiio
+
+from image_editor_3d import imaging
+
+
+def write_exr(file_path, channel_names, pixels):
+    spec = oiio.ImageSpec(pixels.shape[1], pixels.shape[0], len(channel_names), "float")
+    spec.channelnames = tuple(channel_names)
+    output = oiio.ImageOutput.create(file_path)
+    assert output.open(file_path, spec)
+    assert output.write_image(pixels)
+    output.close()
+
+def read_image(file_path):
+    image_buf = oiio.ImageBuf(file_path)
+    return image_buf.spec().channelnames, image_buf.get_pixels(oiio.FLOAT)
+
+def test_split_layered_image_shares_root_alpha(tmp_path):
+    file_path = str(tmp_path / "layered.exr")
+    channel_names = ["A", "albedo.B", "albedo.G", "albedo.R", "rough.R"]
+    pixels = np.zeros((2, 3, len(channel_names)), np.float32)
+    for i in range(len(channel_names)):
+        pixels[..., i] = (i + 1) * 0.1
+    write_exr(file_path, channel_names, pixels)
+
+    parts = list(imaging.split_layered_image(file_path, str(tmp_path)))
+
+    assert len(parts) == 1
+    channel_files = parts[0][1]
+    assert [(g, b) for g, _, b in channel_files] == [("albedo", True), ("rough", True)]
+
+    albedo_channel_names, albedo_pixels = read_image(channel_files[0][1])
+    assert albedo_channel_names == ("R", "G", "B", "A")
+    np.testing.assert_allclose(albedo_pixels[0, 0], [0.4, 0.3, 0.2, 0.1], atol=1e-6)
+
+    rough_channel_names, rough_pixels = read_image(channel_files[1][1])
+    assert rough_channel_names == ("R", "A")
+    np.testing.assert_allclose(rough_pixels[1, 2], [0.5, 0.1], atol=1e-6)
+
+def test_split_layered_image_without_alpha(tmp_path):
+    file_path = str(tmp_path / "layered.exr")
+    write_exr(file_path, ["B", "G", "R"], np.full((2, 2, 3), 0.5, np.float32))
+
+    parts = list(imaging.split_layered_image(file_path, str(tmp_path)))
+
+    assert [(g, b) for g, _, b in parts[0][1]] == [("", False)]
+
+def test_find_uv_tile_layout_keeps_edges_and_faces_of_the_tile():
+    # A quad in tile 1001 and a triangle in tile 1002.
+    vert_coords = [(0.25, 0.25), (0.75, 0.25), (0.75, 0.75), (0.25, 0.75), (1.25, 0.25), (1.75, 0.25), (1.5, 0.75)]
+    edge_vert_indices = [(0, 1), (1, 2), (2, 3), (3, 0), (4, 5), (5, 6), (6, 4)]
+    segments = np.asarray(vert_coords)[np.asarray(edge_vert_indices)]
+
+    edge_coords, outline_edge_coords = imaging.find_uv_tile_layout(vert_coords, segments, [0, 1, 2, 3, 4, 5, 6], [0, 4], [4, 3], [1, 0])
+
+    assert len(edge_coords) == 3
+    assert len(outline_edge_coords) == 3
+    np.testing.assert_allclose(edge_coords.min(axis=(0, 1)), [0.25, 0.25])
+
+def test_write_overlay_image(tmp_path):
+    file_path = str(tmp_path / "overlay.png")
+    edge_coords = np.array([[(0.25, 0.5), (0.75, 0.5)]])
+    outline_edge_coords = np.array([[(0.25, 0.25), (0.75, 0.25)], [(0.75, 0.25), (0.75, 0.75)], [(0.75, 0.75), (0.25, 0.75)], [(0.25, 0.75), (0.25, 0.25)]])
+
+    imaging.write_overlay_image(file_path, 16, edge_coords, outline_edge_coords, 1)
+
+    _, pixels = read_image(file_path)
+    # Border, edge, filled face and empty space, rows from the top.
+    np.testing.assert_allclose(pixels[0, 8], [1.0, 1.0, 1.0, 1.0])
+    np.testing.assert_allclose(pixels[8, 8], [1.0, 1.0, 1.0, 1.0])
+    np.testing.assert_allclose(pixels[10, 8, 3], 64 / 255, atol=1e-6)
+    np.testing.assert_allclose(pixels[2, 8, 3], 0.0)
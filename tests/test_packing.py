@@ -0,0 +1,49 @@
+import random
+
+from image_editor_3d import packing
+
+
+def rects_overlap(a, b):
+    return (a[0] < b[0] + b[2]) and (b[0] < a[0] + a[2]) and (a[1] < b[1] + b[3]) and (b[1] < a[1] + a[3])
+
+def pack_pages(size, rect_sizes):
+    # Packs like atlas.build_atlas, adding a page when no page has room.
+    skylines = []
+    pages = []
+    for width, height in rect_sizes:
+        position = None
+        for skyline, rects in zip(skylines, pages):
+            position = packing.SkylinePacker(size, skyline).pack(width, height)
+            if position is not None:
+                break
+        if position is None:
+            skyline = [[0, 0, size]]
+            rects = []
+            skylines.append(skyline)
+            pages.append(rects)
+            position = packing.SkylinePacker(size, skyline).pack(width, height)
+        rects.append((position[0], position[1], width, height))
+    return pages
+
+def test_new_packer_places_rects_side_by_side():
+    packer = packing.SkylinePacker(64)
+    assert packer.pack(32, 16) == (0, 0)
+    assert packer.pack(32, 16) == (32, 0)
+    assert packer.pack(32, 16) == (0, 16)
+    assert packer.pack(64, 64) is None
+
+def test_packed_rects_do_not_overlap():
+    size = 256
+    rng = random.Random(0)
+    rect_sizes = [(rng.randint(8, 96), rng.randint(8, 96)) for _ in range(200)]
+    rect_sizes.sort(key=lambda s: (-s[1], -s[0]))
+
+    pages = pack_pages(size, rect_sizes)
+
+    assert len(pages) > 1
+    assert sum(len(rects) for rects in pages) == len(rect_sizes)
+    for rects in pages:
+        for i, a in enumerate(rects):
+            assert (a[0] >= 0) and (a[1] >= 0) and (a[0] + a[2] <= size) and (a[1] + a[3] <= size)
+            for b in rects[i + 1:]:
+                assert not rects_overlap(a, b)
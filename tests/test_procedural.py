@@ -0,0 +1,56 @@
+import numpy as np
+
+from image_editor_3d import procedural
+
+
+COLOR_A = [1.0, 0.0, 0.0, 1.0]
+COLOR_B = [0.0, 0.0, 1.0, 0.0]
+
+def create_params(kind, **kwargs):
+    params = {"kind": kind, "color_a": COLOR_A, "color_b": COLOR_B}
+    params.update(kwargs)
+    return params
+
+def create_grid_uvs(size):
+    ys, xs = np.mgrid[0:size, 0:size]
+    return np.stack([(xs.ravel() + 0.5) / size, (ys.ravel() + 0.5) / size], axis=1)
+
+def test_fill_is_color_a():
+    colors = procedural.evaluate(create_params("Fill"), create_grid_uvs(4))
+    np.testing.assert_allclose(colors, np.tile(COLOR_A, (16, 1)))
+
+def test_gradient_mixes_along_angle():
+    uvs = np.array([[0.0, 0.5], [0.5, 0.5], [0.999, 0.5]])
+    colors = procedural.evaluate(create_params("Gradient", angle=0.0), uvs)
+    np.testing.assert_allclose(colors[:, 0], [1.0, 0.5, 0.001], atol=1e-6)
+    np.testing.assert_allclose(colors[:, 3], [1.0, 0.5, 0.001], atol=1e-6)
+
+    colors = procedural.evaluate(create_params("Gradient", angle=90.0), uvs[:, ::-1])
+    np.testing.assert_allclose(colors[:, 0], [1.0, 0.5, 0.001], atol=1e-6)
+
+def test_noise_is_deterministic_and_in_range():
+    uvs = create_grid_uvs(32)
+    colors = procedural.evaluate(create_params("Noise", seed=3), uvs)
+    np.testing.assert_array_equal(colors, procedural.evaluate(create_params("Noise", seed=3), uvs))
+    assert np.all((colors >= 0.0) & (colors <= 1.0))
+    assert np.ptp(colors[:, 0]) > 0.1
+    assert not np.array_equal(colors, procedural.evaluate(create_params("Noise", seed=4), uvs))
+
+def test_edge_wear_is_color_b_at_borders():
+    uvs = np.array([[0.0, 0.5], [0.5, 0.0], [0.5, 0.5]])
+    colors = procedural.evaluate(create_params("EdgeWear", width=0.1), uvs)
+    np.testing.assert_allclose(colors[:2], [COLOR_B, COLOR_B], atol=1e-6)
+    np.testing.assert_allclose(colors[2], COLOR_A, atol=1e-6)
+
+def test_kernels_repeat_outside_layer_uvs():
+    # The same as the preview image drawn with the repeat extension.
+    uvs = create_grid_uvs(8)
+    for kind in procedural.KERNELS:
+        params = create_params(kind, angle=30.0)
+        colors = procedural.evaluate(params, uvs)
+        for offset in [[1.0, 0.0], [-2.0, 3.0]]:
+            np.testing.assert_allclose(procedural.evaluate(params, uvs + offset), colors, atol=1e-5)
+
+def test_params_hash_ignores_defaults():
+    assert procedural.create_params_hash({"kind": "Fill"}) == procedural.create_params_hash(procedural.DEFAULT_PARAMS)
+    assert procedural.create_params_hash({"kind": "Fill"}) != procedural.create_params_hash({"kind": "Noise"})
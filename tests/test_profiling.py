@@ -0,0 +1,72 @@
+import ast
+import glob
+import os
+import warnings
+
+import pytest
+
+from image_editor_3d import profiling
+
+
+PACKAGE_DIR_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "image_editor_3d")
+
+def is_profiled_decorator(node):
+    return isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and (node.func.attr == "profiled")
+
+def find_profiled_funcs():
+    # Every function decorated with profiling.profiled in the add-on,
+    # compiled without its decorators and module so bpy is not needed.
+    funcs = []
+    for file_path in sorted(glob.glob(os.path.join(PACKAGE_DIR_PATH, "*.py"))):
+        with open(file_path, encoding="utf-8") as file, warnings.catch_warnings():
+            # Windows paths in the add-on have backslashes in plain strings.
+            warnings.simplefilter("ignore")
+            tree = ast.parse(file.read())
+        for node in ast.walk(tree):
+            if isinstance(node, ast.FunctionDef) and any(is_profiled_decorator(d) for d in node.decorator_list):
+                node.decorator_list = []
+                namespace = {}
+                exec(compile(ast.Module(body=[node], type_ignores=[]), file_path, "exec"), namespace)
+                funcs.append(namespace[node.name])
+    return funcs
+
+PROFILED_FUNCS = find_profiled_funcs()
+
+def test_profiled_funcs_are_found():
+    assert any(f.__name__ == "display_map_name_changed" for f in PROFILED_FUNCS)
+
+@pytest.mark.parametrize("func", PROFILED_FUNCS, ids=lambda f: f.__name__)
+def test_profiled_keeps_arg_count(func):
+    wrapper = profiling.profiled(func.__name__)(func)
+    assert wrapper.__code__.co_argcount == func.__code__.co_argcount
+
+def test_instrumented_operator_methods_keep_arg_count():
+    class Operator(object):
+        def invoke(self, context, event):
+            return (context, event)
+
+        def execute(self, context):
+            return context
+
+        def modal(self, context, event):
+            return (context, event)
+
+    profiling.instrument_operator_classes([Operator])
+
+    assert Operator.invoke.__code__.co_argcount == 3
+    assert Operator.execute.__code__.co_argcount == 2
+    assert Operator.modal.__code__.co_argcount == 3
+    assert Operator().execute("context") == "context"
+
+def test_profiled_records_stats_when_enabled():
+    def changed(self, context):
+        return context
+
+    wrapper = profiling.profiled("test.changed")(changed)
+    profiling.set_enabled(True)
+    try:
+        assert wrapper(None, "context") == "context"
+    finally:
+        profiling.set_enabled(False)
+
+    assert profiling.stats.pop("test.changed").count == 1
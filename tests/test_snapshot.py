@@ -0,0 +1,114 @@
+import numpy as np
+
+from image_editor_3d import compositor, layertypes, snapshot
+
+
+QUAD_VERT_COORDS = [0.0, 0.0, 0.0, 1.0, 0.0, 0.0, 1.0, 1.0, 0.0, 0.0, 1.0, 0.0]
+IDENTITY_MATRIX = [[1.0, 0.0, 0.0, 0.0], [0.0, 1.0, 0.0, 0.0], [0.0, 0.0, 1.0, 0.0], [0.0, 0.0, 0.0, 1.0]]
+
+def create_layer_snapshot(name, layer_obj_type):
+    layer_snapshot = snapshot.LayerSnapshot()
+    layer_snapshot.name = name
+    layer_snapshot.layer_obj_type = layer_obj_type
+    layer_snapshot.mesh_name = name
+    layer_snapshot.matrix_world = IDENTITY_MATRIX
+    layer_snapshot.vert_coords = QUAD_VERT_COORDS
+    layer_snapshot.loop_vert_indices = [0, 1, 2, 3]
+    layer_snapshot.loop_totals = [4]
+    layer_snapshot.loop_uvs = [0.0, 0.0, 1.0, 0.0, 1.0, 1.0, 0.0, 1.0]
+    layer_snapshot.triangle_loop_indices = [0, 1, 2, 0, 2, 3]
+    layer_snapshot.uv_tile_nums = [1001]
+    return layer_snapshot
+
+def create_snapshot_file(file_path):
+    header = snapshot.SnapshotHeader()
+    header.default_map_file_path = "dummy_opaque.png"
+    group = snapshot.LayerGroupSnapshot()
+    group.name = "Group"
+    group.opacity = 0.5
+    hidden_group = snapshot.LayerGroupSnapshot()
+    hidden_group.name = "Hidden Group"
+    hidden_group.b_hide_render = True
+    header.layer_groups = [group, hidden_group]
+
+    image = create_layer_snapshot("Image", "Image")
+    image.maps = {"Albedo": "albedo.png"}
+    image.map_colorspaces = {"Albedo": "sRGB"}
+    image.blend_mode = "Multiply"
+
+    procedural = create_layer_snapshot("Procedural", "Procedural")
+    procedural.procedural_params = {"kind": "Fill"}
+
+    basic = create_layer_snapshot("Basic", "Basic")
+    basic.basic_values = {"Albedo": [0.25, 0.5, 1.0]}
+    basic.opacity = 0.8
+    basic.layer_group_names = ["Group"]
+
+    hidden = create_layer_snapshot("Hidden", "Basic")
+    hidden.b_hide_render = True
+
+    in_hidden_group = create_layer_snapshot("InHiddenGroup", "Basic")
+    in_hidden_group.layer_group_names = ["Hidden Group"]
+
+    other_tile = create_layer_snapshot("OtherTile", "Basic")
+    other_tile.uv_tile_nums = [1002]
+
+    overlay = create_layer_snapshot("Overlay", "Overlay")
+
+    e = snapshot.write_snapshot(file_path, header, iter([image, procedural, basic, hidden, in_hidden_group, other_tile, overlay]))
+    assert e is None
+
+def test_create_compositor_layers(tmp_path):
+    file_path = str(tmp_path / f"scene{snapshot.SNAPSHOT_FILE_EXT}")
+    create_snapshot_file(file_path)
+    snapshot_, e = snapshot.read_snapshot(file_path, [1001])
+    assert e is None
+    assert [l.name for l in snapshot_.layers] == ["Image", "Procedural", "Basic", "Hidden", "InHiddenGroup", "Overlay"]
+
+    layers = snapshot.create_compositor_layers(snapshot_, "Albedo")
+    assert len(layers) == 3
+    image, procedural, group = layers
+
+    assert isinstance(image, compositor.Layer)
+    assert image.basic_map_source.file_path == "albedo.png"
+    assert image.opacity_map_source.file_path == "dummy_opaque.png"
+    assert image.blend_mode == "Multiply"
+    np.testing.assert_allclose(image.triangle_coords[0], [(0.0, 0.0), (1.0, 0.0), (1.0, 1.0)])
+
+    assert isinstance(procedural.basic_map_source, compositor.ProceduralSource)
+    assert procedural.opacity_map_source is procedural.basic_map_source
+
+    assert isinstance(group, compositor.LayerGroup)
+    assert group.opacity == 0.5
+    assert len(group.layers) == 1
+    basic = group.layers[0]
+    assert isinstance(basic, compositor.BasicLayer)
+    np.testing.assert_allclose(basic.color, [0.25, 0.5, 1.0])
+    assert basic.opacity == 0.8
+
+    # The group is composited with its opacity.
+    c = compositor.Compositor(2 ** 24, 2 ** 24)
+    try:
+        pixels = c.composite_pixels([group], [0, 0], 4)
+    finally:
+        c.close()
+    np.testing.assert_allclose(pixels[..., 3], 0.4, atol=1e-6)
+
+def test_create_compositor_layers_with_default_basic_value(tmp_path):
+    file_path = str(tmp_path / f"scene{snapshot.SNAPSHOT_FILE_EXT}")
+    create_snapshot_file(file_path)
+    snapshot_, e = snapshot.read_snapshot(file_path, [1001])
+    assert e is None
+
+    layers = snapshot.create_compositor_layers(snapshot_, "Roughness")
+    np.testing.assert_allclose(layers[2].layers[0].color, layertypes.DEFAULT_BASIC_VALUE)
+
+def test_read_snapshot_rejects_newer_version(tmp_path):
+    file_path = str(tmp_path / f"scene{snapshot.SNAPSHOT_FILE_EXT}")
+    header = snapshot.SnapshotHeader()
+    header.version = snapshot.SNAPSHOT_VERSION + 1
+    e = snapshot.write_snapshot(file_path, header, iter([]))
+    assert e is None
+
+    snapshot_, e = snapshot.read_snapshot(file_path)
+    assert (snapshot_ is None) and e